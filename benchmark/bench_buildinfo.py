@@ -0,0 +1,80 @@
+"""Benchmark bdep lookups of a large BuildInfo.
+
+Usage:
+bench_buildinfo.py [number of bdeps] [number of rounds]
+
+Creates a synthetic buildinfo with the specified number of bdeps
+(default: 2000) and measures the time it takes to query all flag
+views (preinstall, noinstall etc.), the filenames of all bdeps and
+name lookups (default: 20 rounds). The indexed lookups are compared
+with a linear scan over the bdep elements.
+
+"""
+
+import sys
+import time
+
+from osc2.build import BuildInfo
+
+
+def create_buildinfo(num):
+    bdeps = []
+    flags = BuildInfo.FLAGS
+    for i in xrange(num):
+        flag = ''
+        if i % 3 == 0:
+            flag = ' %s="1"' % flags[i % len(flags)]
+        bdeps.append('<bdep name="pkg%d" version="1.%d" release="%d.1" '
+                     'arch="x86_64" project="openSUSE:Factory" '
+                     'repository="standard"%s />' % (i, i, i, flag))
+    return ('<buildinfo project="foo" repository="standard" package="bar">'
+            '<arch>x86_64</arch><file>bar.spec</file>%s</buildinfo>'
+            % ''.join(bdeps))
+
+
+def scan(binfo, attr):
+    for bdep in binfo.iterfind('bdep'):
+        if bdep.get(attr) == '1':
+            yield bdep
+
+
+def linear_find(binfo, name):
+    for bdep in binfo.iterfind('bdep'):
+        if bdep.get('name') == name:
+            return bdep
+    return None
+
+
+def bench(name, func, rounds):
+    start = time.time()
+    for i in xrange(rounds):
+        func()
+    print "%-24s %8.3fs" % (name, time.time() - start)
+
+
+def main(num=2000, rounds=20):
+    xml_data = create_buildinfo(num)
+    binfo = BuildInfo(xml_data=xml_data)
+    names = ["pkg%d" % i for i in xrange(0, num, max(num / 50, 1))]
+    print "%d bdeps, %d rounds" % (num, rounds)
+    bench('flags (linear scan)',
+          lambda: [list(scan(binfo, flag)) for flag in BuildInfo.FLAGS],
+          rounds)
+    bench('flags (index)',
+          lambda: [list(binfo._bdep_filter(flag))
+                   for flag in BuildInfo.FLAGS],
+          rounds)
+    bench('names (linear scan)',
+          lambda: [linear_find(binfo, name) for name in names], rounds)
+    bench('names (index)',
+          lambda: [binfo.find_bdep(name) for name in names], rounds)
+    # keep the bdep proxies alive (otherwise the cached filenames
+    # would be lost)
+    bdeps = list(binfo.iterfind('bdep'))
+    bench('filenames (cached)',
+          lambda: [bdep.get('filename') for bdep in bdeps], rounds)
+    bench('filenames (uncached)',
+          lambda: [bdep._calculate('filename') for bdep in bdeps], rounds)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
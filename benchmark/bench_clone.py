@@ -0,0 +1,63 @@
+"""Benchmark copy_file vs. clone_file for large files.
+
+Usage:
+bench_clone.py [size in MiB] [dir]
+
+Creates a "tarball" of the specified size (default: 512 MiB) in dir
+(default: a tmpdir in the current directory) and compares the time
+it takes to duplicate it via copy_file and clone_file (with and
+without hardlinks). The number of bytes, which had to be written, is
+reported as well (a reflink or hardlink writes no data at all).
+
+"""
+
+import os
+import sys
+import time
+
+from osc2.util.io import copy_file, clone_file, mkdtemp
+
+
+def create_tarball(filename, size):
+    chunk = os.urandom(1024 * 1024)
+    with open(filename, 'wb') as f:
+        for i in xrange(size):
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def bench(name, func, source, dest):
+    if os.path.exists(dest):
+        os.unlink(dest)
+    start = time.time()
+    strategy = func(source, dest)
+    elapsed = time.time() - start
+    written = os.path.getsize(source)
+    if strategy in ('reflink', 'hardlink'):
+        written = 0
+    print "%-24s %-9s %8.3fs %12d bytes written" % (name, strategy, elapsed,
+                                                    written)
+
+
+def copy(source, dest):
+    copy_file(source, dest, bufsize=1024 * 1024)
+    return 'copy'
+
+
+def main(size=512, directory=os.curdir):
+    with mkdtemp(dir=directory) as tmpdir:
+        source = os.path.join(tmpdir, 'source.tar.bz2')
+        dest = os.path.join(tmpdir, 'dest.tar.bz2')
+        create_tarball(source, size)
+        print "file size: %d MiB" % size
+        bench('copy_file', copy, source, dest)
+        bench('clone_file', clone_file, source, dest)
+        bench('clone_file (hardlink)',
+              lambda s, d: clone_file(s, d, hardlink=True), source, dest)
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args:
+        args[0] = int(args[0])
+    main(*args)
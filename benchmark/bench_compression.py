@@ -0,0 +1,94 @@
+"""Benchmark compressed responses and uploads against a local server.
+
+Usage:
+bench_compression.py [number of entries] [number of requests]
+
+Starts a local HTTP/1.1 server which gzips its responses (if requested)
+and decodes gzip encoded request bodies. A directory listing with the
+specified number of entries (default: 20000) is fetched and uploaded
+the specified number of times (default: 20) with and without
+compression. The transferred bytes (as reported by HTTPStats) and the
+elapsed time are printed.
+
+"""
+
+import sys
+import time
+import zlib
+import threading
+import BaseHTTPServer
+import SocketServer
+
+from osc2.httprequest import Urllib2HTTPRequest, HTTPStats
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def _send(self, data):
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            data = compressor.compress(data) + compressor.flush()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._send(self.server.listing)
+
+    def do_PUT(self):
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        self._send('<status code="ok" />')
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def create_listing(num):
+    entries = ['<entry name="file%d" md5="%032x" size="%d" mtime="%d" />'
+               % (i, i * 7919, i * 13, 1300000000 + i) for i in xrange(num)]
+    return '<directory name="pkg">%s</directory>' % ''.join(entries)
+
+
+def bench(name, apiurl, listing, num, **kwargs):
+    stats = HTTPStats()
+    request = Urllib2HTTPRequest(apiurl, keepalive=True, listener=[stats],
+                                 **kwargs)
+    start = time.time()
+    for i in xrange(num):
+        request.get('/source/prj/pkg').read()
+        request.put('/source/prj/pkg/_meta', data=listing).read()
+    elapsed = time.time() - start
+    # close the idle connections (so that the handler threads exit)
+    request._pool.close()
+    bytes_in = sum([e.bytes_in for e in stats.events])
+    bytes_out = sum([e.bytes_out for e in stats.events])
+    print "%-24s %8.3fs %12d in %12d out" % (name, elapsed, bytes_in,
+                                             bytes_out)
+
+
+def main(entries=20000, num=20):
+    server = Server(('127.0.0.1', 0), Handler)
+    server.listing = create_listing(entries)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    apiurl = 'http://127.0.0.1:%d' % server.server_port
+    print "%d entries (%d bytes), %d requests" % (entries,
+                                                  len(server.listing), num)
+    bench('uncompressed', apiurl, server.listing, num, decode=False)
+    bench('compressed', apiurl, server.listing, num, compress_uploads=True)
+    server.shutdown()
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,86 @@
+"""Benchmark cpio member lookups with and without an index.
+
+Usage:
+bench_cpio_index.py [number of files] [file size in KiB] [dir]
+
+Creates a cpio archive with the specified number of files (default:
+20000) of the specified size (default: 64 KiB) in dir (default: a
+tmpdir in the current directory) and measures the time it takes to
+look up a handful of members via a linear scan, via the in-memory
+header index and via a sidecar index file.
+
+"""
+
+import os
+import sys
+import time
+
+from osc2.util.cpio import NewAsciiWriter, cpio_open
+from osc2.util.io import mkdtemp
+
+
+def create_archive(filename, num, size):
+    data = os.urandom(size * 1024)
+    with open(filename, 'wb') as f:
+        writer = NewAsciiWriter(f)
+        source = os.path.join(os.path.dirname(filename), 'member')
+        with open(source, 'wb') as member:
+            member.write(data)
+        for i in xrange(num):
+            name = "member%06d" % i
+            os.rename(source, os.path.join(os.path.dirname(filename), name))
+            source = os.path.join(os.path.dirname(filename), name)
+            writer.append(source)
+        writer.copyout()
+        os.unlink(source)
+    return ["member%06d" % i for i in (num - 1, num / 2, 0, num / 3, 42)]
+
+
+def linear_find(archive, filename):
+    for archive_file in archive:
+        if archive_file.hdr.name == filename:
+            return archive_file
+    return None
+
+
+def bench(name, func):
+    start = time.time()
+    func()
+    print "%-28s %8.3fs" % (name, time.time() - start)
+
+
+def main(num=20000, size=64, directory=os.curdir):
+    with mkdtemp(dir=directory) as tmpdir:
+        filename = os.path.join(tmpdir, 'archive.cpio')
+        index_file = filename + '.idx'
+        names = create_archive(filename, num, size)
+        print "archive: %d files, %d bytes" % (num,
+                                              os.path.getsize(filename))
+
+        def linear():
+            # a new archive for each lookup (that is what the
+            # callers did so far)
+            for name in names:
+                with cpio_open(filename) as archive:
+                    linear_find(archive, name)
+
+        def index():
+            with cpio_open(filename) as archive:
+                for name in names:
+                    archive.find(name)
+
+        def sidecar():
+            for name in names:
+                with cpio_open(filename, index_file=index_file) as archive:
+                    archive.find(name)
+
+        bench('linear scan', linear)
+        bench('header index', index)
+        bench('sidecar index (first write)', sidecar)
+        bench('sidecar index (read)', sidecar)
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    for i in range(min(len(args), 2)):
+        args[i] = int(args[i])
+    main(*args)
@@ -0,0 +1,78 @@
+"""Benchmark NewAsciiWriter vs. PipelinedNewAsciiWriter.
+
+Usage:
+bench_cpio_writer.py [number of small files] [number of large files]
+                     [large file size in MiB] [dir]
+
+Creates the specified number of small files (default: 10000; 4 KiB
+each) and large files (default: 2; 2048 MiB each) in dir (default: a
+tmpdir in the current directory) and measures the time it takes to
+write a cpio archive which contains all of them with the
+NewAsciiWriter and the PipelinedNewAsciiWriter (with and without
+md5 digests).
+
+"""
+
+import os
+import sys
+import time
+
+from osc2.util.cpio import NewAsciiWriter, PipelinedNewAsciiWriter
+from osc2.util.io import mkdtemp
+
+
+def create_files(directory, num_small, num_large, large_size):
+    filenames = []
+    data = os.urandom(4096)
+    for i in xrange(num_small):
+        filename = os.path.join(directory, "small%06d" % i)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        filenames.append(filename)
+    chunk = os.urandom(1024 * 1024)
+    for i in xrange(num_large):
+        filename = os.path.join(directory, "large%d" % i)
+        with open(filename, 'wb') as f:
+            for j in xrange(large_size):
+                f.write(chunk)
+        filenames.append(filename)
+    return filenames
+
+
+def bench(name, archive, writer_factory, filenames):
+    start = time.time()
+    with open(archive, 'wb') as f:
+        writer = writer_factory(f)
+        for filename in filenames:
+            writer.append(filename)
+        writer.copyout()
+        f.flush()
+        os.fsync(f.fileno())
+    elapsed = time.time() - start
+    size = os.path.getsize(archive)
+    print "%-28s %8.3fs %8.1f MiB/s" % (name, elapsed,
+                                        size / elapsed / 1024 / 1024)
+    os.unlink(archive)
+
+
+def main(num_small=10000, num_large=2, large_size=2048,
+         directory=os.curdir):
+    with mkdtemp(dir=directory) as tmpdir:
+        sources = os.path.join(tmpdir, 'sources')
+        os.mkdir(sources)
+        filenames = create_files(sources, num_small, num_large, large_size)
+        archive = os.path.join(tmpdir, 'archive.cpio')
+        print "%d small files, %d large files (%d MiB)" % (num_small,
+                                                           num_large,
+                                                           large_size)
+        bench('NewAsciiWriter', archive, NewAsciiWriter, filenames)
+        bench('PipelinedNewAsciiWriter', archive, PipelinedNewAsciiWriter,
+              filenames)
+        bench('PipelinedNewAsciiWriter (md5)', archive,
+              lambda f: PipelinedNewAsciiWriter(f, digest='md5'), filenames)
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    for i in range(min(len(args), 3)):
+        args[i] = int(args[i])
+    main(*args)
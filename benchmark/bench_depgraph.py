@@ -0,0 +1,83 @@
+"""Benchmark impact queries on a distro-sized dependency graph.
+
+Usage:
+bench_depgraph.py [number of packages] [number of deps] [number of queries]
+
+Creates a synthetic builddepinfo with the specified number of packages
+(default: 15000) which have (at most) the specified number of build
+dependencies (default: 12) and measures the time it takes to build the
+DependencyGraph, to answer "what rebuilds if X changes" queries
+(default: 50 queries) and to compute the cycles and the build order.
+The graph queries are compared with walking the builddepinfo xml.
+
+"""
+
+import sys
+import time
+import random
+
+from osc2.build import DependencyGraph
+from osc2.util.xml import fromstring
+
+
+def create_builddepinfo(num, deps):
+    rand = random.Random(42)
+    packages = []
+    for i in xrange(num):
+        # mostly depend on "older" packages (plus a few back edges
+        # which result in cycles)
+        pkgdeps = set()
+        for j in xrange(rand.randint(0, deps)):
+            if i and rand.random() < 0.99:
+                pkgdeps.add(rand.randint(0, i - 1))
+            else:
+                pkgdeps.add(rand.randint(0, num - 1))
+        pkgdeps = ''.join(['<pkgdep>pkg%d</pkgdep>' % j for j in pkgdeps])
+        packages.append('<package name="pkg%d"><source>pkg%d</source>%s'
+                        '<subpkg>pkg%d</subpkg></package>' % (i, i, pkgdeps,
+                                                              i))
+    return '<builddepinfo>%s</builddepinfo>' % ''.join(packages)
+
+
+def xml_impact(builddepinfo, name):
+    rdeps = {}
+    for package in builddepinfo.iterfind('package'):
+        for pkgdep in package.iterfind('pkgdep'):
+            rdeps.setdefault(pkgdep.text, []).append(package.get('name'))
+    result = set()
+    todo = list(rdeps.get(name, []))
+    while todo:
+        pkg = todo.pop()
+        if pkg not in result:
+            result.add(pkg)
+            todo.extend(rdeps.get(pkg, []))
+    return result
+
+
+def bench(name, func):
+    start = time.time()
+    ret = func()
+    print "%-28s %8.3fs" % (name, time.time() - start)
+    return ret
+
+
+def main(num=15000, deps=12, queries=50):
+    builddepinfo = fromstring(create_builddepinfo(num, deps))
+    names = ["pkg%d" % i for i in xrange(0, num, max(num / queries, 1))]
+    print "%d packages, %d queries" % (num, len(names))
+    bench('impact (xml walk)',
+          lambda: [xml_impact(builddepinfo, name) for name in names[:5]])
+    graph = bench('build graph',
+                  lambda: DependencyGraph.from_builddepinfo(builddepinfo))
+    bench('impact (graph)',
+          lambda: [graph.impact(name) for name in names[:5]])
+    bench('impact (all queries)',
+          lambda: [graph.impact(name) for name in names])
+    bench('impact (cached)',
+          lambda: [graph.impact(name) for name in names])
+    cycles = bench('cycles', graph.cycles)
+    bench('build order', graph.build_order)
+    print "%d cycles" % len(cycles)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,81 @@
+"""Benchmark many small GET requests against a local http server.
+
+Usage:
+bench_http.py [number of requests] [number of workers]
+
+Starts a local (threaded) HTTP/1.1 server and measures the time it
+takes to issue the specified number of small GET requests (default:
+1000) with a plain Urllib2HTTPRequest (a new connection per request),
+with a keepalive Urllib2HTTPRequest (pooled connections) and with an
+AsyncHTTPRequest which uses the specified number of worker threads
+(default: 8).
+
+"""
+
+import sys
+import time
+import threading
+import BaseHTTPServer
+import SocketServer
+
+from osc2.httprequest import Urllib2HTTPRequest, AsyncHTTPRequest
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # send the status line, headers and data at once (like a real
+    # server would do)
+    wbufsize = -1
+
+    def do_GET(self):
+        data = '<status code="ok" />'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def sync_get(request, num):
+    for i in xrange(num):
+        request.get('/source/prj%d/_meta' % i).read()
+
+
+def async_get(request, num):
+    futures = [request.aget('/source/prj%d/_meta' % i) for i in xrange(num)]
+    for future in futures:
+        future.result().read()
+
+
+def bench(name, func):
+    start = time.time()
+    func()
+    print "%-24s %8.3fs" % (name, time.time() - start)
+
+
+def main(num=1000, workers=8):
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    apiurl = 'http://127.0.0.1:%d' % server.server_port
+    print "%d requests, %d workers" % (num, workers)
+    # note: each Urllib2HTTPRequest installs a new global opener
+    request = Urllib2HTTPRequest(apiurl)
+    bench('sync', lambda: sync_get(request, num))
+    request = Urllib2HTTPRequest(apiurl, keepalive=True)
+    bench('sync (keepalive)', lambda: sync_get(request, num))
+    arequest = AsyncHTTPRequest(request, workers=workers)
+    bench('async (keepalive)', lambda: async_get(arequest, num))
+    arequest.close()
+    server.shutdown()
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,54 @@
+"""Benchmark the construction of large xpath predicates.
+
+Usage:
+bench_xpath.py [number of terms] [number of rounds]
+
+Builds a review filter predicate with the specified number of terms
+(default: 10000) and measures the time it takes to build it via a
+chain of "|" operations (one BinaryExpression per term) and via a
+single XPathBuilder.log_or call (default: 5 rounds). The time for the
+string conversion is reported as well (the binary chain is only
+converted if it does not exceed the recursion limit).
+
+"""
+
+import sys
+import time
+
+from osc2.util.xpath import XPathBuilder
+
+
+def build_chain(xpb, num):
+    xp = xpb.dummy()
+    for i in xrange(num):
+        xp = xp | (xpb.attr('by_user') == "user%d" % i)
+    return xp
+
+
+def build_nary(xpb, num):
+    return xpb.log_or(*[xpb.attr('by_user') == "user%d" % i
+                        for i in xrange(num)])
+
+
+def bench(name, func, rounds):
+    start = time.time()
+    for i in xrange(rounds):
+        ret = func()
+    print "%-24s %8.3fs" % (name, time.time() - start)
+    return ret
+
+
+def main(num=10000, rounds=5):
+    xpb = XPathBuilder()
+    print "%d terms, %d rounds" % (num, rounds)
+    chain = bench('build (binary chain)', lambda: build_chain(xpb, num),
+                  rounds)
+    nary = bench('build (log_or)', lambda: build_nary(xpb, num), rounds)
+    if num * 2 < sys.getrecursionlimit():
+        bench('tostring (binary chain)', chain.tostring, rounds)
+    else:
+        print "%-24s %9s" % ('tostring (binary chain)', 'n/a')
+    bench('tostring (log_or)', nary.tostring, rounds)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -3,13 +3,23 @@
 To access the remote build data use the class BuildResult.
 """
 
+import os
+import sys
+import time
+import Queue
+import errno
+import hashlib
+import itertools
+import threading
+from array import array
 from cStringIO import StringIO
 
 from lxml import etree
 
 from osc2.remote import RORemoteFile, RWRemoteFile
-from osc2.util.io import copy_file
-from osc2.util.xml import fromstring, OscElement
+from osc2.httprequest import request_xml
+from osc2.util.io import copy_file, mkstemp
+from osc2.util.xml import fromstring, get_parser, OscElement
 from osc2.util.cpio import CpioArchive
 from osc2.core import Osc
 
@@ -32,6 +42,11 @@ class BinaryList(OscElement):
     """Represents a binarylist + some additional data"""
     SCHEMA = ''
 
+    @staticmethod
+    def _path(project, repository, arch, package):
+        """Returns the url path of the binarylist."""
+        return "/build/%s/%s/%s/%s" % (project, repository, arch, package)
+
     @staticmethod
     def _perform_request(project, repository, arch, package, **kwargs):
         """Performs http request and returns response object.
@@ -41,7 +56,7 @@ class BinaryList(OscElement):
                   parameters)
 
         """
-        path = "/build/%s/%s/%s/%s" % (project, repository, arch, package)
+        path = BinaryList._path(project, repository, arch, package)
         request = Osc.get_osc().get_reqobj()
         return request.get(path, **kwargs)
 
@@ -56,9 +71,10 @@ class BinaryList(OscElement):
         """
         if 'schema' not in kwargs:
             kwargs['schema'] = BinaryList.SCHEMA
-        f = BinaryList._perform_request(project, repository, arch, package,
-                                        **kwargs)
-        bl = fromstring(f.read(), binarylist=BinaryList, binary=Binary)
+        parser = get_parser(binarylist=BinaryList, binary=Binary)
+        path = BinaryList._path(project, repository, arch, package)
+        request = Osc.get_osc().get_reqobj()
+        bl = request_xml(request, 'GET', path, parser, **kwargs)
         bl.set('project', project)
         bl.set('package', package)
         bl.set('repository', repository)
@@ -121,10 +137,20 @@ class Binary(OscElement):
         return RORemoteFile(path, **kwargs)
 
 
+# counter for the last use of a cached dependency graph
+_GRAPH_USES = itertools.count()
+
+
 class BuildResult(object):
     """Provides methods to access the remote build result"""
     RESULT_SCHEMA = ''
     BUILDDEPINFO_SCHEMA = ''
+    # (apiurl, project, repository, arch, query) =>
+    # [state, DependencyGraph, last use]
+    DEPENDENCY_GRAPHS = {}
+    # the maximum number of cached dependency graphs (the least
+    # recently used graph is evicted)
+    MAX_DEPENDENCY_GRAPHS = 8
 
     def __init__(self, project, package='', repository='', arch=''):
         """Constructs a new object.
@@ -168,9 +194,9 @@ class BuildResult(object):
         path = "/build/%s/_result" % self.project
         if 'schema' not in kwargs:
             kwargs['schema'] = BuildResult.RESULT_SCHEMA
-        f = request.get(path, package=package, repository=repository,
-                        arch=arch, **kwargs)
-        results = fromstring(f.read(), status=Status)
+        parser = get_parser(status=Status)
+        results = request_xml(request, 'GET', path, parser, package=package,
+                              repository=repository, arch=arch, **kwargs)
         return results
 
     def _prepare_kwargs(self, kwargs, *required):
@@ -206,6 +232,21 @@ class BuildResult(object):
                                             self.arch, self.package)
         return RWRemoteFile(path, **kwargs)
 
+    def log_reader(self, **kwargs):
+        """Get a streaming, read-only buildlog reader.
+
+        If repository, arch or package weren't specified during the __init__
+        call a ValueError is raised.
+
+        Keyword arguments:
+        **kwargs -- see class BuildLog
+
+        """
+        if not (self.repository and self.arch and self.package):
+            raise ValueError("repository, arch, package are mandatory for log")
+        return BuildLog(self.project, self.repository, self.arch,
+                        self.package, **kwargs)
+
     def builddepinfo(self, reverse=False, **kwargs):
         """Get the builddepinfo.
 
@@ -225,16 +266,735 @@ class BuildResult(object):
             view = 'revpkgnames'
         if 'schema' not in kwargs:
             kwargs['schema'] = BuildResult.BUILDDEPINFO_SCHEMA
-        f = request.get(path, view=view, **kwargs)
         # no custom parser needed atm
-        return fromstring(f.read())
+        return request_xml(request, 'GET', path, get_parser(), view=view,
+                           **kwargs)
+
+    def dependency_graph(self, state=None, **kwargs):
+        """Get the DependencyGraph of the repository.
+
+        If state is specified, the graph is cached until the
+        dependency_graph method is called with a different state
+        for the same apiurl, project, repository, arch and http
+        request parameters (for instance, the state of the
+        resultlist can be used). At most MAX_DEPENDENCY_GRAPHS
+        graphs are cached (the least recently used one is evicted).
+
+        Keyword arguments:
+        state -- the state of the repository (default: None)
+        **kwargs -- optional parameters for the http request
+
+        """
+        query = kwargs.copy()
+        apiurl = query.pop('apiurl', '') or Osc.get_osc().get_reqobj().apiurl
+        query = tuple(sorted([(k, str(v)) for k, v in query.iteritems()]))
+        key = (apiurl, self.project, self.repository, self.arch, query)
+        graphs = BuildResult.DEPENDENCY_GRAPHS
+        if state is not None:
+            cached = graphs.get(key)
+            if cached is not None and cached[0] == state:
+                cached[2] = next(_GRAPH_USES)
+                return cached[1]
+        br = BuildResult(self.project, repository=self.repository,
+                         arch=self.arch)
+        graph = DependencyGraph.from_builddepinfo(br.builddepinfo(**kwargs))
+        if state is not None:
+            graphs[key] = [state, graph, next(_GRAPH_USES)]
+            while len(graphs) > BuildResult.MAX_DEPENDENCY_GRAPHS:
+                lru = min(graphs.iterkeys(), key=lambda k: graphs[k][2])
+                del graphs[lru]
+        return graph
+
+
+class DependencyGraph(object):
+    """Compact in-memory dependency graph of a repository.
+
+    Each package name is interned (that is a package is represented
+    by an int) and the edges are stored in adjacency arrays. The
+    query results are cached until the graph is modified.
+
+    """
+
+    def __init__(self):
+        """Constructs a new (empty) DependencyGraph object."""
+        super(DependencyGraph, self).__init__()
+        self._names = []
+        self._ids = {}
+        # package => build dependencies
+        self._deps = []
+        # package => packages which depend on it
+        self._rdeps = []
+        self._cache = {}
+
+    @classmethod
+    def from_builddepinfo(cls, builddepinfo):
+        """Returns a new DependencyGraph object.
+
+        builddepinfo is a builddepinfo element (see
+        BuildResult.builddepinfo; the view has to be pkgnames).
+
+        """
+        graph = cls()
+        for package in builddepinfo.iterfind('package'):
+            deps = [pkgdep.text for pkgdep in package.iterfind('pkgdep')]
+            graph.add(package.get('name'), deps)
+        return graph
+
+    def _intern(self, name):
+        """Returns the id of package name."""
+        i = self._ids.get(name)
+        if i is None:
+            i = len(self._names)
+            self._names.append(name)
+            self._ids[name] = i
+            self._deps.append(array('i'))
+            self._rdeps.append(array('i'))
+        return i
+
+    def _id(self, name):
+        """Returns the id of package name.
+
+        A ValueError is raised if the graph does not contain name.
+
+        """
+        i = self._ids.get(name)
+        if i is None:
+            raise ValueError("unknown package: %s" % name)
+        return i
+
+    def add(self, name, deps):
+        """Adds package name which depends on the packages deps."""
+        self._cache.clear()
+        i = self._intern(name)
+        adjacency = self._deps[i]
+        # a set avoids linear scans of the adjacency array
+        known = set(adjacency)
+        for dep in deps:
+            j = self._intern(dep)
+            if j in known:
+                continue
+            known.add(j)
+            adjacency.append(j)
+            self._rdeps[j].append(i)
+
+    def __contains__(self, name):
+        return name in self._ids
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def _closure(self, ids, adjacency):
+        """Returns the ids which are reachable from ids.
+
+        The ids themselves are only part of the result if they
+        are reachable via an edge.
+
+        """
+        visited = bytearray(len(self._names))
+        todo = []
+        for i in ids:
+            todo.extend(adjacency[i])
+        reachable = []
+        while todo:
+            i = todo.pop()
+            if visited[i]:
+                continue
+            visited[i] = 1
+            reachable.append(i)
+            todo.extend(adjacency[i])
+        return reachable
+
+    def _query(self, kind, names, adjacency, transitive):
+        ids = tuple(sorted(set([self._id(name) for name in names])))
+        key = (kind, ids, transitive)
+        if key not in self._cache:
+            if transitive:
+                result = self._closure(ids, adjacency)
+            else:
+                result = set()
+                for i in ids:
+                    result.update(adjacency[i])
+            self._cache[key] = sorted([self._names[i] for i in result])
+        return list(self._cache[key])
+
+    def dependencies(self, *names, **kwargs):
+        """Returns a sorted list of the build dependencies of names.
+
+        A ValueError is raised if the graph does not contain a name.
+
+        Keyword arguments:
+        transitive -- if True, the transitive build dependencies are
+                      returned (default: True)
+
+        """
+        transitive = kwargs.get('transitive', True)
+        return self._query('deps', names, self._deps, transitive)
+
+    def impact(self, *names, **kwargs):
+        """Returns a sorted list of the packages which rebuild if
+        one of the packages names changes.
+
+        A ValueError is raised if the graph does not contain a name.
+
+        Keyword arguments:
+        transitive -- if False, only the packages which directly
+                      depend on names are returned (default: True)
+
+        """
+        transitive = kwargs.get('transitive', True)
+        return self._query('rdeps', names, self._rdeps, transitive)
+
+    def _components(self):
+        """Returns the strongly connected components (list of id lists).
+
+        The components are computed with Tarjan's algorithm (iterative
+        version). A component is returned after all components, which
+        it depends on, are returned (that is, this is a build order).
+
+        """
+        if 'components' in self._cache:
+            return self._cache['components']
+        num = len(self._names)
+        index = [-1] * num
+        low = [0] * num
+        onstack = bytearray(num)
+        stack = []
+        components = []
+        counter = 0
+        for root in xrange(num):
+            if index[root] != -1:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            onstack[root] = 1
+            work = [(root, 0)]
+            while work:
+                v, pos = work[-1]
+                deps = self._deps[v]
+                if pos < len(deps):
+                    work[-1] = (v, pos + 1)
+                    w = deps[pos]
+                    if index[w] == -1:
+                        index[w] = low[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        onstack[w] = 1
+                        work.append((w, 0))
+                    elif onstack[w]:
+                        low[v] = min(low[v], index[w])
+                    continue
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        onstack[w] = 0
+                        component.append(w)
+                        if w == v:
+                            break
+                    components.append(component)
+        self._cache['components'] = components
+        return components
+
+    def cycles(self):
+        """Returns a list of the dependency cycles.
+
+        Each cycle is a sorted list of package names.
+
+        """
+        cycles = []
+        for component in self._components():
+            if len(component) > 1 or component[0] in self._deps[component[0]]:
+                cycles.append(sorted([self._names[i] for i in component]))
+        return cycles
+
+    def build_order(self):
+        """Returns the packages in build order.
+
+        Each item is a sorted list of package names (packages, which
+        are part of a cycle, are grouped together).
+
+        """
+        return [sorted([self._names[i] for i in component])
+                for component in self._components()]
+
+
+class BuildLog(object):
+    """Reads a buildlog incrementally.
+
+    Only the data after the current offset is requested (start
+    parameter), that is following a running build does not
+    download the complete log again. The data is streamed in
+    chunks of at most bufsize bytes (nothing is kept in memory).
+
+    """
+
+    # build codes which indicate that the log may still grow
+    RUNNING_CODES = ('scheduled', 'dispatching', 'building', 'signing',
+                     'finished')
+
+    def __init__(self, project, repository, arch, package, offset=0,
+                 bufsize=8192, **kwargs):
+        """Constructs a new BuildLog object.
+
+        Keyword arguments:
+        offset -- the offset from which the log is read (default: 0)
+        bufsize -- the maximum size of a chunk (default: 8192)
+        kwargs -- optional parameters for the http requests
+
+        """
+        super(BuildLog, self).__init__()
+        self.project = project
+        self.repository = repository
+        self.arch = arch
+        self.package = package
+        self.offset = offset
+        self.bufsize = bufsize
+        self._kwargs = kwargs
+
+    def chunks(self):
+        """Yields the data after the current offset.
+
+        The offset is advanced by the size of each chunk.
+
+        """
+        path = "/build/%s/%s/%s/%s/_log" % (self.project, self.repository,
+                                            self.arch, self.package)
+        f = RORemoteFile(path, stream_bufsize=self.bufsize, nostream='1',
+                         start=str(self.offset), **self._kwargs)
+        try:
+            for chunk in f:
+                self.offset += len(chunk)
+                yield chunk
+        finally:
+            f.close()
+
+    def finished(self):
+        """Returns True if the log will not grow anymore.
+
+        The build status of the package is used to decide this.
+
+        """
+        br = BuildResult(self.project, package=self.package,
+                         repository=self.repository, arch=self.arch)
+        res = br.result()
+        for result in res.iterfind('result'):
+            for status in result.iterfind('status'):
+                if status.get('code') in BuildLog.RUNNING_CODES:
+                    return False
+        return True
+
+    def follow(self, interval=1, max_interval=30, backoff=2, finished=None):
+        """Yields new chunks until the build is finished.
+
+        If no new data is available, the next request is delayed
+        (the delay grows by the factor backoff up to max_interval
+        seconds and is reset to interval as soon as new data arrives).
+
+        Keyword arguments:
+        interval -- the initial delay in seconds (default: 1)
+        max_interval -- the maximum delay in seconds (default: 30)
+        backoff -- the factor by which the delay grows (default: 2)
+        finished -- a callable which returns True if the log will
+                    not grow anymore (default: None, that is the
+                    finished method is used)
+
+        """
+        if finished is None:
+            finished = self.finished
+        delay = interval
+        while True:
+            data = False
+            for chunk in self.chunks():
+                data = True
+                yield chunk
+            if data:
+                delay = interval
+                continue
+            if finished():
+                # read the data which was written in the meantime
+                for chunk in self.chunks():
+                    yield chunk
+                break
+            time.sleep(delay)
+            delay = min(delay * backoff, max_interval)
+
+
+class BuildResultMonitor(object):
+    """Monitors the build results of multiple projects.
+
+    All watches of a project are coalesced into a single _result
+    request (duplicate watches are ignored) and the requests for
+    different projects are made concurrently. Only the Status
+    elements, whose code or details changed since the last poll,
+    are reported.
+
+    """
+
+    def __init__(self, workers=4, long_poll=False, **kwargs):
+        """Constructs a new BuildResultMonitor object.
+
+        Keyword arguments:
+        workers -- the maximum number of concurrent requests
+                   (default: 4)
+        long_poll -- if True, the state of the last resultlist is
+                     passed as the oldstate parameter (the server
+                     answers as soon as the state changes)
+                     (default: False)
+        kwargs -- optional parameters for the http requests
+
+        """
+        super(BuildResultMonitor, self).__init__()
+        self._workers = workers
+        self._long_poll = long_poll
+        self._kwargs = kwargs
+        # project => set of (package, repository, arch) tuples
+        self._watches = {}
+        # project => state of the last resultlist
+        self._oldstates = {}
+        # (project, repository, arch, package) => (code, details)
+        self._states = {}
+
+    def watch(self, project, package='', repository='', arch=''):
+        """Watches the build results of project.
+
+        Keyword arguments:
+        package -- limit results to this package (default: '')
+        repository -- limit results to this repository (default: '')
+        arch -- limit results to this arch (default: '')
+
+        """
+        watch = (package, repository, arch)
+        self._watches.setdefault(project, set()).add(watch)
+
+    def _query(self, project, oldstate=True):
+        """Returns the query for project (a dict).
+
+        The query contains the coalesced package, repository and arch
+        parameters of all watches of the project.
+
+        Keyword arguments:
+        oldstate -- if False, the oldstate parameter is never added
+                    (default: True)
+
+        """
+        watches = self._watches[project]
+        query = {}
+        for i, attr in enumerate(('package', 'repository', 'arch')):
+            values = set([watch[i] for watch in watches])
+            if '' not in values:
+                # otherwise no restriction is possible
+                query[attr] = sorted(values)
+        if self._long_poll and oldstate and project in self._oldstates:
+            query['oldstate'] = self._oldstates[project]
+        query.update(self._kwargs)
+        return query
+
+    def _queries(self):
+        """Returns a list of (project, query) tuples (see _query)."""
+        return [(project, self._query(project))
+                for project in sorted(self._watches.keys())]
+
+    def _matches(self, project, repository, arch, package):
+        """Returns True if a watch of project matches."""
+        for watch in self._watches[project]:
+            if watch[0] and watch[0] != package:
+                continue
+            if watch[1] and watch[1] != repository:
+                continue
+            if watch[2] and watch[2] != arch:
+                continue
+            return True
+        return False
+
+    def _fetch(self, project, query):
+        """Returns the resultlist for project."""
+        return BuildResult(project).result(**query)
+
+    def _fetch_all(self, queries):
+        """Returns a list of (project, resultlist) tuples.
+
+        The requests are made by at most workers threads.
+
+        """
+        if self._workers <= 1 or len(queries) <= 1:
+            return [(project, self._fetch(project, query))
+                    for project, query in queries]
+        queue = Queue.Queue()
+        for i, (project, query) in enumerate(queries):
+            queue.put((i, project, query))
+        results = [None] * len(queries)
+        errors = []
+
+        def worker():
+            while not errors:
+                try:
+                    i, project, query = queue.get_nowait()
+                except Queue.Empty:
+                    break
+                try:
+                    results[i] = (project, self._fetch(project, query))
+                except Exception:
+                    errors.append(sys.exc_info())
+
+        threads = [threading.Thread(target=worker)
+                   for i in xrange(min(self._workers, len(queries)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            exc_type, exc_value, tb = errors[0]
+            raise exc_type, exc_value, tb
+        return results
+
+    def poll(self):
+        """Polls the build results once.
+
+        A list of the changed Status elements is returned (on the
+        first poll, all Status elements are considered as changed).
+        The result element of a Status element is its parent.
+
+        """
+        changed = []
+        for project, resultlist in self._fetch_all(self._queries()):
+            changed.extend(self._changes(project, resultlist))
+        return changed
+
+    def _changes(self, project, resultlist):
+        """Returns a list of the changed Status elements of resultlist."""
+        changed = []
+        state = resultlist.get('state')
+        if state is not None:
+            self._oldstates[project] = state
+        for result in resultlist.iterfind('result'):
+            repository = result.get('repository')
+            arch = result.get('arch')
+            for status in result.iterfind('status'):
+                package = status.get('package')
+                if not self._matches(project, repository, arch, package):
+                    continue
+                key = (project, repository, arch, package)
+                value = (status.get('code'), str(status.details))
+                if self._states.get(key) != value:
+                    self._states[key] = value
+                    changed.append(status)
+        return changed
+
+    def events(self, interval=30, min_interval=1):
+        """Yields the changed Status elements (see poll).
+
+        The build results are polled until the generator is closed.
+        If long_poll is False, there is a delay of interval seconds
+        between two polls. Otherwise, each project is polled
+        independently (by at most workers threads) and its changes
+        are yielded as soon as its response arrives, so that a
+        project without changes does not delay the events of the
+        other projects. Two requests for the same project are at
+        least min_interval seconds apart (in case the server ignores
+        the oldstate parameter and answers immediately).
+        A long poll request occupies a worker until the project
+        changes. Hence, if there are more projects than workers, the
+        quiet projects would starve the others. In this case, the
+        oldstate parameter is not used (each request is answered
+        immediately) and the projects are polled in a fair rotation:
+        two requests for the same project are interval seconds apart.
+
+        """
+        if not self._long_poll:
+            while True:
+                for status in self.poll():
+                    yield status
+                time.sleep(interval)
+        requests = Queue.Queue()
+        responses = Queue.Queue()
+        stop = threading.Event()
+
+        def worker():
+            while not stop.is_set():
+                try:
+                    project, not_before = requests.get(True, 0.1)
+                except Queue.Empty:
+                    continue
+                delay = not_before - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                start = time.time()
+                try:
+                    query = self._query(project, oldstate=not rotate)
+                    resultlist = self._fetch(project, query)
+                    responses.put((project, start, resultlist, None))
+                except Exception:
+                    responses.put((project, start, None, sys.exc_info()))
+
+        projects = sorted(self._watches.keys())
+        workers = max(self._workers, 1)
+        # no long polls if they would starve some projects
+        rotate = len(projects) > workers
+        if rotate:
+            min_interval = max(min_interval, interval)
+        for project in projects:
+            requests.put((project, 0))
+        threads = [threading.Thread(target=worker)
+                   for i in xrange(min(workers, len(projects)))]
+        for thread in threads:
+            # do not block the interpreter's exit if a long poll
+            # request is still pending
+            thread.daemon = True
+            thread.start()
+        try:
+            while True:
+                # use a timeout, otherwise a KeyboardInterrupt is not
+                # delivered while waiting
+                try:
+                    response = responses.get(True, 1)
+                except Queue.Empty:
+                    continue
+                project, start, resultlist, exc_info = response
+                if exc_info is not None:
+                    exc_type, exc_value, tb = exc_info
+                    raise exc_type, exc_value, tb
+                # updates the project's oldstate
+                changed = self._changes(project, resultlist)
+                # the next request is scheduled before the changes are
+                # yielded (the consumer might take a while)
+                requests.put((project, start + min_interval))
+                for status in changed:
+                    yield status
+        finally:
+            stop.set()
+
+
+class BuildInfoCache(object):
+    """Stores buildinfo xml data in a cache dir.
+
+    An entry is identified by the apiurl, project, package,
+    repository, arch, the http request parameters, a digest of the
+    POSTed data (if any) and the source state (for instance the
+    srcmd5 of the package and a repository state). An entry is
+    stale if it is older than max_age seconds.
+
+    """
+
+    def __init__(self, root, max_age=3600):
+        """Constructs a new BuildInfoCache object.
+
+        root is a path to the cache dir. A ValueError is
+        raised if root exists and is no dir or if root is not
+        writable.
+
+        Keyword arguments:
+        max_age -- the number of seconds after which an entry is
+                   stale; if None, entries never become stale
+                   (default: 3600)
+
+        """
+        super(BuildInfoCache, self).__init__()
+        exists = os.path.exists(root)
+        if exists and not os.path.isdir(root):
+            raise ValueError("root \"%s\" exists but is no dir" % root)
+        elif exists and not os.access(root, os.W_OK):
+            raise ValueError("root \"%s\" exists but is not writable" % root)
+        self._root = root
+        self.max_age = max_age
+
+    @staticmethod
+    def key(project, package, repository, arch, data=None, state='',
+            apiurl='', **kwargs):
+        """Returns the cache key (a str).
+
+        data is the POSTed data (a str), state is an arbitrary
+        str, which describes the source state, and apiurl is the
+        apiurl of the server. kwargs are the http request parameters.
+
+        """
+        sha = hashlib.sha1()
+        for part in (apiurl, project, package, repository, arch, state):
+            sha.update(part + '\0')
+        for k, v in sorted(kwargs.iteritems()):
+            sha.update("%s=%s\0" % (k, v))
+        if data is not None:
+            sha.update('data\0' + hashlib.sha1(data).hexdigest())
+        return sha.hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self._root, key[:2], key)
+
+    def get(self, key):
+        """Returns the cached xml data for key.
+
+        None is returned if there is no entry for key or if the
+        entry is stale (a stale entry is removed).
+
+        """
+        filename = self._filename(key)
+        try:
+            st = os.stat(filename)
+            if (self.max_age is not None
+                    and time.time() - st.st_mtime > self.max_age):
+                self.remove(key)
+                return None
+            with open(filename, 'r') as f:
+                return f.read()
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+        return None
+
+    def put(self, key, xml_data):
+        """Stores xml_data for key.
+
+        An existing entry is (atomically) replaced.
+
+        """
+        filename = self._filename(key)
+        dirname = os.path.dirname(filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmpfile = mkstemp(dir=dirname, delete=False)
+        try:
+            tmpfile.write(xml_data)
+        finally:
+            tmpfile.close()
+        os.rename(tmpfile, filename)
+
+    def remove(self, key):
+        """Removes the entry for key (if it exists)."""
+        try:
+            os.unlink(self._filename(key))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
 
 
 class BuildInfo(object):
-    """Provides methods to work with a buildinfo element."""
+    """Provides methods to work with a buildinfo element.
+
+    The bdep lookups (preinstall, find_bdep etc.) use indexes, which
+    are built on first use. The indexes also cache the filename and
+    binarytype of each bdep. They are stored on the buildinfo root
+    element and are cleared if a bdep is modified (via set or attrib)
+    or if the binarytype changes. Adding or removing bdep elements is
+    not supported.
+
+    """
+    # the BuildInfoCache which is used if no cache is passed to __init__
+    # (caching is opt-in: by default, no cache is used)
+    CACHE = None
+    # bdep attributes, which are indexed
+    FLAGS = ('preinstall', 'noinstall', 'cbinstall', 'cbpreinstall',
+             'vminstall', 'runscripts')
 
     def __init__(self, project='', package='', repository='', arch='',
-                 xml_data='', binarytype='', data=None, **kwargs):
+                 xml_data='', binarytype='', data=None, cache=None,
+                 state='', **kwargs):
         """Constructs a new BuildInfo object.
 
         A ValueError is raised if xml_data is specified and project or
@@ -252,9 +1012,19 @@ class BuildInfo(object):
                       (default: '')
         data -- a specfile or cpio archive which is POSTed to the server
                 (default: None)
+        cache -- a BuildInfoCache; if it contains an entry for the
+                 request, no http request is made (default: None, that
+                 is BuildInfo.CACHE is used)
+        state -- the source state (for instance the package's srcmd5
+                 and the repository state), which is part of the cache
+                 key; if no state is specified, the cache is not used
+                 because a cached buildinfo cannot be invalidated if
+                 the sources or the repository change (default: '')
         **kwargs -- optional parameters for the http request
 
         """
+        key = None
+        fetched = False
         if ((project or package or repository or arch) and xml_data
                 or not (project and repository and arch) and not xml_data):
             msg = 'Either project, package, repository, arch or xml_data'
@@ -263,14 +1033,29 @@ class BuildInfo(object):
             package = package or '_repository'
             path = "/build/%s/%s/%s/%s/_buildinfo" % (project, repository,
                                                       arch, package)
+            if cache is None:
+                cache = BuildInfo.CACHE
             request = Osc.get_osc().get_reqobj()
-            if data is None:
-                f = request.get(path, **kwargs)
-            else:
-                f = request.post(path, data=data, **kwargs)
-            xml_data = f.read()
+            if (cache is not None and state
+                    and (data is None or isinstance(data, str))):
+                query = kwargs.copy()
+                apiurl = query.pop('apiurl', '') or request.apiurl
+                key = cache.key(project, package, repository, arch,
+                                data=data, state=state, apiurl=apiurl,
+                                **query)
+                xml_data = cache.get(key)
+            if not xml_data:
+                if data is None:
+                    f = request.get(path, **kwargs)
+                else:
+                    f = request.post(path, data=data, **kwargs)
+                xml_data = f.read()
+                fetched = True
         self._xml = fromstring(xml_data, bdep=BuildDependency)
         self._calculate_binarytype(binarytype)
+        if fetched and key is not None:
+            # only valid buildinfos are cached
+            cache.put(key, xml_data)
 
     def _calculate_binarytype(self, binarytype):
         """Calculates the binarytype of the bdep elements.
@@ -280,6 +1065,7 @@ class BuildInfo(object):
         or the passed binarytype is None/the empty str).
 
         """
+        _clear_bdep_index(self._xml)
         binarytype = binarytype or self._xml.get('binarytype')
         if binarytype:
             self._xml.set('binarytype', binarytype)
@@ -301,16 +1087,67 @@ class BuildInfo(object):
             raise ValueError("unsupported file ext: \"%s\"" % ext)
         self._xml.set('binarytype', binarytype)
 
+    def _build_index(self):
+        """Returns the bdep indexes.
+
+        A dict is returned, which contains a list of bdeps for each
+        flag in FLAGS and the 'name' (name => bdep), 'prpap'
+        (prpap => list of bdeps) and 'derived' (id(bdep) => dict of
+        the cached filename and binarytype) dicts. All indexes are
+        built with a single pass over the bdep elements.
+        The indexes are stored in the __dict__ of the root element
+        (see function _clear_bdep_index). This is reliable, because
+        self._xml keeps the root's python proxy alive (and the
+        indexes keep the proxies of the bdeps alive, that is their
+        ids are stable).
+
+        """
+        index = self._xml.__dict__.get(_BDEP_INDEX)
+        if index is not None:
+            return index
+        index = dict([(flag, []) for flag in BuildInfo.FLAGS])
+        names = {}
+        prpaps = {}
+        derived = {}
+        arch = self._xml.findtext('arch')
+        for bdep in self._xml.iterfind('bdep'):
+            for flag in BuildInfo.FLAGS:
+                if bdep.get(flag) == '1':
+                    index[flag].append(bdep)
+            names.setdefault(bdep.get('name'), bdep)
+            prpaps.setdefault(bdep.prpap(arch), []).append(bdep)
+            derived[id(bdep)] = {}
+        index['name'] = names
+        index['prpap'] = prpaps
+        index['derived'] = derived
+        self._xml.__dict__[_BDEP_INDEX] = index
+        return index
+
     def _bdep_filter(self, attr):
         """Filters bdeps by attribute attr.
 
-        A bdep object is yielded if attribute attr is set
-        to "1".
+        An iterator over all bdeps, whose attribute attr is set
+        to "1", is returned.
 
         """
-        for bdep in self._xml.iterfind('bdep'):
-            if bdep.get(attr) == '1':
-                yield bdep
+        return iter(self._build_index()[attr])
+
+    def find_bdep(self, name):
+        """Returns the bdep with name name.
+
+        None is returned if no such bdep exists.
+
+        """
+        return self._build_index()['name'].get(name)
+
+    def prpap_bdeps(self, prpap):
+        """Returns a list of bdeps, which belong to prpap.
+
+        prpap is a "project/repository/arch/package" str (see
+        BuildDependency.prpap).
+
+        """
+        return self._build_index()['prpap'].get(prpap, [])
 
     def preinstall(self):
         """Returns generator to preinstall bdeps"""
@@ -336,6 +1173,10 @@ class BuildInfo(object):
         """Returns generator to runscripts bdeps"""
         return self._bdep_filter('runscripts')
 
+    def set(self, *args, **kwargs):
+        _clear_bdep_index(self._xml)
+        self._xml.set(*args, **kwargs)
+
     def write_to(self, dest):
         """Write buildinfo xml to dest.
 
@@ -351,13 +1192,112 @@ class BuildInfo(object):
         return getattr(self._xml, name)
 
 
+# key of the bdep indexes in the __dict__ of a buildinfo root element
+_BDEP_INDEX = '_bdep_index'
+
+
+def _clear_bdep_index(root):
+    """Clears the bdep indexes of the buildinfo root element root.
+
+    Nothing is done if root is None or if it has no indexes.
+
+    """
+    if root is not None:
+        root.__dict__.pop(_BDEP_INDEX, None)
+
+
+class _TrackedAttrib(object):
+    """Wraps the attrib of a BuildDependency.
+
+    Each modification clears the bdep indexes of the buildinfo.
+
+    """
+
+    def __init__(self, bdep, attrib):
+        super(_TrackedAttrib, self).__init__()
+        self._bdep = bdep
+        self._attrib = attrib
+
+    def __setitem__(self, key, value):
+        _clear_bdep_index(self._bdep.getparent())
+        self._attrib[key] = value
+
+    def __delitem__(self, key):
+        _clear_bdep_index(self._bdep.getparent())
+        del self._attrib[key]
+
+    def update(self, *args, **kwargs):
+        _clear_bdep_index(self._bdep.getparent())
+        self._attrib.update(*args, **kwargs)
+
+    def pop(self, *args):
+        _clear_bdep_index(self._bdep.getparent())
+        return self._attrib.pop(*args)
+
+    def clear(self):
+        _clear_bdep_index(self._bdep.getparent())
+        self._attrib.clear()
+
+    def __getitem__(self, key):
+        return self._attrib[key]
+
+    def __contains__(self, key):
+        return key in self._attrib
+
+    def __iter__(self):
+        return iter(self._attrib)
+
+    def __len__(self):
+        return len(self._attrib)
+
+    def __eq__(self, other):
+        return self._attrib == other
+
+    def __ne__(self, other):
+        return self._attrib != other
+
+    def __repr__(self):
+        return repr(self._attrib)
+
+    def __getattr__(self, name):
+        # read-only methods (get, keys, items etc.)
+        return getattr(self._attrib, name)
+
+
 class BuildDependency(OscElement):
-    """Represents a build dependency (bdep element)."""
+    """Represents a build dependency (bdep element).
+
+    The calculated filename and binarytype are cached if the bdep
+    belongs to a BuildInfo (see BuildInfo._build_index).
+
+    """
 
     def get(self, name, *args, **kwargs):
         if name not in ('filename', 'binarytype'):
             return super(BuildDependency, self).get(name, *args, **kwargs)
-        elif name == 'binarytype':
+        cache = None
+        parent = self.getparent()
+        if parent is not None:
+            index = parent.__dict__.get(_BDEP_INDEX)
+            if index is not None:
+                cache = index['derived'].get(id(self))
+        if cache is None:
+            return self._calculate(name)
+        if name not in cache:
+            cache[name] = self._calculate(name)
+        return cache[name]
+
+    def set(self, *args, **kwargs):
+        _clear_bdep_index(self.getparent())
+        super(BuildDependency, self).set(*args, **kwargs)
+
+    @property
+    def attrib(self):
+        return _TrackedAttrib(self, super(BuildDependency, self).attrib)
+
+    def _calculate(self, name):
+        """Calculates the filename or binarytype."""
+        if name == 'binarytype':
             return self._calculate_binarytype()
         elif 'binary' in self.keys():
             # no need to construct the filename (this is set by the backend)
@@ -384,6 +1324,17 @@ class BuildDependency(OscElement):
             return parent.get('binarytype')
         return binarytype
 
+    def prpap(self, arch):
+        """Returns the "project/repository/arch/package" str of the bdep.
+
+        arch is the "default" architecture (usually binfo.arch), which
+        is used if the bdep has no repoarch attribute.
+
+        """
+        return "%s/%s/%s/%s" % (self.get('project'), self.get('repository'),
+                                self.get('repoarch', arch),
+                                self.get('package', '_repository'))
+
     def rpmfilename(self):
         """Returns a rpm filename.
 
@@ -1,14 +1,16 @@
 """Main entry point for the cli module."""
 
 import os
+import sys
 import inspect
 import logging
 import urlparse
 from ConfigParser import SafeConfigParser
 
 from osc2.core import Osc
+from osc2.httprequest import HTTPStats, RetryPolicy
 from osc2.cli import plugin
-from osc2.cli.description import CommandDescription
+from osc2.cli.description import CommandDescription, Option
 from osc2.cli import render
 from osc2.cli import parse
 
@@ -75,6 +77,12 @@ def _init(apiurl):
 # base class for all osc toplevel commands
 class OscCommand(CommandDescription):
     """open Build Service commandline tool"""
+    opt_stats = Option('', 'stats', 'print http request statistics',
+                       action='store_true')
+    opt_trace = Option('', 'trace', 'write a json trace of all http '
+                       'requests to FILE', metavar='FILE')
+    opt_retries = Option('', 'retries', 'retry failed idempotent http '
+                         'requests up to N times', metavar='N', type=int)
 
 
 def _extract_info(f, *f_args, **f_kwargs):
@@ -296,7 +304,30 @@ def execute(args=None):
     if 'apiurl' in info:
         apiurl = info.apiurl
     info.set('apiurl', _init(apiurl))
-    info.func(info)
+    if info.get('retries'):
+        policy = RetryPolicy(retries=info.retries)
+        Osc.get_osc().get_reqobj().retry_policy = policy
+    stats = None
+    if info.get('stats') or info.get('trace'):
+        stats = HTTPStats()
+        Osc.get_osc().get_reqobj().listener.append(stats)
+    try:
+        info.func(info)
+    finally:
+        if stats is not None:
+            _report_stats(stats, info)
+
+
+def _report_stats(stats, info):
+    """Prints and/or writes the collected http statistics.
+
+    stats is a HTTPStats object and info is the info object.
+
+    """
+    if info.get('stats'):
+        print >>sys.stderr, stats.format_summary()
+    if info.get('trace'):
+        stats.write_trace(info.trace)
 
 
 def main(args=None):
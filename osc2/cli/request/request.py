@@ -1,11 +1,13 @@
 """Provides various functions for the "request" command."""
 
 import logging
+import threading
+import Queue
+from collections import deque
 
 from osc2.httprequest import HTTPError
-from osc2.util.xpath import XPathBuilder
 from osc2.remote import Request
-from osc2.search import find_request
+from osc2.search import RequestQuery
 from osc2.cli.util.env import run_pager, edit_message
 from osc2.cli.util.shell import AbstractShell, ShellSyntaxError
 
@@ -64,9 +66,20 @@ class AbstractRequestController(object):
         sh.run(requests)
 
     @classmethod
-    def diff(cls, request):
-        """Displays the diff for the request request."""
-        run_pager(request.diff())
+    def diff(cls, request, info=None):
+        """Displays the diff for the request request.
+
+        If info contains a diff_prefetcher, the (possibly prefetched)
+        diff is retrieved from it.
+
+        """
+        prefetcher = None
+        if info is not None and 'diff_prefetcher' in info:
+            prefetcher = info.diff_prefetcher
+        if prefetcher is not None:
+            run_pager(prefetcher.diff(request))
+        else:
+            run_pager(request.diff())
 
     @classmethod
     def _change_request_state(cls, renderer, request, method, message, info,
@@ -107,14 +120,54 @@ class RequestController(AbstractRequestController):
         """Changes the state of the request id reqid.
 
         method is the method which is called on the
-        retrieved request object.
+        retrieved request object. reqid can also be a list
+        of request ids (see _change_request_states).
         If message is None $EDITOR is opened.
 
         """
+        if not isinstance(reqid, basestring):
+            if len(reqid) != 1:
+                cls._change_request_states(renderer, reqid, method,
+                                           message, info)
+                return
+            reqid = reqid[0]
         request = Request.find(reqid)
         cls._change_request_state(renderer, request, method, message, info,
                                   supersede_id)
 
+    @classmethod
+    def _change_request_states(cls, renderer, reqids, method, message, info):
+        """Changes the state of the requests reqids concurrently.
+
+        If message is None $EDITOR is opened (only once).
+        A failed state change does not abort the other ones. After
+        all results were rendered, the error of the first failed
+        state change is raised (if any).
+
+        """
+        global SHOW_TEMPLATE
+        if message is None:
+            message = edit_message()
+        kwargs = {'comment': message}
+        if info.force:
+            kwargs['force'] = '1'
+        results = Request.change_states(reqids, method, **kwargs)
+        errors = []
+        for request, error in results:
+            if error is None:
+                renderer.render(SHOW_TEMPLATE, request=request)
+                continue
+            errors.append(error)
+            reqid = request
+            if hasattr(request, 'get'):
+                reqid = request.get('id')
+            msg = "%s: %s" % (reqid, error)
+            if isinstance(error, HTTPError):
+                msg = "%s: Error %s: %s" % (reqid, error.code, error.url)
+            renderer.render_text(msg)
+        if errors:
+            raise errors[0]
+
     @classmethod
     def create(cls, renderer, submit, changedevel, role, grouprole, delete,
                info):
@@ -179,27 +232,161 @@ class RequestController(AbstractRequestController):
     @classmethod
     def _find_requests(cls, project, package, info):
         """Returns a collection of requests."""
-        xpb = XPathBuilder(is_relative=True)
-        xp = xpb.dummy()
-        # state has at least one element
-        for state in info.state:
-            xp = xp | xpb.state.attr('name') == state
-        xp = xp.parenthesize()
-        if info.user is not None:
-            xp = xp & ((xpb.state.attr('who') == info.user)
-                       | (xpb.history.attr('who') == info.user)).parenthesize()
-        if project is not None:
-            tmp = ((xpb.action.target.attr('project') == project)
-                   | (xpb.action.source.attr('project') == project))
-            xp = xp & tmp.parenthesize()
-        if package is not None:
-            tmp = ((xpb.action.target.attr('package') == package)
-                   | (xpb.action.source.attr('package') == package))
-            xp = xp & tmp.parenthesize()
-        logger().debug(xp.tostring())
-        res = find_request(xp=xp, apiurl=info.apiurl)
-        collection = [r for r in res]
-        return collection
+        query = RequestQuery(states=info.state, who=info.user,
+                             project=project, package=package, history=True)
+        if info.group is not None:
+            query.review(by_group=info.group)
+        logger().debug(query.xpath().tostring())
+        return query.find(apiurl=info.apiurl)
+
+
+class DiffPrefetcher(object):
+    """Fetches the diffs of requests in the background.
+
+    The fetched diffs are cached in memory. If the total size of the
+    cached diffs exceeds max_size, the oldest diffs are evicted (a
+    diff which is larger than max_size is not cached at all).
+
+    """
+
+    def __init__(self, max_size=32 * 1024 * 1024, workers=2):
+        """Constructs a new DiffPrefetcher object.
+
+        Keyword arguments:
+        max_size -- the maximum total size of the cached diffs
+                    (default: 32 MiB)
+        workers -- the number of background threads (default: 2)
+
+        """
+        super(DiffPrefetcher, self).__init__()
+        self._max_size = max_size
+        self._workers = workers
+        self._threads = []
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        # reqid => diff (no OrderedDict because it is not available
+        # in python 2.6)
+        self._cache = {}
+        # the cached reqids (oldest first)
+        self._order = deque()
+        self._size = 0
+        # reqid => threading.Event (set when the fetch is done)
+        self._pending = {}
+        self._cancelled = set()
+
+    def _start(self):
+        """Starts the background threads (if not already started)."""
+        while len(self._threads) < self._workers:
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            reqid, request = item
+            with self._lock:
+                cancelled = reqid in self._cancelled
+            data = None
+            if not cancelled:
+                try:
+                    data = request.diff().read()
+                except Exception as e:
+                    # the error is reported when the diff is requested
+                    logger().debug("prefetching diff %s: %s" % (reqid, e))
+            with self._lock:
+                if data is not None and reqid not in self._cancelled:
+                    self._store(reqid, data)
+                self._cancelled.discard(reqid)
+                self._pending.pop(reqid).set()
+
+    def _store(self, reqid, data):
+        """Caches data (the caller has to hold the lock)."""
+        if len(data) > self._max_size:
+            return
+        self._remove(reqid)
+        while self._cache and self._size + len(data) > self._max_size:
+            old = self._cache.pop(self._order.popleft())
+            self._size -= len(old)
+        self._cache[reqid] = data
+        self._order.append(reqid)
+        self._size += len(data)
+
+    def _remove(self, reqid):
+        """Removes reqid from the cache (the caller has to hold the lock)."""
+        data = self._cache.pop(reqid, None)
+        if data is not None:
+            self._order.remove(reqid)
+            self._size -= len(data)
+
+    def prefetch(self, requests):
+        """Fetches the diffs of the requests in the background.
+
+        requests is a list of Request objects.
+
+        """
+        self._start()
+        with self._lock:
+            for request in requests:
+                reqid = request.get('id')
+                self._cancelled.discard(reqid)
+                if reqid in self._cache or reqid in self._pending:
+                    continue
+                self._pending[reqid] = threading.Event()
+                self._queue.put((reqid, request))
+
+    def diff(self, request):
+        """Returns the diff of request.
+
+        If the diff is currently prefetched, the call blocks until
+        the prefetch is finished. If the diff is not cached, it is
+        fetched synchronously.
+
+        """
+        reqid = request.get('id')
+        with self._lock:
+            event = self._pending.get(reqid)
+            self._cancelled.discard(reqid)
+        if event is not None:
+            event.wait()
+        with self._lock:
+            data = self._cache.get(reqid)
+        if data is None:
+            data = request.diff().read()
+            with self._lock:
+                self._store(reqid, data)
+        return data
+
+    def discard(self, request):
+        """Removes the diff of request from the cache.
+
+        A pending prefetch of the diff is cancelled.
+
+        """
+        reqid = request.get('id')
+        with self._lock:
+            if reqid in self._pending:
+                self._cancelled.add(reqid)
+            self._remove(reqid)
+
+    def close(self):
+        """Cancels all pending prefetches and stops the threads.
+
+        Note: a diff which is currently fetched cannot be aborted
+        (but its result is dropped).
+
+        """
+        with self._lock:
+            self._cancelled.update(self._pending.keys())
+            self._cache.clear()
+            self._order.clear()
+            self._size = 0
+        for thread in self._threads:
+            self._queue.put(None)
+        self._threads = []
 
 
 class AbstractRequestShell(AbstractShell):
@@ -211,14 +398,21 @@ class AbstractRequestShell(AbstractShell):
         *args and **kwargs are passed to the base class'
         __init__ method.
 
+        Keyword arguments:
+        prefetch -- the number of upcoming requests whose diffs
+                    are prefetched (default: 3)
+
         """
+        self._prefetch = kwargs.pop('prefetch', 3)
         super(AbstractRequestShell, self).__init__(*args, **kwargs)
         self._request = None
+        self._prefetcher = None
 
     def _augment_info(self, info):
         """Adds the current request to the info object."""
         super(AbstractRequestShell, self)._augment_info(info)
         info.set('request', self._request)
+        info.set('diff_prefetcher', self._prefetcher)
 
     def run(self, requests):
         """Run the shell.
@@ -226,8 +420,21 @@ class AbstractRequestShell(AbstractShell):
         requests is a list of Request objects.
 
         """
+        if self._prefetch > 0:
+            self._prefetcher = DiffPrefetcher()
+        try:
+            self._run(requests)
+        finally:
+            if self._prefetcher is not None:
+                self._prefetcher.close()
+                self._prefetcher = None
+
+    def _run(self, requests):
         while requests:
             self._request = requests.pop(0)
+            if self._prefetcher is not None:
+                self._prefetcher.prefetch([self._request]
+                                          + requests[:self._prefetch])
             self.render(SHOW_TEMPLATE, request=self._request)
             next_req = False
             while not next_req:
@@ -246,6 +453,8 @@ class AbstractRequestShell(AbstractShell):
                 except HTTPError as e:
                     msg = "Error %s: %s" % (e.code, e.url)
                     self._renderer.render_text(msg)
+            if self._prefetcher is not None:
+                self._prefetcher.discard(self._request)
             self.clear()
 
 
@@ -72,46 +72,49 @@ class ChangeStateOptions(object):
 
 
 class RequestAccept(CommandDescription, Request, ChangeStateOptions):
-    """Accept a specific request.
+    """Accept one or more requests.
 
     If no message is specified $EDITOR is opened.
 
     Example:
     osc request accept api://reqid [--message MESSAGE]
+    osc request accept api://reqid api://reqid2 ... [--message MESSAGE]
 
     """
     cmd = 'accept'
-    args = 'api://reqid'
+    args = '(api://reqid)+'
     func = call(RequestController.change_request_state)
     func_defaults = {'method': 'accept'}
 
 
 class RequestDecline(CommandDescription, Request, ChangeStateOptions):
-    """Decline a specific request.
+    """Decline one or more requests.
 
     If no message is specified $EDITOR is opened.
 
     Example:
     osc request decline api://reqid [--message MESSAGE]
+    osc request decline api://reqid api://reqid2 ... [--message MESSAGE]
 
     """
     cmd = 'decline'
-    args = 'api://reqid'
+    args = '(api://reqid)+'
     func = call(RequestController.change_request_state)
     func_defaults = {'method': 'decline'}
 
 
 class RequestRevoke(CommandDescription, Request, ChangeStateOptions):
-    """Revoke a specific request.
+    """Revoke one or more requests.
 
     If no message is specified $EDITOR is opened.
 
     Example:
     osc request revoke api://reqid [--message MESSAGE]
+    osc request revoke api://reqid api://reqid2 ... [--message MESSAGE]
 
     """
     cmd = 'revoke'
-    args = 'api://reqid'
+    args = '(api://reqid)+'
     func = call(RequestController.change_request_state)
     func_defaults = {'method': 'revoke'}
 
@@ -4,7 +4,7 @@ import logging
 
 from osc2.util.xpath import XPathBuilder
 from osc2.remote import Request
-from osc2.search import find_request
+from osc2.search import RequestQuery
 from osc2.cli.util.env import edit_message
 from osc2.cli.request.request import AbstractRequestController, SHOW_TEMPLATE
 
@@ -52,73 +52,42 @@ class BaseReviewController(AbstractRequestController):
         If no reviews were found an empty list is returned.
         """
         xpb = XPathBuilder(context_item=True)
-        by_kind, xp = cls._build_by_predicate(xpb, info, [])
-        if not by_kind:
-            # return all reviews
-            xp = xpb.review
-        logger().debug(xp.tostring())
-        return request.findall(xp.tostring())
-
-    @classmethod
-    def _build_by_predicate(cls, xpb, info, states):
-        """Builds a by_<kind> predicate.
-
-        States is a list of states or the empty list.
-        Returns a two tuple. The first element indicates whether
-        a at least one by_ predicate was build
-
-        """
-        by_kind = False
-        xp = xpb.dummy()
-        if info.user is not None:
-            pred = xpb.attr('by_user') == info.user
-            xp = xp | cls._add_states(xpb, pred, states)
-            by_kind = True
-        if info.group is not None:
-            pred = xpb.attr('by_group') == info.group
-            xp = xp | cls._add_states(xpb, pred, states)
-            by_kind = True
-        if info.project is not None:
-            pred = xpb.attr('by_project') == info.project
-            xp = xp | cls._add_states(xpb, pred, states)
-            by_kind = True
+        preds = []
+        for kind in ('user', 'group', 'project'):
+            value = getattr(info, kind)
+            if value is not None:
+                preds.append(xpb.attr('by_' + kind) == value)
         if info.package:
             # info.package is a list
             pred = ((xpb.attr('by_project') == info.package[0].project)
                     & (xpb.attr('by_package') == info.package[0].package))
-            xp = xp | cls._add_states(xpb, pred, states)
-            by_kind = True
-        return by_kind, xp
-
-    @classmethod
-    def _add_states(cls, xpb, pred, states):
-        """Adds states to the existing predicate pred.
-
-        states is a list of states or the empty list.
-
-        """
-        st_pred = xpb.dummy()
-        for state in states:
-            st_pred = st_pred | (xpb.attr('state') == state)
-        return xpb.review[pred & st_pred.parenthesize()]
+            preds.append(pred.parenthesize())
+        xp = xpb.review
+        if preds:
+            xp = xp[xpb.log_or(*preds)]
+        logger().debug(xp.tostring())
+        return request.findall(xp.tostring())
 
     @classmethod
     def _find_requests(cls, tgt_project, tgt_package, info):
         """Returns a collection of requests."""
-        xpb = XPathBuilder(is_relative=True)
-        xp = xpb.dummy()
-        by_kind, xp = cls._build_by_predicate(xpb, info, info.state)
+        query = RequestQuery(states=['review'], project=tgt_project,
+                             package=tgt_package, source=False, history=True)
+        by_kind = False
+        for kind in ('user', 'group', 'project'):
+            value = getattr(info, kind)
+            if value is not None:
+                query.review(info.state, **{'by_' + kind: value})
+                by_kind = True
+        if info.package:
+            # info.package is a list
+            query.review(info.state, by_project=info.package[0].project,
+                         by_package=info.package[0].package)
+            by_kind = True
         if not by_kind:
-            xp = cls._add_states(xpb, xpb.dummy(), info.state)
-        xp = (xpb.state.attr('name') == 'review') & xp.parenthesize()
-        if tgt_project is not None:
-            xp = xp & (xpb.action.target.attr('project') == tgt_project)
-        if tgt_package is not None:
-            xp = xp & (xpb.action.target.attr('package') == tgt_package)
-        logger().debug(xp.tostring())
-        res = find_request(xp=xp, apiurl=info.apiurl)
-        collection = [r for r in res]
-        return collection
+            query.review(info.state)
+        logger().debug(query.xpath().tostring())
+        return query.find(apiurl=info.apiurl)
 
 
 class ReviewController(BaseReviewController):
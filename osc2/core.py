@@ -1,4 +1,4 @@
-from osc2.httprequest import Urllib2HTTPRequest
+from osc2.httprequest import Urllib2HTTPRequest, AsyncHTTPRequest
 
 
 # XXX: needs a bit more thinking... this will be the "global" place where
@@ -7,7 +7,8 @@ class Osc(object):
     _osc = None
 
     def __init__(self, apiurl, username='', password='', request_object=None,
-                 debug=False, validate=True):
+                 debug=False, validate=True, keepalive=False,
+                 retry_policy=None):
         super(Osc, self).__init__()
         if username and request_object is not None:
             raise ValueError('either specify username or request_object')
@@ -17,12 +18,21 @@ class Osc(object):
                                                      username=username,
                                                      password=password,
                                                      validate=validate,
-                                                     debug=debug)
+                                                     debug=debug,
+                                                     keepalive=keepalive,
+                                                     retry_policy=retry_policy)
+        self._async_request_object = None
         Osc._osc = self
 
     def get_reqobj(self):
         return self.request_object
 
+    def get_async_reqobj(self):
+        """Returns an AsyncHTTPRequest for the request object."""
+        if self._async_request_object is None:
+            self._async_request_object = AsyncHTTPRequest(self.request_object)
+        return self._async_request_object
+
     @staticmethod
     def init(*args, **kwargs):
         return Osc(*args, **kwargs)
@@ -12,7 +12,7 @@ from urlgrabber import grabber, mirror
 from osc2.build import BuildResult
 from osc2.util.listinfo import ListInfo
 from osc2.util.notify import Notifier
-from osc2.util.io import copy_file
+from osc2.util.io import copy_file, clone_file
 from osc2.remote import RORemoteFile
 from osc2.httprequest import HTTPError, build_url
 
@@ -67,13 +67,18 @@ class CacheManager(object):
         """
         raise NotImplementedError()
 
-    def write(self, bdep, source):
+    def write(self, bdep, source, hardlink=False):
         """Write source to cache.
 
         bdep is a BuildDependency instance. source is a filename or
         file-like object. A ValueError is raised if bdep already exists
         in the cache.
 
+        Keyword arguments:
+        hardlink -- if True and source is a filename, an implementation
+                    might hardlink it into the cache (that is source must
+                    not be modified in place afterwards) (default: False)
+
         """
         raise NotImplementedError()
 
@@ -141,7 +146,7 @@ class FilenameCacheManager(CacheManager):
             # remove project
             os.rmdir(dirname)
 
-    def write(self, bdep, source):
+    def write(self, bdep, source, hardlink=False):
         if self.exists(bdep):
             msg = "bdep for file \"%s\" already exists" % bdep.get('filename')
             raise ValueError(msg)
@@ -149,7 +154,10 @@ class FilenameCacheManager(CacheManager):
         dirname = os.path.dirname(fname)
         if not os.path.exists(dirname):
             os.makedirs(dirname)
-        copy_file(source, fname)
+        if isinstance(source, basestring):
+            clone_file(source, fname, hardlink=hardlink)
+        else:
+            copy_file(source, fname)
 
 
 class NamePreferCacheManager(FilenameCacheManager):
@@ -422,10 +430,7 @@ class BuildDependencyFetcher(object):
         bdep is a BuildDependency instance.
 
         """
-        prpap = "%s/%s/%s/%s" % (bdep.get('project'), bdep.get('repository'),
-                                 bdep.get('repoarch', arch),
-                                 bdep.get('package', '_repository'))
-        self._cpio_todo.setdefault(prpap, []).append(bdep)
+        self._cpio_todo.setdefault(bdep.prpap(arch), []).append(bdep)
 
     def _calculate_fetchinfo(self, binfo):
         """Calculates fetchinfo list.
@@ -12,18 +12,73 @@ Example usage:
 """
 
 import os
+import sys
+import copy
+import time
+import errno
+import json
+import random
 import urllib2
 import urllib
+import httplib
+import socket
+import ssl
 import cookielib
 import urlparse
 import cStringIO
 import mmap
+import zlib
 import logging
+import threading
+import Queue
+from contextlib import contextmanager
+from email.utils import parsedate_tz, mktime_tz
 
 from lxml import etree
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from osc2.util.notify import Notifier
+from osc2.util.xml import assert_valid, fromstring
+
 __all__ = ['AbstractHTTPRequest', 'AbstractHTTPResponse', 'HTTPError',
-           'Urllib2HTTPResponse', 'Urllib2HTTPError', 'Urllib2HTTPRequest']
+           'Urllib2HTTPResponse', 'Urllib2HTTPError', 'Urllib2HTTPRequest',
+           'HTTPRequestEvent', 'HTTPRequestListener', 'HTTPStats',
+           'request_tag', 'request_xml', 'RetryPolicy', 'AsyncHTTPRequest',
+           'HTTPFuture']
+
+# stores the request tag of the current thread (see request_tag)
+_tag_data = threading.local()
+
+
+@contextmanager
+def request_tag(tag):
+    """Tags all http requests which are issued in the with block.
+
+    The tag is passed to the HTTPRequestListener (as part of the
+    HTTPRequestEvent) and can be used to identify the code path
+    which issued a request. Tags can be nested (the innermost tag
+    is used).
+
+    Example usage:
+     with request_tag('update'):
+         RemoteProject.find('foo')
+
+    """
+    old = current_request_tag()
+    _tag_data.tag = tag
+    try:
+        yield
+    finally:
+        _tag_data.tag = old
+
+
+def current_request_tag():
+    """Returns the request tag of the current thread or ''."""
+    return getattr(_tag_data, 'tag', '')
 
 
 def build_url(apiurl, path, **query):
@@ -76,6 +131,29 @@ class AbstractHTTPResponse(object):
         self.code = code
         self.headers = headers
         self.orig_resp = orig_resp
+        # length of the encoded body if the response is decoded
+        # transparently (-1 if unknown), otherwise None
+        self.encoded_length = None
+        # (parser, root) tuple if the response was parsed during
+        # the validation
+        self._parsed = None
+
+    def parse(self, parser=None):
+        """Parses the xml response and returns the root element.
+
+        If the response was already parsed with the parser parser during
+        the response validation, the validated tree is returned (that is
+        the response is parsed only once). In this case the response data
+        can still be read.
+
+        Keyword arguments:
+        parser -- the lxml parser which is used for parsing (default:
+                  None, that is the default parser is used)
+
+        """
+        if self._parsed is not None and self._parsed[0] is parser:
+            return self._parsed[1]
+        return etree.fromstring(self.read(), parser)
 
     def read(self, size=-1):
         """Read the response.
@@ -122,6 +200,299 @@ class HTTPError(Exception):
         self.orig_exc = orig_exc
 
 
+class HTTPRequestEvent(object):
+    """Describes a single http request.
+
+    All times are in seconds. ttfb is the time until the response
+    headers were received and total is the time until the response
+    was read completely (or closed). If the request failed, error
+    contains the error message (status is None if no response was
+    received at all). attempt is the number of the attempt (if the
+    request was retried) and hedged is True if the request was a
+    hedged (duplicate) request.
+
+    """
+    FIELDS = ('method', 'url', 'status', 'bytes_in', 'bytes_out', 'ttfb',
+              'total', 'tag', 'error', 'start', 'attempt', 'hedged')
+
+    def __init__(self, method, url, bytes_out=0, tag=''):
+        """Constructs a new HTTPRequestEvent object.
+
+        method is the http method and url the requested url.
+
+        Keyword arguments:
+        bytes_out -- the size of the request body (default: 0)
+        tag -- the request tag (default: '')
+
+        """
+        super(HTTPRequestEvent, self).__init__()
+        self.method = method
+        self.url = url
+        self.status = None
+        self.bytes_in = 0
+        self.bytes_out = bytes_out
+        self.ttfb = None
+        self.total = None
+        self.tag = tag
+        self.error = None
+        self.start = time.time()
+        self.attempt = 1
+        self.hedged = False
+
+    @property
+    def path(self):
+        """Returns the path of the url."""
+        return urlparse.urlparse(self.url).path
+
+    def as_dict(self):
+        """Returns a dict which contains all fields of the event."""
+        data = dict([(field, getattr(self, field)) for field in self.FIELDS])
+        data['path'] = self.path
+        return data
+
+
+class HTTPRequestListener(object):
+    """Notifies a client about finished http requests."""
+
+    def finished(self, event):
+        """This method is called when a http request is finished.
+
+        event is a HTTPRequestEvent. A request is finished if its
+        response was read completely, if it was closed or if the
+        request failed. Note: the method might be called from
+        different threads.
+
+        """
+        raise NotImplementedError()
+
+
+class HTTPRequestNotifier(Notifier):
+    """Notifies all registered HTTPRequestListener."""
+
+    def finished(self, *args, **kwargs):
+        self._notify('finished', *args, **kwargs)
+
+
+class HTTPStats(HTTPRequestListener):
+    """Collects the events of all finished http requests.
+
+    Example usage:
+     stats = HTTPStats()
+     r = Urllib2HTTPRequest('https://host', listener=[stats])
+     ...
+     print stats.format_summary()
+     stats.write_trace('/path/to/trace.json')
+
+    """
+
+    def __init__(self):
+        """Constructs a new HTTPStats object."""
+        super(HTTPStats, self).__init__()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def finished(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self, key='tag'):
+        """Returns a list of aggregated statistics.
+
+        The events are grouped by the event attribute key. Each
+        list entry is a dict with the keys: key, requests, errors,
+        bytes_in, bytes_out, time (the sum of all request times) and
+        max_time. The list is sorted by time (descending).
+
+        Keyword arguments:
+        key -- the event attribute which is used for grouping
+               (default: 'tag')
+
+        """
+        with self._lock:
+            events = self.events[:]
+        groups = {}
+        for event in events:
+            k = getattr(event, key)
+            data = groups.get(k)
+            if data is None:
+                data = {'key': k, 'requests': 0, 'errors': 0, 'bytes_in': 0,
+                        'bytes_out': 0, 'time': 0.0, 'max_time': 0.0}
+                groups[k] = data
+            data['requests'] += 1
+            if event.error is not None:
+                data['errors'] += 1
+            data['bytes_in'] += event.bytes_in
+            data['bytes_out'] += event.bytes_out
+            total = event.total or 0.0
+            data['time'] += total
+            data['max_time'] = max(data['max_time'], total)
+        return sorted(groups.itervalues(), key=lambda d: d['time'],
+                      reverse=True)
+
+    def format_summary(self, key='tag'):
+        """Returns the summary as a human readable str.
+
+        Keyword arguments:
+        key -- see summary
+
+        """
+        fmt = "%-30s %8s %6s %12s %12s %9s %9s"
+        lines = [fmt % (key, 'requests', 'errors', 'bytes in', 'bytes out',
+                        'time', 'max')]
+        fmt = "%-30s %8d %6d %12d %12d %8.3fs %8.3fs"
+        for data in self.summary(key):
+            lines.append(fmt % (data['key'] or '-', data['requests'],
+                                data['errors'], data['bytes_in'],
+                                data['bytes_out'], data['time'],
+                                data['max_time']))
+        return '\n'.join(lines)
+
+    def write_trace(self, dest):
+        """Writes all events as json to dest.
+
+        If dest is a file-like object (that is it has a write(buf)
+        method) the data is written to it. Otherwise dest is treated
+        as a filename.
+
+        """
+        with self._lock:
+            data = {'events': [event.as_dict() for event in self.events]}
+        if hasattr(dest, 'write'):
+            json.dump(data, dest, indent=2)
+            return
+        with open(dest, 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+class RetryPolicy(object):
+    """Decides if and when a failed http request is retried.
+
+    Only idempotent requests are retried, that is GET and HEAD requests
+    and PUT requests of files into the (content addressed) source
+    repository (rev=repository). A request is retried if the server
+    responds with one of the RETRY_STATUS codes or if the connection
+    was reset or timed out before the response headers were received.
+    The delay before the n-th retry is backoff * 2**(n - 1) seconds (at
+    most max_backoff seconds) minus a random jitter. If the server sent
+    a Retry-After header, the delay is at least Retry-After seconds.
+
+    Optionally, slow GET requests can be hedged: if no response was
+    received after hedge_after seconds, a second (identical) request
+    is issued and the first response is used.
+
+    """
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    RETRY_ERRNOS = (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE,
+                    errno.ETIMEDOUT)
+    IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30.0, jitter=0.5,
+                 max_retry_after=120.0, hedge_after=None):
+        """Constructs a new RetryPolicy object.
+
+        Keyword arguments:
+        retries -- the maximum number of retries (default: 3)
+        backoff -- the initial delay in seconds (default: 0.5)
+        max_backoff -- the maximum delay in seconds (default: 30.0)
+        jitter -- fraction of the delay which is randomized (0.0 means
+                  no jitter) (default: 0.5)
+        max_retry_after -- a request is not retried if the server asks
+                           for a longer delay (default: 120.0)
+        hedge_after -- issue a hedged GET request after hedge_after
+                       seconds (default: None, that is no hedging)
+
+        """
+        super(RetryPolicy, self).__init__()
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.max_retry_after = max_retry_after
+        self.hedge_after = hedge_after
+        self._random = random.Random()
+
+    def idempotent(self, method, url, data=None):
+        """Returns True if the request can be retried.
+
+        A request with a streamed body (a data object without a
+        length) cannot be retried.
+
+        """
+        if data is not None and not hasattr(data, '__len__'):
+            return False
+        if method in self.IDEMPOTENT_METHODS:
+            return True
+        query = urlparse.parse_qs(urlparse.urlparse(url).query)
+        return method == 'PUT' and query.get('rev') == ['repository']
+
+    def hedge(self, method):
+        """Returns True if the request should be hedged."""
+        return self.hedge_after is not None and method == 'GET'
+
+    def retryable(self, exc):
+        """Returns True if the request which raised exc can be retried.
+
+        Apart from the RETRY_STATUS codes, only timeouts and connections
+        which were reset are considered as transient errors (a failed
+        name lookup or an invalid certificate are not).
+
+        """
+        if isinstance(exc, urllib2.HTTPError):
+            return exc.code in self.RETRY_STATUS
+        if isinstance(exc, urllib2.URLError):
+            exc = exc.reason
+        if isinstance(exc, socket.timeout):
+            return True
+        elif isinstance(exc, httplib.BadStatusLine):
+            # the server closed the connection without a response
+            return True
+        elif isinstance(exc, (socket.gaierror, socket.herror, ssl.SSLError)):
+            return False
+        elif isinstance(exc, socket.error):
+            return exc.errno in self.RETRY_ERRNOS
+        return False
+
+    def retry_after(self, exc):
+        """Returns the Retry-After delay (in seconds) or None.
+
+        None is returned if exc has no (valid) Retry-After header.
+
+        """
+        headers = getattr(exc, 'hdrs', None)
+        if headers is None:
+            return None
+        value = headers.get('Retry-After', '').strip()
+        if value.isdigit():
+            return float(value)
+        date = parsedate_tz(value)
+        if date is None:
+            return None
+        return max(mktime_tz(date) - time.time(), 0.0)
+
+    def delay(self, attempt, exc):
+        """Returns the delay (in seconds) before the next attempt.
+
+        attempt is the number of the failed attempt and exc the
+        raised exception. If the request should not be retried,
+        None is returned.
+
+        """
+        if attempt > self.retries or not self.retryable(exc):
+            return None
+        delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        delay -= delay * self.jitter * self._random.random()
+        retry_after = self.retry_after(exc)
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            delay = max(delay, retry_after)
+        return delay
+
+    def sleep(self, delay):
+        """Waits delay seconds."""
+        time.sleep(delay)
+
+
 class AbstractHTTPRequest(object):
     """Base class which provides methods for doing http requests.
 
@@ -134,8 +505,15 @@ class AbstractHTTPRequest(object):
     is ignored.
 
     """
-
-    def __init__(self, apiurl, validate=False):
+    # modules which are skipped when the caller of a request is determined
+    # (only if no explicit request_tag is set)
+    TAG_IGNORE_MODULES = ('osc2.httprequest', 'osc2.remote', 'osc2.core')
+    # True if the request methods support the parser keyword argument
+    # (a subclass which does not support it would treat it as a query
+    # parameter)
+    PARSER_SUPPORT = False
+
+    def __init__(self, apiurl, validate=False, listener=None):
         """Constructs a new object.
 
         apiurl is the target location for each request. It is a str which
@@ -144,26 +522,79 @@ class AbstractHTTPRequest(object):
         Keyword arguments:
         validate -- if True xml response will be validated (if a schema was
                     specifed) (default False)
+        listener -- list of HTTPRequestListener instances (default: [])
 
         """
         super(AbstractHTTPRequest, self).__init__()
         self.apiurl = apiurl
         self.validate = validate
+        if listener is None:
+            listener = []
+        self.listener = listener
+        self._notifier = HTTPRequestNotifier(self.listener)
+
+    def _caller_tag(self):
+        """Returns a tag which describes the caller of a request.
+
+        The tag is either the current request_tag or the name of the
+        first function (module:function) which is not part of the
+        TAG_IGNORE_MODULES.
+
+        """
+        tag = current_request_tag()
+        if tag:
+            return tag
+        frame = sys._getframe(1)
+        while frame is not None:
+            module = frame.f_globals.get('__name__', '')
+            if module not in self.TAG_IGNORE_MODULES:
+                return "%s:%s" % (module, frame.f_code.co_name)
+            frame = frame.f_back
+        return ''
+
+    def _new_event(self, method, url, bytes_out=0):
+        """Returns a new HTTPRequestEvent.
+
+        If no listener is registered, None is returned.
 
-    def get(self, path, apiurl='', schema='', **query):
+        """
+        if not self.listener:
+            return None
+        return HTTPRequestEvent(method, url, bytes_out, self._caller_tag())
+
+    def _finish_event(self, event, error=None):
+        """Finishes the event and notifies the listener.
+
+        If event is None, nothing happens.
+
+        Keyword arguments:
+        error -- an optional error message (default: None)
+
+        """
+        if event is None:
+            return
+        if error is not None:
+            event.error = error
+        event.total = time.time() - event.start
+        self._notifier.finished(event)
+
+    def get(self, path, apiurl='', schema='', parser=None, **query):
         """Issues a http request to apiurl/path.
 
         The path parameter specified the path of the url.
         Keyword arguments:
         apiurl -- use this url instead of the default apiurl
         schema -- path to schema file (default '')
+        parser -- the lxml parser which is used to parse the response
+                  for the validation (see AbstractHTTPResponse.parse)
+                  (default None)
         query -- optional query parameters
 
         """
         raise NotImplementedError()
 
     def put(self, path, data=None, filename='', apiurl='', content_type='',
-            schema='', **query):
+            schema='', parser=None, **query):
         """Issues a http PUT request to apiurl/path.
 
         Either data or file mustn't be None.
@@ -173,13 +604,14 @@ class AbstractHTTPRequest(object):
         apiurl -- use this url instead of the default apiurl
         content_type -- use this value for the Content-type header
         schema -- path to schema file (default '')
+        parser -- see get (default None)
         query -- optional query parameters
 
         """
         raise NotImplementedError()
 
     def post(self, path, data=None, filename='', urlencoded=False, apiurl='',
-             content_type='', schema='', **query):
+             content_type='', schema='', parser=None, **query):
         """Issues a http POST request to apiurl/path.
 
         Either data or file mustn't be None.
@@ -194,45 +626,196 @@ class AbstractHTTPRequest(object):
                       if set to True the requests's Content-Type is
                       'application/x-www-form-urlencoded' (default: False,
                       default Content-Type: 'application/octet-stream')
+        parser -- see get (default None)
         query -- optional query parameters
 
         """
         raise NotImplementedError()
 
-    def delete(self, path, apiurl='', schema='', **query):
+    def delete(self, path, apiurl='', schema='', parser=None, **query):
         """Issues a http DELETE request to apiurl/path.
 
         Keyword arguments:
         schema -- path to schema file (default '')
         apiurl -- use this url instead of the default apiurl
+        parser -- see get (default None)
         query -- optional query parameters
 
         """
         raise NotImplementedError()
 
 
+def _decompressor(encoding):
+    """Returns a decompressor object for the content encoding or None.
+
+    None is returned if the encoding is not supported.
+
+    """
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    return None
+
+
+def _stream_complete(decompressor):
+    """Returns False if the compressed stream of decompressor is truncated.
+
+    True is returned if this cannot be determined.
+
+    """
+    eof = getattr(decompressor, 'eof', None)
+    if eof is not None:
+        return eof
+    if getattr(decompressor, 'unused_data', ''):
+        return True
+    elif not hasattr(decompressor, 'copy'):
+        return True
+    # python 2's zlib decompressobj has no eof attribute: data which
+    # follows the end of the stream ends up in unused_data
+    probe = decompressor.copy()
+    try:
+        probe.decompress('\x00')
+    except zlib.error:
+        return False
+    return probe.unused_data != ''
+
+
+def accept_encoding():
+    """Returns the value for the Accept-Encoding header."""
+    if zstandard is not None:
+        return 'zstd, gzip'
+    return 'gzip'
+
+
+class DecodingFile(object):
+    """Decodes a compressed response body while it is read.
+
+    The raw data is read in chunks of bufsize bytes from fobj.
+    The bytes_read attribute contains the number of raw (that
+    is compressed) bytes which were read so far. An IOError is
+    raised if the compressed stream is truncated.
+
+    """
+
+    def __init__(self, fobj, decompressor, bufsize=8192):
+        """Constructs a new DecodingFile object.
+
+        fobj is the file-like object which provides the raw data and
+        decompressor is an object which has a decompress(data) method
+        (for instance a zlib decompressobj).
+
+        Keyword arguments:
+        bufsize -- the size of the raw chunks (default: 8192)
+
+        """
+        super(DecodingFile, self).__init__()
+        self._fobj = fobj
+        self._decompressor = decompressor
+        self._bufsize = bufsize
+        self._buf = ''
+        self._eof = False
+        self.bytes_read = 0
+
+    def _fill(self, size):
+        data = [self._buf]
+        avail = len(self._buf)
+        while not self._eof and (size < 0 or avail < size):
+            raw = self._fobj.read(self._bufsize)
+            self.bytes_read += len(raw)
+            if not raw:
+                if (self.bytes_read
+                        and not _stream_complete(self._decompressor)):
+                    raise IOError('truncated compressed response body')
+                self._eof = True
+                if hasattr(self._decompressor, 'flush'):
+                    data.append(self._decompressor.flush())
+                break
+            chunk = self._decompressor.decompress(raw)
+            data.append(chunk)
+            avail += len(chunk)
+        self._buf = ''.join(data)
+
+    def read(self, size=-1):
+        """Reads and returns at most size decoded bytes.
+
+        If size is negative, everything is read.
+
+        """
+        self._fill(size)
+        if size < 0:
+            data, self._buf = self._buf, ''
+        else:
+            data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+    def close(self):
+        self._fobj.close()
+
+
 class Urllib2HTTPResponse(AbstractHTTPResponse):
     """Wraps an urllib2 http response.
 
     The original response is a urllib.addinfourl object.
 
     """
-    def __init__(self, resp):
+    def __init__(self, resp, event=None, finish=None):
+        """Constructs a new Urllib2HTTPResponse object.
+
+        A gzip (or zstd) encoded response is decoded transparently.
+        In this case the Content-Length header is removed from the
+        headers (because it describes the encoded body) and its
+        value is stored in the encoded_length attribute.
+
+        Keyword arguments:
+        event -- a HTTPRequestEvent which is updated while the
+                 response is read (default: None)
+        finish -- a function which is called with the event as soon as
+                  the response is read completely or closed (default: None)
+
+        """
         super(Urllib2HTTPResponse, self).__init__(resp.geturl(),
                                                   resp.getcode(),
                                                   resp.info(),
                                                   resp)
         self._sio = None
+        self._event = event
+        self._finish = finish
+        self._decoder = None
+        encoding = self.headers.get('Content-Encoding', '').strip().lower()
+        decompressor = _decompressor(encoding)
+        if decompressor is not None:
+            self._decoder = DecodingFile(resp, decompressor)
+            self.encoded_length = int(self.headers.get('Content-Length', -1))
+            if 'Content-Length' in self.headers:
+                del self.headers['Content-Length']
 
     def _fobj(self):
         if self._sio is not None:
             return self._sio
+        elif self._decoder is not None:
+            return self._decoder
         return self.orig_resp
 
+    def _finish_event(self):
+        if self._event is not None:
+            event = self._event
+            self._event = None
+            self._finish(event)
+
     def read(self, size=-1):
-        return self._fobj().read(size)
+        data = self._fobj().read(size)
+        if self._event is not None and self._sio is None:
+            if self._decoder is not None:
+                self._event.bytes_in = self._decoder.bytes_read
+            else:
+                self._event.bytes_in += len(data)
+            if size < 0 or not data:
+                self._finish_event()
+        return data
 
     def close(self):
+        self._finish_event()
         return self._fobj().close()
 
 
@@ -244,6 +827,200 @@ class Urllib2HTTPError(HTTPError):
                                                exc.hdrs, exc)
 
 
+class HTTPConnectionPool(object):
+    """Keeps idle persistent http connections for reuse."""
+
+    def __init__(self, maxsize=8):
+        """Constructs a new HTTPConnectionPool object.
+
+        Keyword arguments:
+        maxsize -- the maximum number of idle connections per
+                   host (default: 8)
+
+        """
+        super(HTTPConnectionPool, self).__init__()
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def get(self, key):
+        """Returns an idle connection for key or None."""
+        with self._lock:
+            conns = self._idle.get(key)
+            if conns:
+                return conns.pop()
+        return None
+
+    def put(self, key, conn):
+        """Returns the connection conn to the pool."""
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self._maxsize:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for conns in idle.itervalues():
+            for conn in conns:
+                conn.close()
+
+
+class _PooledResponseFile(object):
+    """Wraps a httplib.HTTPResponse of a pooled connection.
+
+    The connection is returned to the pool as soon as the
+    response is read completely.
+
+    """
+
+    def __init__(self, resp, release):
+        super(_PooledResponseFile, self).__init__()
+        self._resp = resp
+        self._release = release
+
+    def _done(self, reuse):
+        if self._release is not None:
+            self._release(reuse and not self._resp.will_close)
+            self._release = None
+
+    def read(self, size=-1):
+        if size < 0:
+            size = None
+        data = self._resp.read(size)
+        if self._resp.isclosed():
+            self._done(True)
+        return data
+
+    def readline(self, size=-1):
+        # rarely used (httplib.HTTPResponse has no readline method)
+        data = []
+        while size < 0 or len(data) < size:
+            c = self.read(1)
+            data.append(c)
+            if not c or c == '\n':
+                break
+        return ''.join(data)
+
+    def close(self):
+        # an unread response cannot be reused
+        self._done(self._resp.isclosed())
+        self._resp.close()
+
+
+class _KeepAliveMixin:
+    """Implements persistent connections for an urllib2 http handler.
+
+    This is an old-style class because urllib2's handlers are
+    old-style classes.
+
+    """
+    # requests which can be resent if a reused connection fails
+    # after the request was sent
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS',
+                          'TRACE')
+
+    def _pooled_open(self, http_class, req, **kwargs):
+        if req.has_proxy() or getattr(req, '_tunnel_host', None):
+            # let urllib2 take care of the proxy (and the tunnel setup)
+            return self.do_open(http_class, req, **kwargs)
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+        key = (http_class, host)
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items()
+                            if k not in headers))
+        headers = dict((name.title(), val) for name, val in headers.items())
+        method = req.get_method()
+        # a streamed body cannot be sent again
+        resendable = not hasattr(req.data, 'read')
+        conn = self._pool.get(key)
+        while True:
+            reused = conn is not None
+            sent = False
+            try:
+                if conn is None:
+                    conn = http_class(host, timeout=req.timeout, **kwargs)
+                    conn.connect()
+                    # headers and body are sent separately
+                    conn.sock.setsockopt(socket.IPPROTO_TCP,
+                                         socket.TCP_NODELAY, 1)
+                conn.request(method, req.get_selector(), req.data, headers)
+                sent = True
+                try:
+                    resp = conn.getresponse(buffering=True)
+                except TypeError:
+                    # buffering is not supported (python 2.6)
+                    resp = conn.getresponse()
+                break
+            except (socket.error, httplib.HTTPException) as e:
+                conn.close()
+                retry = (reused and resendable
+                         and (not sent or method in self.IDEMPOTENT_METHODS))
+                if not retry:
+                    raise urllib2.URLError(e)
+                # the server probably closed the idle connection
+                conn = None
+
+        def release(reuse):
+            if reuse:
+                self._pool.put(key, conn)
+            else:
+                conn.close()
+
+        fp = _PooledResponseFile(resp, release)
+        if resp.length == 0 or method == 'HEAD':
+            fp.read()
+        ret = urllib2.addinfourl(fp, resp.msg, req.get_full_url())
+        ret.code = resp.status
+        ret.msg = resp.reason
+        return ret
+
+
+class KeepAliveHTTPHandler(_KeepAliveMixin, urllib2.HTTPHandler):
+    """An urllib2 http handler which reuses connections."""
+
+    def __init__(self, pool, *args, **kwargs):
+        """Constructs a new KeepAliveHTTPHandler object.
+
+        pool is the HTTPConnectionPool which is used to keep the
+        idle connections.
+
+        """
+        urllib2.HTTPHandler.__init__(self, *args, **kwargs)
+        self._pool = pool
+
+    def http_open(self, req):
+        return self._pooled_open(httplib.HTTPConnection, req)
+
+
+class KeepAliveHTTPSHandler(_KeepAliveMixin, urllib2.HTTPSHandler):
+    """An urllib2 https handler which reuses connections."""
+
+    def __init__(self, pool, *args, **kwargs):
+        """Constructs a new KeepAliveHTTPSHandler object.
+
+        pool is the HTTPConnectionPool which is used to keep the
+        idle connections.
+
+        """
+        urllib2.HTTPSHandler.__init__(self, *args, **kwargs)
+        self._pool = pool
+
+    def https_open(self, req):
+        kwargs = {}
+        # the ssl context is only supported since python 2.7.9
+        context = getattr(self, '_context', None)
+        if context is not None:
+            kwargs['context'] = context
+        return self._pooled_open(httplib.HTTPSConnection, req, **kwargs)
+
+
 class Urllib2HTTPRequest(AbstractHTTPRequest):
     """Do http requests with urllib2.
 
@@ -251,10 +1028,18 @@ class Urllib2HTTPRequest(AbstractHTTPRequest):
     supports basic auth authentification.
 
     """
+    # smaller request bodies are not compressed
+    COMPRESS_MIN_SIZE = 1024
+    # magic bytes of data which is already compressed (gzip, bzip2, xz,
+    # zip, zstd)
+    COMPRESSED_MAGIC = ('\x1f\x8b', 'BZh', '\xfd7zXZ', 'PK\x03\x04',
+                        '\x28\xb5\x2f\xfd')
+    PARSER_SUPPORT = True
 
     def __init__(self, apiurl, validate=False, username='', password='',
                  cookie_filename='', debug=False, mmap=True,
-                 mmap_fsize=1024 * 512):
+                 mmap_fsize=1024 * 512, keepalive=False, listener=None,
+                 decode=True, compress_uploads=False, retry_policy=None):
         """constructs a new Urllib2HTTPRequest object.
 
         apiurl is the url which is used for every request.
@@ -270,12 +1055,27 @@ class Urllib2HTTPRequest(AbstractHTTPRequest):
         mmap -- use mmap when POSTing or PUTing a file (default True)
         mmap_fsize -- specifies the minimum filesize for using mmap
                       (default 1024*512)
+        keepalive -- reuse the http connections (default False)
+        listener -- list of HTTPRequestListener instances (default: [])
+        decode -- request gzip (and zstd, if available) encoded responses
+                  (default True)
+        compress_uploads -- gzip the data of PUT and POST requests (the
+                            server has to support gzip encoded request
+                            bodies) (default False)
+        retry_policy -- a RetryPolicy which is used to retry failed
+                        requests (default None, that is no retries)
 
         """
-        super(Urllib2HTTPRequest, self).__init__(apiurl, validate)
+        super(Urllib2HTTPRequest, self).__init__(apiurl, validate, listener)
         self.debug = debug
+        self._decode = decode
+        self._compress_uploads = compress_uploads
+        self.retry_policy = retry_policy
         self._use_mmap = mmap
         self._mmap_fsize = mmap_fsize
+        self._pool = None
+        if keepalive:
+            self._pool = HTTPConnectionPool()
         self._logger = logging.getLogger(__name__)
         self._install_opener(username, password, cookie_filename)
 
@@ -287,6 +1087,9 @@ class Urllib2HTTPRequest(AbstractHTTPRequest):
         authhandler = self._setup_authhandler(username, password)
         if authhandler is not None:
             handlers.append(authhandler)
+        if self._pool is not None:
+            handlers.append(KeepAliveHTTPHandler(self._pool))
+            handlers.append(KeepAliveHTTPSHandler(self._pool))
         if self.debug:
             urllib2.AbstractHTTPHandler.__init__ = (
                 lambda self, debuglevel=0: setattr(self, '_debuglevel', 1))
@@ -319,43 +1122,168 @@ class Urllib2HTTPRequest(AbstractHTTPRequest):
         url = build_url(apiurl, path, **query)
         request = urllib2.Request(url)
         request.get_method = lambda: method
+        if self._decode:
+            request.add_header('Accept-encoding', accept_encoding())
         return request
 
-    def _validate_response(self, resp, schema_filename):
+    def _compress(self, request, data):
+        """Returns the gzip compressed data.
+
+        If the data should not be compressed (because compressed uploads
+        are disabled, it is too small or it is already compressed), data
+        is returned.
+
+        """
+        if (not self._compress_uploads or not hasattr(data, '__len__')
+                or len(data) < self.COMPRESS_MIN_SIZE
+                or data[:6].startswith(self.COMPRESSED_MAGIC)):
+            return data
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compressed = compressor.compress(data) + compressor.flush()
+        request.add_header('Content-encoding', 'gzip')
+        return compressed
+
+    def _validate_response(self, resp, schema_filename, parser=None):
         if not schema_filename or not self.validate:
             return False
-        # this is needed for validation so that we can seek to the "top" of
-        # the file again (after validation)
-        sio = cStringIO.StringIO(resp.read())
-        resp._sio = sio
+        # this is needed so that the caller can still read the data
+        # (after validation)
+        data = resp.read()
+        resp._sio = cStringIO.StringIO(data)
         self._logger.debug("validate resp against schema: %s", schema_filename)
-        root = etree.fromstring(resp.read())
-        resp._sio.seek(0, os.SEEK_SET)
-        if schema_filename.endswith('.rng'):
-            schema = etree.RelaxNG(file=schema_filename)
-        elif schema_filename.endswith('.xsd'):
-            schema = etree.XMLSchema(file=schema_filename)
-        else:
-            raise ValueError('unsupported schema file')
-        schema.assertValid(root)
+        root = etree.fromstring(data, parser)
+        assert_valid(root, schema_filename)
+        # the caller can reuse the validated tree (see parse)
+        resp._parsed = (parser, root)
         return True
 
-    def _new_response(self, resp):
-        return Urllib2HTTPResponse(resp)
+    def _new_response(self, resp, event=None):
+        if event is None:
+            return Urllib2HTTPResponse(resp)
+        return Urllib2HTTPResponse(resp, event, self._finish_event)
 
-    def _send_request(self, method, path, apiurl, schema, **query):
-        request = self._build_request(method, path, apiurl, **query)
-        self._logger.info(request.get_full_url())
+    def _urlopen_once(self, request, data=None, event=None):
+        if event is not None:
+            event.start = time.time()
         try:
-            f = urllib2.urlopen(request)
+            f = urllib2.urlopen(request, data)
         except urllib2.HTTPError as e:
+            if event is not None:
+                event.status = e.code
             raise Urllib2HTTPError(e)
-        f = self._new_response(f)
-        self._validate_response(f, schema)
+        if event is not None:
+            event.status = f.getcode()
+            event.ttfb = time.time() - event.start
+        return f
+
+    def _copy_request(self, request):
+        new_request = urllib2.Request(request.get_full_url(),
+                                      headers=dict(request.headers))
+        new_request.get_method = request.get_method
+        return new_request
+
+    def _hedged_urlopen(self, request, data=None, event=None):
+        """Issues a second request if the first one is too slow.
+
+        The first response is used (the other one is closed).
+
+        """
+        results = Queue.Queue()
+
+        def run(req, ev):
+            try:
+                results.put((ev, self._urlopen_once(req, data, ev), None))
+            except Exception:
+                results.put((ev, None, sys.exc_info()))
+
+        def discard():
+            ev, f, exc_info = results.get()
+            if f is not None:
+                f.close()
+            self._finish_event(ev, 'discarded (hedged)')
+
+        def start(target, *args):
+            thread = threading.Thread(target=target, args=args)
+            thread.daemon = True
+            thread.start()
+
+        def new_event():
+            # each attempt gets its own event (the winner is copied
+            # into event)
+            if event is None:
+                return None
+            return copy.copy(event)
+
+        start(run, request, new_event())
+        pending = 0
+        try:
+            ev, f, exc_info = results.get(
+                timeout=self.retry_policy.hedge_after)
+        except Queue.Empty:
+            hedge_event = new_event()
+            if hedge_event is not None:
+                hedge_event.hedged = True
+            start(run, self._copy_request(request), hedge_event)
+            ev, f, exc_info = results.get()
+            pending = 1
+            if exc_info is not None:
+                # wait for the other request
+                self._finish_event(ev, str(exc_info[1]))
+                ev, f, exc_info = results.get()
+                pending = 0
+        if pending:
+            start(discard)
+        if event is not None:
+            event.__dict__.update(ev.__dict__)
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return f
+
+    def _urlopen(self, request, data=None, event=None):
+        method = request.get_method()
+        policy = self.retry_policy
+        retry = (policy is not None
+                 and policy.idempotent(method, request.get_full_url(), data))
+        attempt = 1
+        while True:
+            if event is not None:
+                event.attempt = attempt
+            try:
+                if retry and policy.hedge(method):
+                    return self._hedged_urlopen(request, data, event)
+                return self._urlopen_once(request, data, event)
+            except Exception as e:
+                exc_info = sys.exc_info()
+                orig_exc = e
+                if isinstance(e, Urllib2HTTPError):
+                    orig_exc = e.orig_exc
+                delay = None
+                if retry:
+                    delay = policy.delay(attempt, orig_exc)
+                if delay is None:
+                    self._finish_event(event, str(e))
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                if event is not None:
+                    self._finish_event(copy.copy(event), str(e))
+                    event.status = None
+                if isinstance(orig_exc, urllib2.HTTPError):
+                    orig_exc.close()
+            self._logger.warn("%s %s failed (%s): retrying in %.1fs",
+                              method, request.get_full_url(), e, delay)
+            policy.sleep(delay)
+            attempt += 1
+
+    def _send_request(self, method, path, apiurl, schema, parser, **query):
+        request = self._build_request(method, path, apiurl, **query)
+        self._logger.info(request.get_full_url())
+        event = self._new_event(method, request.get_full_url())
+        f = self._urlopen(request, event=event)
+        f = self._new_response(f, event)
+        self._validate_response(f, schema, parser)
         return f
 
     def _send_data(self, request, data, filename, content_type, schema,
-                   urlencoded):
+                   urlencoded, parser=None):
         self._logger.info(request.get_full_url())
         f = None
         if content_type and urlencoded:
@@ -368,20 +1296,23 @@ class Urllib2HTTPRequest(AbstractHTTPRequest):
                                'application/x-www-form-urlencoded')
         else:
             request.add_header('Content-type', 'application/octet-stream')
-        try:
-            if filename:
-                f = self._send_file(request, filename, urlencoded)
+        event = self._new_event(request.get_method(),
+                                request.get_full_url())
+        if filename:
+            f = self._send_file(request, filename, urlencoded, event)
+        else:
+            if urlencoded:
+                data = urllib.quote_plus(data)
             else:
-                if urlencoded:
-                    data = urllib.quote_plus(data)
-                f = urllib2.urlopen(request, data)
-        except urllib2.HTTPError as e:
-            raise Urllib2HTTPError(e)
-        f = self._new_response(f)
-        self._validate_response(f, schema)
+                data = self._compress(request, data)
+            if event is not None and hasattr(data, '__len__'):
+                event.bytes_out = len(data)
+            f = self._urlopen(request, data, event)
+        f = self._new_response(f, event)
+        self._validate_response(f, schema, parser)
         return f
 
-    def _send_file(self, request, filename, urlencoded):
+    def _send_file(self, request, filename, urlencoded, event=None):
         with open(filename, 'rb') as fobj:
             fsize = os.path.getsize(filename)
             if self._use_mmap and fsize >= self._mmap_fsize and not urlencoded:
@@ -393,7 +1324,11 @@ class Urllib2HTTPRequest(AbstractHTTPRequest):
                 data = fobj.read()
             if urlencoded:
                 data = urllib.quote_plus(data)
-            return urllib2.urlopen(request, data)
+            else:
+                data = self._compress(request, data)
+            if event is not None:
+                event.bytes_out = len(data)
+            return self._urlopen(request, data, event)
 
     def _check_put_post_args(self, data, filename):
         if filename and data is not None:
@@ -401,22 +1336,244 @@ class Urllib2HTTPRequest(AbstractHTTPRequest):
         elif filename and not os.path.isfile(filename):
             raise ValueError("filename %s does not exist" % filename)
 
-    def get(self, path, apiurl='', schema='', **query):
-        return self._send_request('GET', path, apiurl, schema, **query)
+    def get(self, path, apiurl='', schema='', parser=None, **query):
+        return self._send_request('GET', path, apiurl, schema, parser,
+                                  **query)
 
-    def delete(self, path, apiurl='', schema='', **query):
-        return self._send_request('DELETE', path, apiurl, schema, **query)
+    def delete(self, path, apiurl='', schema='', parser=None, **query):
+        return self._send_request('DELETE', path, apiurl, schema, parser,
+                                  **query)
 
     def put(self, path, data=None, filename='', apiurl='', content_type='',
-            schema='', **query):
+            schema='', parser=None, **query):
         self._check_put_post_args(data, filename)
         request = self._build_request('PUT', path, apiurl, **query)
         return self._send_data(request, data, filename, content_type,
-                               schema, False)
+                               schema, False, parser)
 
     def post(self, path, data=None, filename='', apiurl='', content_type='',
-             schema='', urlencoded=False, **query):
+             schema='', urlencoded=False, parser=None, **query):
         self._check_put_post_args(data, filename)
         request = self._build_request('POST', path, apiurl, **query)
         return self._send_data(request, data, filename, content_type,
-                               schema, urlencoded)
+                               schema, urlencoded, parser)
+
+
+def request_xml(request_obj, method, path, parser, **kwargs):
+    """Issues a http request and returns the root of the xml response.
+
+    request_obj is the http request object, method the http method,
+    path the url path and parser the lxml parser which is used to parse
+    the response. If request_obj supports the parser keyword (see
+    AbstractHTTPRequest.PARSER_SUPPORT), a validated response is only
+    parsed once.
+
+    Keyword arguments:
+    kwargs -- parameters for the http request (like query parameters,
+              schema etc.)
+
+    """
+    http_method = getattr(request_obj, method.lower())
+    if getattr(request_obj, 'PARSER_SUPPORT', False):
+        kwargs['parser'] = parser
+    f = http_method(path, **kwargs)
+    if hasattr(f, 'parse'):
+        return f.parse(parser)
+    return fromstring(f.read(), parser=parser)
+
+
+class HTTPFuture(object):
+    """Represents the result of an asynchronous http request."""
+
+    def __init__(self):
+        """Constructs a new HTTPFuture object."""
+        super(HTTPFuture, self).__init__()
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def _finish(self, result=None, exc_info=None):
+        with self._lock:
+            self._result = result
+            self._exc_info = exc_info
+            self._event.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for callback in callbacks:
+            self._call(callback)
+
+    def _call(self, callback):
+        """Calls callback(self).
+
+        An exception, which is raised by the callback, is logged (it
+        must not kill the worker thread which finished the request).
+
+        """
+        try:
+            callback(self)
+        except Exception:
+            logging.getLogger(__name__).exception(
+                "exception in done callback %r", callback)
+
+    def done(self):
+        """Returns True if the request is finished."""
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Returns the result of the request.
+
+        If the request raised an exception, it is reraised.
+        A ValueError is raised if the request is not finished
+        after timeout seconds.
+
+        Keyword arguments:
+        timeout -- the maximum number of seconds to wait (default:
+                   None, that is wait until the request is finished)
+
+        """
+        # do not rely on the return value of wait (it is always None
+        # in python 2.6)
+        self._event.wait(timeout)
+        if not self._event.is_set():
+            raise ValueError("request not finished")
+        if self._exc_info is not None:
+            exc_type, exc_value, tb = self._exc_info
+            raise exc_type, exc_value, tb
+        return self._result
+
+    def exception(self, timeout=None):
+        """Returns the exception of the request or None.
+
+        Keyword arguments:
+        timeout -- see result
+
+        """
+        self._event.wait(timeout)
+        if not self._event.is_set():
+            raise ValueError("request not finished")
+        if self._exc_info is None:
+            return None
+        return self._exc_info[1]
+
+    def add_done_callback(self, callback):
+        """Calls callback(future) when the request is finished.
+
+        If the request is already finished, callback is called
+        immediately.
+
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        self._call(callback)
+
+
+class AsyncHTTPRequest(object):
+    """Issues http requests asynchronously.
+
+    The requests are delegated to a (synchronous) AbstractHTTPRequest
+    object and executed by a bounded pool of worker threads (use
+    keepalive=True for the Urllib2HTTPRequest object in order to reuse
+    the connections). Each method returns a HTTPFuture object.
+
+    Example usage:
+     r = AsyncHTTPRequest(Urllib2HTTPRequest('https://host',
+                                             keepalive=True))
+     futures = [r.aget('/source/%s/_meta' % prj) for prj in projects]
+     metas = [f.result().read() for f in futures]
+
+    """
+
+    def __init__(self, request_obj, workers=8):
+        """Constructs a new AsyncHTTPRequest object.
+
+        request_obj is the AbstractHTTPRequest object which performs
+        the requests.
+
+        Keyword arguments:
+        workers -- the maximum number of concurrent requests
+                   (default: 8)
+
+        """
+        super(AsyncHTTPRequest, self).__init__()
+        self.request_obj = request_obj
+        self._workers = workers
+        self._threads = []
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            # replace dead workers (if any)
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self._workers:
+                thread = threading.Thread(target=self._worker)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, func, args, kwargs, tag = item
+            try:
+                with request_tag(tag):
+                    result = func(*args, **kwargs)
+            except Exception:
+                future._finish(exc_info=sys.exc_info())
+            else:
+                future._finish(result)
+
+    def submit(self, func, *args, **kwargs):
+        """Calls func(*args, **kwargs) in a worker thread.
+
+        A HTTPFuture object is returned.
+
+        """
+        self._start()
+        future = HTTPFuture()
+        tag = current_request_tag()
+        if not tag and self.request_obj.listener:
+            # the caller is not known in the worker thread
+            tag = self.request_obj._caller_tag()
+        self._queue.put((future, func, args, kwargs, tag))
+        return future
+
+    def aget(self, path, **kwargs):
+        """Issues an asynchronous GET request (see AbstractHTTPRequest.get).
+        """
+        return self.submit(self.request_obj.get, path, **kwargs)
+
+    def aput(self, path, **kwargs):
+        """Issues an asynchronous PUT request (see AbstractHTTPRequest.put).
+        """
+        return self.submit(self.request_obj.put, path, **kwargs)
+
+    def apost(self, path, **kwargs):
+        """Issues an asynchronous POST request (see AbstractHTTPRequest.post).
+        """
+        return self.submit(self.request_obj.post, path, **kwargs)
+
+    def adelete(self, path, **kwargs):
+        """Issues an asynchronous DELETE request (see
+        AbstractHTTPRequest.delete).
+
+        """
+        return self.submit(self.request_obj.delete, path, **kwargs)
+
+    def close(self):
+        """Stops the worker threads.
+
+        The already submitted requests are still executed.
+
+        """
+        with self._lock:
+            for thread in self._threads:
+                if thread.is_alive():
+                    self._queue.put(None)
+            self._threads = []
@@ -13,13 +13,15 @@ Example usage:
 
 import logging
 import os
+import Queue
+import threading
 from cStringIO import StringIO
 
 from lxml import etree, objectify
 
 from osc2.core import Osc
-from osc2.httprequest import HTTPError
-from osc2.util.xml import get_parser, fromstring, OscElement
+from osc2.httprequest import HTTPError, request_xml
+from osc2.util.xml import get_parser, fromstring, assert_valid, OscElement
 from osc2.util.io import copy_file, iter_read, mkstemp
 
 __all__ = ['RemoteModel', 'RemoteProject', 'RemotePackage', 'Request',
@@ -120,12 +122,15 @@ class RemoteModel(object):
     """Base class for all remote models"""
 
     def __init__(self, tag='', xml_data='', schema='', store_schema='',
-                 **kwargs):
+                 xml_root=None, **kwargs):
         """Creates a new remote model object.
 
         Keyword arguments:
         tag -- root tag for this model (default: '')
         xml_data -- xml string which represents this model (default: '')
+        xml_root -- an already parsed root element which represents this
+                    model (it has to be parsed with the parser which
+                    is returned by _get_parser) (default: None)
         schema -- path to schema for this model (default: '')
         store_schema -- path to the schema file which is used to validate the
                         response after storing the xml (default: '')
@@ -142,6 +147,8 @@ class RemoteModel(object):
 #            raise ValueError("Either specificy tag or xml_data but not both")
         if xml_data:
             self._read_xml_data(xml_data)
+        elif xml_root is not None:
+            self._xml = xml_root
         elif tag:
             self._xml = self._get_parser().makeelement(tag, **kwargs)
         else:
@@ -151,7 +158,8 @@ class RemoteModel(object):
         parser = self._get_parser()
         self._xml = fromstring(xml_data, parser=parser)
 
-    def _get_parser(self):
+    @classmethod
+    def _get_parser(cls):
         """Returns a parser object which is configured with RemoteModelElement
         as the default tree_class and uses a StringElement for all data
         elements.
@@ -191,13 +199,7 @@ class RemoteModel(object):
         if not self._schema:
             return False
         self._logger.debug("validate modle against schema: %s", self._schema)
-        if self._schema.endswith('.rng'):
-            schema = etree.RelaxNG(file=self._schema)
-        elif self._schema.endswith('.xsd'):
-            schema = etree.XMLSchema(file=self._schema)
-        else:
-            raise ValueError('unsupported schema file')
-        schema.assertValid(self._xml)
+        assert_valid(self._xml, self._schema)
         return True
 
     def store(self, path, method='PUT', **kwargs):
@@ -234,9 +236,23 @@ class RemoteModel(object):
 
         """
         request = Osc.get_osc().get_reqobj()
-        http_method = _get_http_method(request, method)
-        xml_data = http_method(path, **kwargs).read()
-        return cls(xml_data=xml_data)
+        # raises a ValueError if the method is not supported
+        _get_http_method(request, method)
+        xml_root = request_xml(request, method, path, cls._get_parser(),
+                               **kwargs)
+        return cls(xml_root=xml_root)
+
+    @classmethod
+    def afind(cls, *args, **kwargs):
+        """Get the remote model from the server asynchronously.
+
+        *args and **kwargs are the arguments of the find method.
+        A HTTPFuture object is returned whose result is the
+        remote model.
+
+        """
+        request = Osc.get_osc().get_async_reqobj()
+        return request.submit(cls.find, *args, **kwargs)
 
     @classmethod
     def exists(cls, *args, **kwargs):
@@ -351,6 +367,8 @@ class RemotePackage(RemoteModel):
 class Request(RemoteModel):
     GET_PATH = '/request/%(reqid)s'
     SCHEMA = ''
+    # methods which can be passed to change_states
+    STATE_METHODS = ('accept', 'decline', 'revoke', 'supersede')
 
     def __init__(self, **kwargs):
         super(Request, self).__init__(tag='request', schema=Request.SCHEMA,
@@ -392,9 +410,65 @@ class Request(RemoteModel):
                 query[kind] = review.get(kind, '')
         query.update(kwargs)
         request = Osc.get_osc().get_reqobj()
-        request.post(path, **query)
-        f = request.get(path)
-        self._read_xml_data(f.read())
+        f = request.post(path, **query)
+        data = f.read()
+        try:
+            returns_request = etree.fromstring(data).tag == 'request'
+        except etree.XMLSyntaxError:
+            returns_request = False
+        if not returns_request:
+            # the response contains no request - retrieve the new state
+            data = request.get(path).read()
+        self._read_xml_data(data)
+
+    @classmethod
+    def change_states(cls, requests, method, workers=4, **kwargs):
+        """Changes the state of multiple requests concurrently.
+
+        requests is a list of request ids or Request objects (a
+        request id is resolved via Request.find) and method is the
+        name of the state changing method (see STATE_METHODS).
+        A list of (request, error) tuples is returned (in the order
+        of requests): request is the Request object (or the request
+        id, if the request could not be retrieved) and error is the
+        raised exception or None. A ValueError is raised if method
+        is not supported.
+
+        Keyword arguments:
+        workers -- the maximum number of concurrent state changes
+                   (default: 4)
+        **kwargs -- arguments for the state changing method (like
+                    comment)
+
+        """
+        if method not in Request.STATE_METHODS:
+            raise ValueError("unsupported method: %s" % method)
+        queue = Queue.Queue()
+        for i, request in enumerate(requests):
+            queue.put((i, request))
+        results = [None] * queue.qsize()
+
+        def worker():
+            while True:
+                try:
+                    i, request = queue.get_nowait()
+                except Queue.Empty:
+                    break
+                try:
+                    if not hasattr(request, method):
+                        request = cls.find(request)
+                    getattr(request, method)(**kwargs)
+                    results[i] = (request, None)
+                except Exception as e:
+                    results[i] = (request, e)
+
+        threads = [threading.Thread(target=worker)
+                   for i in xrange(max(min(workers, len(results)), 1))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
 
     def add_review(self, **kwargs):
         """Adds a review to the request.
@@ -518,6 +592,9 @@ class RORemoteFile(object):
         self.method = method
         self.kwargs = kwargs
         self._remote_size = -1
+        # True if the decoded size of the remote file is unknown
+        # (for instance, if the response is gzip encoded)
+        self._encoded = False
         self._fobj = None
         self.mtime = None
         try:
@@ -534,6 +611,7 @@ class RORemoteFile(object):
         http_method = _get_http_method(request, self.method)
         self._fobj = http_method(self.path, **self.kwargs)
         self._remote_size = int(self._fobj.headers.get('Content-Length', -1))
+        self._encoded = getattr(self._fobj, 'encoded_length', None) is not None
 
     def _read(self, size=-1):
         """internal method which performs the read.
@@ -574,6 +652,16 @@ class RORemoteFile(object):
         copy_file(self, dest, mtime=self.mtime, mode=self.mode,
                   bufsize=self.stream_bufsize, size=size, read_method='_read')
 
+    def awrite_to(self, dest, size=-1):
+        """Write file to dest asynchronously.
+
+        A HTTPFuture object is returned. For the arguments
+        have a look at the write_to method.
+
+        """
+        request = Osc.get_osc().get_async_reqobj()
+        return request.submit(self.write_to, dest, size=size)
+
     def __iter__(self, size=-1):
         """Iterates over the file"""
         return iter_read(self, bufsize=self.stream_bufsize, size=size)
@@ -603,7 +691,8 @@ class RWRemoteFile(RORemoteFile):
         wb_method -- write back method for the http request (default: PUT)
         wb_path -- path which is used to store the file back (default: path)
         tmp_size -- if the remote file exceeds or equals this size limit a
-                    tmpfile is used
+                    tmpfile is used (a tmpfile is also used if the size
+                    is unknown because the response is encoded)
         use_tmp -- always use a tmpfile (regardless of the tmp_size)
         schema -- filename to xml schema which is used to validate the repsonse
                   after the writeback
@@ -630,7 +719,9 @@ class RWRemoteFile(RORemoteFile):
         read_required = read_required or self.append
         if read_required:
             self._init_read()
-        if self._remote_size >= self.tmp_size or self.use_tmp:
+        # the size of a decoded file is unknown (the encoded length is
+        # no upper bound), so it might be arbitrarily large
+        if self._remote_size >= self.tmp_size or self.use_tmp or self._encoded:
             new_fobj = mkstemp()
         else:
             new_fobj = StringIO()
@@ -7,7 +7,9 @@ Currently only the search for requests is supported.
 from lxml import etree
 
 from osc2.remote import Request, RemoteProject
-from osc2.util.xml import fromstring, OscElement
+from osc2.httprequest import request_xml
+from osc2.util.xml import get_parser, OscElement
+from osc2.util.xpath import XPathBuilder, NaryExpression
 from osc2.core import Osc
 
 
@@ -84,7 +86,7 @@ def _find(path, xp, tag_class={}, **kwargs):
 
     Keyword arguments:
     tag_class -- a dict which maps tag names to classes
-                 (see util.xml.fromstring for the details)
+                 (see util.xml.get_parser for the details)
                  (default: {})
     **kwargs -- optional parameters for the http request
 
@@ -93,8 +95,8 @@ def _find(path, xp, tag_class={}, **kwargs):
     xpath = xp
     if hasattr(xp, 'tostring'):
         xpath = xp.tostring()
-    f = request.get(path, match=xpath, **kwargs)
-    return fromstring(f.read(), **tag_class)
+    return request_xml(request, 'GET', path, get_parser(**tag_class),
+                       match=xpath, **kwargs)
 
 
 def find_request(xp, **kwargs):
@@ -114,6 +116,153 @@ def find_request(xp, **kwargs):
     return _find(path, xp, tag_class, **kwargs)
 
 
+class RequestQuery(object):
+    """Plans a request search.
+
+    All filters are combined into a single xpath, that is the search
+    results need no additional filtering. Duplicate values are ignored
+    and a condition is only parenthesized if it consists of more than
+    one term.
+
+    """
+
+    def __init__(self, states=None, types=None, who=None, project=None,
+                 package=None, source=True, history=False,
+                 full_history=False):
+        """Constructs a new RequestQuery object.
+
+        Keyword arguments:
+        states -- a list of request states (default: None)
+        types -- a list of action types (default: None)
+        who -- only requests which were created or changed by this user
+               (default: None)
+        project -- the target project (default: None)
+        package -- the target package (default: None)
+        source -- if True, project and package also match the source
+                  of an action (default: True)
+        history -- if True, the history is requested (default: False)
+        full_history -- if True, the full history (including the
+                        review history) is requested (default: False)
+
+        """
+        super(RequestQuery, self).__init__()
+        self.states = self._unique(states)
+        self.types = self._unique(types)
+        self.who = who
+        self.project = project
+        self.package = package
+        self.source = source
+        self.history = history
+        self.full_history = full_history
+        self._reviews = []
+
+    @staticmethod
+    def _unique(values):
+        """Returns a list of the values without duplicates."""
+        unique = []
+        for value in values or []:
+            if value not in unique:
+                unique.append(value)
+        return unique
+
+    def review(self, states=None, **kwargs):
+        """Adds a review filter.
+
+        A request matches if it has a review with one of the states
+        and all by_ attributes which are passed via kwargs (a by_
+        attribute whose value is None is ignored). Multiple review
+        filters are connected via "or".
+
+        Keyword arguments:
+        states -- a list of review states (default: None)
+        by_user, by_group, by_project, by_package -- the review's
+                                                     by_ attributes
+
+        """
+        by = tuple(sorted([(k, v) for k, v in kwargs.iteritems()
+                           if v is not None]))
+        review = (by, tuple(self._unique(states)))
+        if review not in self._reviews:
+            self._reviews.append(review)
+
+    @staticmethod
+    def _parenthesize(expr):
+        """Parenthesizes expr if it consists of more than one term."""
+        if isinstance(expr, NaryExpression):
+            return expr.parenthesize()
+        return expr
+
+    def _any(self, xpb, attr, values):
+        """Returns an expression which matches one of the values.
+
+        attr is a callable which returns the attribute expression.
+
+        """
+        return self._parenthesize(xpb.log_or(*[attr() == value
+                                               for value in values]))
+
+    def _review(self, xpb, by, states):
+        """Returns the expression for a single review filter."""
+        preds = [xpb.attr(k) == v for k, v in by]
+        preds.append(self._any(xpb, lambda: xpb.attr('state'), states))
+        pred = xpb.log_and(*preds)
+        if not pred:
+            return xpb.review
+        return xpb.review[pred]
+
+    def xpath(self):
+        """Returns the xpath expression.
+
+        If no filter was specified, a DummyExpression is returned.
+
+        """
+        xpb = XPathBuilder(is_relative=True)
+        preds = [self._any(xpb, lambda: xpb.state.attr('name'), self.states),
+                 self._any(xpb, lambda: xpb.action.attr('type'), self.types)]
+        if self.who is not None:
+            pred = ((xpb.state.attr('who') == self.who)
+                    | (xpb.history.attr('who') == self.who))
+            preds.append(pred.parenthesize())
+        for attr, value in (('project', self.project),
+                            ('package', self.package)):
+            if value is None:
+                continue
+            pred = xpb.action.target.attr(attr) == value
+            if self.source:
+                pred = (pred | (xpb.action.source.attr(attr) == value))
+                pred = pred.parenthesize()
+            preds.append(pred)
+        reviews = [self._review(xpb, by, states)
+                   for by, states in self._reviews]
+        preds.append(self._parenthesize(xpb.log_or(*reviews)))
+        return xpb.log_and(*preds)
+
+    def params(self):
+        """Returns a dict with the additional query parameters."""
+        params = {}
+        if self.history:
+            params['withhistory'] = '1'
+        if self.full_history:
+            params['withfullhistory'] = '1'
+        return params
+
+    def find(self, **kwargs):
+        """Returns a list of Request objects which match the query.
+
+        A ValueError is raised if no filter was specified.
+
+        Keyword arguments:
+        **kwargs -- optional parameters for the http request
+
+        """
+        xp = self.xpath()
+        if not xp:
+            raise ValueError("at least one filter is required")
+        query = self.params()
+        query.update(kwargs)
+        return [r for r in find_request(xp, **query)]
+
+
 def find_project(xp, **kwargs):
     """Returns a ProjectCollection with objects which match the xpath.
 
@@ -1,8 +1,9 @@
 """Provides classes to access the source
 route"""
 
-from osc2.util.xml import fromstring, OscElement
+from osc2.util.xml import get_parser, OscElement
 from osc2.remote import RORemoteFile
+from osc2.httprequest import request_xml
 from osc2.core import Osc
 
 
@@ -77,8 +78,7 @@ class Project(object):
         path = '/source/' + self.name
         if 'schema' not in kwargs:
             kwargs['schema'] = Project.LIST_SCHEMA
-        f = request.get(path, **kwargs)
-        entries = fromstring(f.read())
+        entries = request_xml(request, 'GET', path, get_parser(), **kwargs)
         r = []
         # using an xml representation for the <entry /> makes no
         # sense
@@ -117,9 +117,9 @@ class Package(object):
         path = "/source/%s/%s" % (self.project, self.name)
         if 'schema' not in kwargs:
             kwargs['schema'] = Package.LIST_SCHEMA
-        f = request.get(path, **kwargs)
-        directory = fromstring(f.read(), directory=Directory, entry=File,
-                               linkinfo=Linkinfo)
+        parser = get_parser(directory=Directory, entry=File,
+                            linkinfo=Linkinfo)
+        directory = request_xml(request, 'GET', path, parser, **kwargs)
         # this is needed by the file class
         directory.set('project', self.project)
         return directory
@@ -135,5 +135,4 @@ class Package(object):
         path = "/source/%s/%s/_history" % (self.project, self.name)
         if 'schema' not in kwargs:
             kwargs['schema'] = Package.HISTORY_SCHEMA
-        f = request.get(path, **kwargs)
-        return fromstring(f.read())
+        return request_xml(request, 'GET', path, get_parser(), **kwargs)
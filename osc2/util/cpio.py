@@ -1,12 +1,20 @@
 """This module provides classes to read and write a cpio archive."""
 
 import os
+import sys
 import mmap
+import stat
+import Queue
+import hashlib
+import marshal
+import threading
 from struct import pack, unpack
+from binascii import unhexlify
 from collections import namedtuple
 from cStringIO import StringIO
 
-from osc2.util.io import copy_file, iter_read
+from osc2.util.io import copy_file, iter_read, mkstemp
+from osc2.util.notify import Notifier
 
 
 TRAILER = 'TRAILER!!!'
@@ -53,12 +61,14 @@ class FileWrapper(object):
         elif fobj is not None and use_mmap:
             raise ValueError('fobj and mmap are not supported')
 
+        self._mmap = False
         if filename:
             self._close = True
             self._fobj = open(filename, mode)
             if use_mmap:
                 self._fobj = mmap.mmap(self._fobj.fileno(), 0,
                                        prot=mmap.PROT_READ)
+                self._mmap = True
         elif fobj is not None:
             self._close = False
             self._fobj = fobj
@@ -70,6 +80,10 @@ class FileWrapper(object):
         seek = getattr(self._fobj, 'seek', None)
         return seek is not None
 
+    def is_mmapped(self):
+        """Returns True if the underlying file is mmap'ed."""
+        return self._mmap
+
     def read(self, num=-1):
         """Read num bytes.
 
@@ -92,6 +106,28 @@ class FileWrapper(object):
         self._pos += len(data)
         return data
 
+    def read_buffer(self, num=-1):
+        """Read num bytes and return them as a read-only buffer.
+
+        If the file is mmap'ed, the returned buffer references the
+        mmap'ed data, that is no copy is made (the buffer must not be
+        used after the FileWrapper is closed). Otherwise it is
+        identical to the read method.
+
+        Keyword arguments:
+        num -- the number of bytes to be read (default: -1)
+
+        """
+        if not self._mmap or self._peek_data:
+            return self.read(num)
+        start = self._fobj.tell()
+        end = len(self._fobj)
+        if num >= 0:
+            end = min(start + num, end)
+        self._fobj.seek(end)
+        self._pos += end - start
+        return buffer(self._fobj, start, end - start)
+
     def peek(self, num):
         """Peeks num bytes from the file.
 
@@ -196,6 +232,22 @@ class CpioFile(CpioEntity):
         num -- the number of bytes to be read (default: -1)
 
         """
+        return self._read(num, self._fobj.read)
+
+    def read_buffer(self, num=-1):
+        """Read num bytes and return them as a read-only buffer.
+
+        If the archive is mmap'ed, no copy of the data is made
+        (see FileWrapper.read_buffer).
+
+        Keyword arguments:
+        num -- the number of bytes to be read (default: -1)
+
+        """
+        return self._read(num, self._fobj.read_buffer)
+
+    def _read(self, num, read):
+        """Read num bytes via the read callable."""
         offset = self.hdr._offset
         filesize = self.hdr.filesize
         if num > filesize - self._bytes_read or num == -1:
@@ -206,7 +258,7 @@ class CpioFile(CpioEntity):
         pos = self._fobj.tell()
         if pos < offset or pos > offset + self.hdr.filesize:
             self._fobj.seek(offset + self._bytes_read)
-        data = self._fobj.read(num)
+        data = read(num)
         self._bytes_read += len(data)
         return data
 
@@ -221,7 +273,47 @@ class CpioFile(CpioEntity):
         if not hasattr(dest, 'write'):
             # no file-like object
             dest = os.path.join(dest, self.hdr.name)
-        copy_file(self, dest, mode=self.hdr.mode, mtime=self.hdr.mtime)
+        self._copy(dest)
+
+    def _copy(self, dest):
+        """Copies the file to dest (a filename or file-like object)."""
+        kwargs = {}
+        if self._fobj.is_mmapped():
+            # write the remaining data with a single write call (there
+            # is no need to read it in chunks)
+            kwargs['bufsize'] = max(self.hdr.filesize - self._bytes_read, 1)
+        copy_file(self, dest, mode=self.hdr.mode, mtime=self.hdr.mtime,
+                  read_method='read_buffer', **kwargs)
+
+
+class CrcCpioFile(CpioFile):
+    """Represents a regular file in a cpio archive with checksums.
+
+    The checksum is computed while the file is read. A CpioError is
+    raised by the read which reaches the end of the file if the
+    checksum does not match the header's checksum.
+
+    """
+
+    def __init__(self, fobj, hdr):
+        super(CrcCpioFile, self).__init__(fobj, hdr)
+        self._chksum = 0
+
+    def _read(self, num, read):
+        data = super(CrcCpioFile, self)._read(num, read)
+        if data:
+            self._chksum += sum(bytearray(data))
+            if self._bytes_read == self.hdr.filesize:
+                self._verify()
+        return data
+
+    def _verify(self):
+        """Compares the computed and the header's checksum."""
+        chksum = self._chksum & 0xFFFFFFFF
+        if chksum != self.hdr.chksum:
+            msg = ("checksum mismatch for file \'%s\' (expected: %08X, "
+                   "got: %08X)" % (self.hdr.name, self.hdr.chksum, chksum))
+            raise CpioError(msg)
 
 
 class CpioHeader(object):
@@ -264,6 +356,8 @@ class CpioHeader(object):
 
 class ArchiveReader(object):
     """Base class for the cpio format specific readers."""
+    # class which is used to represent a file of the archive
+    FILE_CLASS = CpioFile
 
     def __init__(self, fobj, magic):
         """Constructs a new ArchiveReader object.
@@ -348,8 +442,12 @@ class ArchiveWriter(object):
         self._append_trailer()
         pad = IO_BLOCK_SIZE - (self._bytes_written % IO_BLOCK_SIZE)
         if pad > 0:
-            self._fobj.write('\0' * pad)
-            self._bytes_written += pad
+            self._write('\0' * pad)
+
+    def _write(self, data):
+        """Writes data to the archive."""
+        self._fobj.write(data)
+        self._bytes_written += len(data)
 
     def _write_header(self, hdr, source):
         """Writes the header.
@@ -389,13 +487,19 @@ class NewAsciiReader(ArchiveReader):
 
     """
 
-    def __init__(self, fobj):
+    def __init__(self, fobj, magic=None):
         """Constructs a new NewAsciiReader object.
 
         fobj is a FileWrapper instance.
 
+        Keyword arguments:
+        magic -- the archive magic (default: None, that is
+                 NewAsciiFormat.MAGIC)
+
         """
-        super(NewAsciiReader, self).__init__(fobj, NewAsciiFormat.MAGIC)
+        if magic is None:
+            magic = NewAsciiFormat.MAGIC
+        super(NewAsciiReader, self).__init__(fobj, magic)
 
     def next_header(self):
         if self.trailer_seen:
@@ -410,7 +514,7 @@ class NewAsciiReader(ArchiveReader):
         hdr = self.next_header()
         if hdr is None:
             return None
-        return CpioFile(self._fobj, hdr)
+        return self.FILE_CLASS(self._fobj, hdr)
 
     def _read_header(self):
         """Returns the newly read header.
@@ -424,8 +528,12 @@ class NewAsciiReader(ArchiveReader):
             msg = ("premature end of file (expected at least \'%d\' bytes)"
                    % NewAsciiFormat.LEN)
             raise CpioError(msg)
-        data = unpack(NewAsciiFormat.FORMAT, data)
-        hdr = CpioHeader(data[0], data[1:])
+        magic, data = NewAsciiFormat.decode_header(data)
+        if magic != self.magic:
+            msg = ("invalid header magic: \'%s\' (expected: \'%s\')"
+                   % (magic, self.magic))
+            raise CpioError(msg)
+        hdr = CpioHeader(magic, data, no_convert=True)
         # read filename
         data = self._fobj.read(hdr.namesize)
         # ignore trailing '\0'
@@ -457,6 +565,25 @@ class NewAsciiReader(ArchiveReader):
         self._next_header_pos = pos
 
 
+class NewCrcReader(NewAsciiReader):
+    """This class can read the new crc format.
+
+    "New" portable format with checksums: magic 070702
+    The checksum of each file is verified while the file is read
+    (see class CrcCpioFile).
+
+    """
+    FILE_CLASS = CrcCpioFile
+
+    def __init__(self, fobj):
+        """Constructs a new NewCrcReader object.
+
+        fobj is a FileWrapper instance.
+
+        """
+        super(NewCrcReader, self).__init__(fobj, NewAsciiFormat.CRC_MAGIC)
+
+
 class NewAsciiWriter(ArchiveWriter):
     """This class can write the new ascii format.
 
@@ -515,31 +642,254 @@ class NewAsciiWriter(ArchiveWriter):
         a file or file-like object which represents the file.
 
         """
+        self._write_entry_start(hdr)
+        for data in iter_read(source):
+            self._write(data)
+        self._write_entry_end(hdr)
+
+    def _write_entry_start(self, hdr):
+        """Writes the header, the filename and the padding."""
         packed_hdr = pack(NewAsciiFormat.FORMAT, *hdr)
-        self._fobj.write(packed_hdr)
-        self._fobj.write(hdr.name + '\0')
-        # write padding
         offset = NewAsciiFormat.LEN + hdr.namesize
         pad = NewAsciiFormat.calculate_padding(offset)
+        self._write(packed_hdr)
+        self._write(hdr.name + '\0')
         if pad > 0:
-            self._fobj.write('\0' * pad)
-            self._bytes_written += pad
-        for data in iter_read(source):
-            self._fobj.write(data)
-        # write padding
+            self._write('\0' * pad)
+
+    def _write_entry_end(self, hdr):
+        """Writes the padding after the file contents."""
         pad = NewAsciiFormat.calculate_padding(hdr.filesize)
         if pad > 0:
-            self._fobj.write('\0' * pad)
-            self._bytes_written += pad
-        self._bytes_written += NewAsciiFormat.LEN + hdr.namesize + hdr.filesize
+            self._write('\0' * pad)
+
+
+class PipelinedNewAsciiWriter(NewAsciiWriter):
+    """Writes the new ascii format with pipelined source reads.
+
+    The appended files are read by a background thread, while the
+    archive is written in chunks of bufsize bytes (a multiple of
+    IO_BLOCK_SIZE). Optionally, a digest of each file is computed
+    while it is read. This writer is intended for large archives
+    (many or large files).
+    Note: the archive is only complete after copyout was called and
+    errors, which occur while a file is read, are raised by a
+    subsequent append or copyout call. After such an error the
+    archive is incomplete and each further append or copyout call
+    raises the error again.
+
+    """
+
+    def __init__(self, fobj, bufsize=1024 * 1024, readahead=16,
+                 digest=None):
+        """Constructs a new PipelinedNewAsciiWriter object.
+
+        fobj is a file or file-like object. A ValueError is raised
+        if bufsize is no multiple of IO_BLOCK_SIZE or if digest is
+        no supported hash algorithm.
+
+        Keyword arguments:
+        bufsize -- the size of each read and write request
+                   (default: 1 MiB)
+        readahead -- the maximum number of chunks which are read ahead
+                     (default: 16)
+        digest -- name of a hashlib algorithm (for instance 'md5');
+                  the hexdigests are stored in the digests dict
+                  (default: None)
+
+        """
+        global IO_BLOCK_SIZE
+        super(PipelinedNewAsciiWriter, self).__init__(fobj)
+        if bufsize <= 0 or bufsize % IO_BLOCK_SIZE:
+            msg = "bufsize must be a multiple of %d" % IO_BLOCK_SIZE
+            raise ValueError(msg)
+        if digest is not None:
+            # raises a ValueError if the algorithm is not supported
+            hashlib.new(digest)
+        self._bufsize = bufsize
+        self._digest = digest
+        self.digests = {}
+        self._buf = []
+        self._buflen = 0
+        self._requests = Queue.Queue()
+        self._chunks = Queue.Queue(readahead)
+        self._pending = 0
+        # header of the file which is currently written
+        self._hdr = None
+        self._reader = None
+        # exc_info of the first read error (the writer failed)
+        self._error = None
+
+    def append(self, filename, fobj=None):
+        # write the chunks of the previously appended files (raises
+        # a pending read error)
+        self._process_chunks(block=False)
+        data = None
+        if fobj is not None:
+            # read it now (the caller might close fobj afterwards)
+            data = fobj.read()
+        if self._reader is None:
+            self._reader = threading.Thread(target=self._read_sources)
+            # do not block the interpreter exit if copyout is not called
+            self._reader.daemon = True
+            self._reader.start()
+        self._requests.put((filename, data))
+        self._pending += 1
+
+    def copyout(self):
+        self._raise_error()
+        if self._reader is not None:
+            self._requests.put(None)
+            self._process_chunks(block=True)
+            self._reader.join()
+            self._reader = None
+        super(PipelinedNewAsciiWriter, self).copyout()
+        self._flush()
+
+    def _read_sources(self):
+        """Reads the requested sources (runs in the background thread).
+
+        For each file, a ('hdr', hdr) tuple, ('data', chunk) tuples
+        and a ('end', hexdigest) tuple are put into the chunk queue.
+        If an error occurs, an ('error', exc_info) tuple is put into
+        the queue and the thread terminates.
+
+        """
+        while True:
+            request = self._requests.get()
+            if request is None:
+                break
+            filename, data = request
+            try:
+                self._read_source(filename, data)
+            except Exception:
+                self._chunks.put(('error', sys.exc_info()))
+                break
+
+    def _read_source(self, filename, data):
+        """Reads a single source and puts its chunks into the queue."""
+        if isinstance(filename, unicode):
+            # the buffered data is joined (so the name has to be a str)
+            filename = filename.encode(sys.getfilesystemencoding())
+        digest = None
+        if self._digest is not None:
+            digest = hashlib.new(self._digest)
+        if data is not None:
+            st = self._create_dummy_stat(0, 33188, 0, 0, 1, os.geteuid(),
+                                         os.getegid(), len(data), 0)
+            self._chunks.put(('hdr', self._create_header(st, filename)))
+            for i in xrange(0, len(data), self._bufsize):
+                chunk = data[i:i + self._bufsize]
+                if digest is not None:
+                    digest.update(chunk)
+                self._chunks.put(('data', chunk))
+        else:
+            with open(filename, 'rb') as f:
+                st = os.fstat(f.fileno())
+                hdr = self._create_header(st, os.path.basename(filename))
+                self._chunks.put(('hdr', hdr))
+                size = 0
+                for chunk in iter_read(f, bufsize=self._bufsize,
+                                       size=st.st_size):
+                    if digest is not None:
+                        digest.update(chunk)
+                    size += len(chunk)
+                    self._chunks.put(('data', chunk))
+                if size != st.st_size:
+                    msg = "file \"%s\" was modified while reading" % filename
+                    raise CpioError(msg)
+        hexdigest = None
+        if digest is not None:
+            hexdigest = digest.hexdigest()
+        self._chunks.put(('end', hexdigest))
+
+    def _process_chunks(self, block):
+        """Writes the chunks from the queue to the archive.
+
+        If block is True, the method returns after all pending files
+        were written. Otherwise it returns if no chunk is available.
+        If a file could not be read, the writer fails: the read error
+        is raised (now and by all subsequent calls) and the remaining
+        requests and chunks are discarded.
+
+        """
+        self._raise_error()
+        while self._pending:
+            try:
+                kind, item = self._chunks.get(block)
+            except Queue.Empty:
+                break
+            if kind == 'hdr':
+                self._hdr = item
+                self._write_entry_start(item)
+            elif kind == 'data':
+                self._write(item)
+            elif kind == 'end':
+                self._write_entry_end(self._hdr)
+                if item is not None:
+                    self.digests[self._hdr.name] = item
+                self._pending -= 1
+            else:
+                # the reader thread terminated
+                self._error = item
+                self._pending = 0
+                self._reader = None
+                self._hdr = None
+                self._requests = None
+                self._chunks = None
+                self._raise_error()
+
+    def _raise_error(self):
+        """Raises the read error if the writer failed."""
+        if self._error is not None:
+            exc_type, exc_value, tb = self._error
+            raise exc_type, exc_value, tb
+
+    def _write(self, data):
+        """Buffers data and writes it in chunks of bufsize bytes."""
+        self._buf.append(data)
+        self._buflen += len(data)
+        self._bytes_written += len(data)
+        if self._buflen >= self._bufsize:
+            data = ''.join(self._buf)
+            end = self._buflen - self._buflen % self._bufsize
+            self._fobj.write(buffer(data, 0, end))
+            self._buf = [data[end:]]
+            self._buflen -= end
+
+    def _flush(self):
+        """Writes the buffered data."""
+        self._fobj.write(''.join(self._buf))
+        self._buf = []
+        self._buflen = 0
 
 
 class NewAsciiFormat(object):
     """Provides static methods and class attributes for the new ascii format"""
     MAGIC = '070701'
+    # the new ascii format with checksums
+    CRC_MAGIC = '070702'
     # format and length of the "struct new_ascii_header" (see src/cpiohdr.h)
     FORMAT = '6s8s8s8s8s8s8s8s8s8s8s8s8s8s'
     LEN = 110
+    # format of the unhexlified header fields (excluding the magic)
+    BINARY_FORMAT = '>13I'
+
+    @staticmethod
+    def decode_header(data):
+        """Decodes the raw header data.
+
+        Returns a (magic, fields) tuple, where fields is a tuple of
+        ints (the order corresponds to CpioHeader.ENTRIES). All 13
+        hexadecimal fields are decoded at once.
+        A CpioError is raised if a field is no hexadecimal number.
+
+        """
+        try:
+            fields = unpack(NewAsciiFormat.BINARY_FORMAT, unhexlify(data[6:]))
+        except TypeError:
+            raise CpioError('invalid header: no hexadecimal fields')
+        return (data[:6], fields)
 
     @staticmethod
     def calculate_padding(offset):
@@ -547,37 +897,80 @@ class NewAsciiFormat(object):
         return (4 - (offset % 4)) % 4
 
 
+class ExtractListener(object):
+    """Notifies a client about the extraction of an archive."""
+
+    def extracted(self, hdr, filename):
+        """This method is called after a file was extracted.
+
+        hdr is the CpioHeader of the file and filename is the path
+        to the extracted file. The calls are serialized (even if
+        the archive is extracted by multiple threads).
+
+        """
+        raise NotImplementedError()
+
+
+class ExtractNotifier(Notifier):
+    """Notifies all registered ExtractListener."""
+
+    def extracted(self, *args, **kwargs):
+        self._notify('extracted', *args, **kwargs)
+
+
 class CpioArchive(object):
     """The main interface to all cpio classes.
 
     Most users should use this class.
     Currently only reading is supported.
 
+    If the archive is seekable, an index (filename => CpioFile) is
+    built on the first lookup by reading the headers only (the file
+    contents are skipped). Optionally, the index can be stored in a
+    sidecar file, which is used by subsequent CpioArchive instances
+    (if the archive was not modified in the meantime).
+
     """
-    DEFAULT_READERS = {'070701': NewAsciiReader}
+    DEFAULT_READERS = {'070701': NewAsciiReader, '070702': NewCrcReader}
+    # version of the sidecar index file format
+    INDEX_VERSION = 1
 
-    def __init__(self, filename=None, fobj=None, use_mmap=False, **readers):
+    def __init__(self, filename=None, fobj=None, use_mmap=False,
+                 index_file=None, **readers):
         """Constructs a new CpioArchive object.
 
         Either filename or fobj has to be specified but not
-        both.
+        both. A ValueError is raised if index_file is specified
+        without a filename.
 
         Keyword arguments:
         filename -- a filename (default: '')
         fobj -- a file or file-like object (default: None)
         use_mmap -- if a filename is passed the file will be mmap'ed
                     (default: False)
+        index_file -- path to the sidecar index file; it is
+                      written if it does not exist or is out of date
+                      (default: None)
         **readers -- user specified archive readers
                      (a "magic" => "reader_class" mapping)
 
         """
+        if index_file is not None and not filename:
+            raise ValueError('index_file requires a filename')
         self._fobj = FileWrapper(filename=filename, fobj=fobj,
                                  use_mmap=use_mmap)
+        self._filename = filename
+        self._index_file = index_file
         self._files = []
+        # only used if the index was read from the sidecar file
+        self._entries = None
+        self._index = None
         self._reader = None
         self._readers = CpioArchive.DEFAULT_READERS.copy()
         self._readers.update(readers)
         self._init_reader()
+        if index_file is not None:
+            self._read_index()
 
     def _init_reader(self):
         """Initialize the archive reader based on the archive's magic.
@@ -592,6 +985,93 @@ class CpioArchive(object):
             raise ValueError("magic: \'%s\' is not supported" % self.magic)
         self._reader = reader_class(self._fobj)
 
+    def _archive_stat(self):
+        """Returns a (size, mtime) tuple of the archive file."""
+        st = os.stat(self._filename)
+        return (st.st_size, st.st_mtime)
+
+    def _read_index(self):
+        """Reads the sidecar index file.
+
+        Nothing is done if the index file does not exist, is corrupt
+        or does not belong to the archive (in this case it is rewritten
+        when the index is built).
+
+        """
+        try:
+            with open(self._index_file, 'rb') as f:
+                data = marshal.load(f)
+            version, archive_stat, magic, entries = data
+        except (IOError, EOFError, ValueError, TypeError):
+            return
+        if (version != CpioArchive.INDEX_VERSION or magic != self.magic
+                or archive_stat != self._archive_stat()):
+            return
+        # the CpioFile objects are created on demand (see _file)
+        self._entries = entries
+        self._files = [None] * len(entries)
+        # consume the peek'ed magic (otherwise the FileWrapper cannot seek)
+        self._fobj.read(len(self.magic))
+        # all headers are known
+        self._reader.trailer_seen = True
+        index = {}
+        for i in xrange(len(entries) - 1, -1, -1):
+            index[entries[i][0]] = i
+        self._index = index
+
+    def _file(self, i):
+        """Returns the i-th CpioFile of the archive."""
+        archive_file = self._files[i]
+        if archive_file is None:
+            name, offset, hdr_data = self._entries[i]
+            hdr = CpioHeader(self.magic, hdr_data, no_convert=True)
+            hdr.name = name
+            hdr._offset = offset
+            archive_file = self._reader.FILE_CLASS(self._fobj, hdr)
+            self._files[i] = archive_file
+        return archive_file
+
+    def _write_index(self):
+        """Writes the sidecar index file."""
+        entries = []
+        for archive_file in self._files:
+            hdr = archive_file.hdr
+            hdr_data = tuple([getattr(hdr, entry)
+                              for entry in CpioHeader.ENTRIES])
+            entries.append((hdr.name, hdr._offset, hdr_data))
+        data = (CpioArchive.INDEX_VERSION, self._archive_stat(), self.magic,
+                entries)
+        dirname = os.path.dirname(os.path.abspath(self._index_file))
+        tmpfile = mkstemp(dir=dirname, delete=False)
+        try:
+            tmpfile.write(marshal.dumps(data))
+        finally:
+            tmpfile.close()
+        os.rename(tmpfile, self._index_file)
+
+    def _build_index(self):
+        """Returns the filename => position index.
+
+        The index is only built if the archive is seekable (None is
+        returned otherwise).
+
+        """
+        if self._index is not None:
+            return self._index
+        if not self._fobj.is_seekable():
+            return None
+        index = {}
+        for i, archive_file in enumerate(self):
+            # the first file wins (like in a linear search)
+            index.setdefault(archive_file.hdr.name, i)
+        self._index = index
+        # write the index unless it was read from the sidecar file
+        # (self._entries is set in this case)
+        if (self._index_file is not None and self._entries is None
+                and self._reader.trailer_seen):
+            self._write_index()
+        return self._index
+
     def files(self):
         """Returns a list which contains all files of the cpio archive."""
         return list(self)
@@ -606,11 +1086,197 @@ class CpioArchive(object):
         Otherwise None is returned.
 
         """
+        index = self._build_index()
+        if index is not None:
+            i = index.get(filename)
+            if i is None:
+                return None
+            return self._file(i)
         for archive_file in self:
             if archive_file.hdr.name == filename:
                 return archive_file
         return None
 
+    def extractall(self, dest, workers=1, listener=None):
+        """Extracts all files of the archive to the directory dest.
+
+        The mode and mtime of each file are preserved (see
+        CpioFile.copyin). Directory entries are created (their mode
+        and mtime are set after all files were extracted) and missing
+        parent directories are created as well. If the archive is
+        seekable and was opened via a filename, the files are
+        extracted by workers threads (each thread reads from its own
+        file object). If an archive contains a filename more than
+        once, the last file wins.
+        A ValueError is raised if dest is no directory. A CpioError
+        is raised if a filename is absolute or refers to a path
+        outside of dest (for instance, "../foo") or if an entry is
+        neither a regular file nor a directory (for instance, a
+        symlink). If the archive is seekable, all entries are checked
+        before anything is extracted (otherwise, each entry is checked
+        before it is extracted).
+
+        Keyword arguments:
+        workers -- the number of extraction threads (default: 1)
+        listener -- list of ExtractListener instances (default: [])
+
+        """
+        if not os.path.isdir(dest):
+            raise ValueError("dest \"%s\" is no directory" % dest)
+        if listener is None:
+            listener = []
+        notifier = ExtractNotifier(listener)
+        parallel = (workers > 1 and self._filename
+                    and self._build_index() is not None)
+        dirs = []
+        if not parallel and not self._fobj.is_seekable():
+            # the archive can be read only once
+            for archive_file in self:
+                self._check_entry(dest, archive_file.hdr)
+                self._extract(dest, archive_file, notifier, dirs)
+            self._finish_dirs(dest, dirs)
+            return
+        last = {}
+        for archive_file in self:
+            # check all entries before anything is extracted
+            self._check_entry(dest, archive_file.hdr)
+            last[archive_file.hdr.name] = archive_file.hdr
+        if not parallel:
+            for archive_file in self:
+                self._extract(dest, archive_file, notifier, dirs)
+            self._finish_dirs(dest, dirs)
+            return
+        queue = Queue.Queue()
+        for archive_file in self:
+            hdr = archive_file.hdr
+            if stat.S_ISDIR(hdr.mode):
+                # the directories are created before the workers start
+                self._extract(dest, archive_file, notifier, dirs)
+            elif last[hdr.name] is hdr:
+                queue.put(hdr)
+        lock = threading.Lock()
+        errors = []
+        threads = []
+        for i in xrange(min(workers, queue.qsize())):
+            thread = threading.Thread(target=self._extract_worker,
+                                      args=(dest, queue, notifier, lock,
+                                            errors))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if errors:
+            exc_type, exc_value, tb = errors[0]
+            raise exc_type, exc_value, tb
+        self._finish_dirs(dest, dirs)
+
+    @staticmethod
+    def _extract_path(dest, name):
+        """Returns the path of the archive member name in dest.
+
+        A CpioError is raised if name is absolute or if the
+        normalized path is not located in dest.
+
+        """
+        path = os.path.normpath(name)
+        if (os.path.isabs(path) or path == os.curdir or path == os.pardir
+                or path.startswith(os.pardir + os.sep)):
+            raise CpioError("invalid filename \"%s\"" % name)
+        return os.path.join(dest, path)
+
+    @staticmethod
+    def _check_entry(dest, hdr):
+        """Checks if the entry, which is described by hdr, can be extracted.
+
+        A CpioError is raised if the entry's name is invalid (see
+        _extract_path) or if it is neither a regular file nor a
+        directory.
+
+        """
+        CpioArchive._extract_path(dest, hdr.name)
+        if not stat.S_ISREG(hdr.mode) and not stat.S_ISDIR(hdr.mode):
+            msg = "unsupported file type of \"%s\" (mode: %o)"
+            raise CpioError(msg % (hdr.name, hdr.mode))
+
+    @staticmethod
+    def _makedirs(path):
+        """Creates the directory path (and all missing parents).
+
+        Nothing is done if the directory already exists (it might
+        be created concurrently by another extraction thread).
+
+        """
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+
+    def _extract(self, dest, archive_file, notifier, dirs):
+        """Extracts archive_file to dest.
+
+        The headers of extracted directories are appended to
+        the dirs list (see _finish_dirs).
+
+        """
+        hdr = archive_file.hdr
+        path = self._extract_path(dest, hdr.name)
+        if stat.S_ISDIR(hdr.mode):
+            self._makedirs(path)
+            dirs.append(hdr)
+        else:
+            self._makedirs(os.path.dirname(path))
+            archive_file._copy(path)
+        notifier.extracted(hdr, path)
+
+    def _finish_dirs(self, dest, dirs):
+        """Sets the mode and mtime of the extracted directories."""
+        # the innermost directories first
+        for hdr in reversed(dirs):
+            path = self._extract_path(dest, hdr.name)
+            os.chmod(path, stat.S_IMODE(hdr.mode))
+            os.utime(path, (-1, hdr.mtime))
+
+    def _extract_worker(self, dest, queue, notifier, lock, errors):
+        """Extracts the files (headers) from the queue.
+
+        The first exception is appended to the errors list
+        (all workers stop afterwards).
+
+        """
+        fobj = FileWrapper(filename=self._filename,
+                           use_mmap=self._fobj.is_mmapped())
+        try:
+            while not errors:
+                try:
+                    hdr = queue.get_nowait()
+                except Queue.Empty:
+                    break
+                path = self._extract_path(dest, hdr.name)
+                self._makedirs(os.path.dirname(path))
+                self._reader.FILE_CLASS(fobj, hdr)._copy(path)
+                with lock:
+                    notifier.extracted(hdr, path)
+        except Exception:
+            errors.append(sys.exc_info())
+        finally:
+            fobj.close()
+
+    def __contains__(self, filename):
+        return self.find(filename) is not None
+
+    def __getitem__(self, filename):
+        """Returns the CpioFile for filename.
+
+        A KeyError is raised if filename is not present in the
+        archive.
+
+        """
+        archive_file = self.find(filename)
+        if archive_file is None:
+            raise KeyError(filename)
+        return archive_file
+
     def __enter__(self):
         return self
 
@@ -619,18 +1285,23 @@ class CpioArchive(object):
 
     def __iter__(self):
         global TRAILER
-        for archive_file in self._files:
-            yield archive_file
-        if not self._reader.trailer_seen:
-            while True:
-                archive_file = self._reader.next_file()
-                if archive_file.hdr.name == TRAILER:
-                    break
-                self._files.append(archive_file)
-                yield archive_file
-
-
-def cpio_open(filename, use_mmap=False):
+        i = 0
+        # self._files might grow (for instance, if the index is built
+        # while iterating over the archive)
+        while True:
+            if i < len(self._files):
+                yield self._file(i)
+                i += 1
+                continue
+            if self._reader.trailer_seen:
+                break
+            archive_file = self._reader.next_file()
+            if archive_file.hdr.name == TRAILER:
+                break
+            self._files.append(archive_file)
+
+
+def cpio_open(filename, use_mmap=False, index_file=None):
     """Opens a cpio archive for reading.
 
     filename is the path to the cpio archive.
@@ -638,6 +1309,8 @@ def cpio_open(filename, use_mmap=False):
     Keyword arguments:
     use_mmap -- if a filename is passed the file will be mmap'ed
                 (default: False)
+    index_file -- path to the sidecar index file (default: None)
 
     """
-    return CpioArchive(filename=filename, use_mmap=use_mmap)
+    return CpioArchive(filename=filename, use_mmap=use_mmap,
+                       index_file=index_file)
@@ -6,13 +6,23 @@ Additionally it provides some convenience methods.
 """
 
 import os
+import errno
+import fcntl
 import shutil
 from tempfile import NamedTemporaryFile, mkdtemp as orig_mkdtemp
 
 from osc2.util.delegation import StringifiedDelegator, Delegator
 
 
-__all__ = ['copy_file', 'iter_read']
+__all__ = ['copy_file', 'clone_file', 'iter_read']
+
+# ioctl request number of FICLONE (see linux/fs.h)
+FICLONE = 0x40049409
+
+# errnos which indicate that a reflink/hardlink is not supported
+_UNSUPPORTED_ERRNOS = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV,
+                       errno.EINVAL, errno.ENOSYS, errno.EPERM,
+                       errno.EMLINK, errno.EBADF)
 
 
 def _copy_file(fsource_obj, fdest_obj, bufsize, size,
@@ -125,6 +135,101 @@ def copy_file(source, dest, mode=0644, mtime=None, bufsize=8096,
         os.chmod(dest, mode)
 
 
+def _reflink_file(source, dest):
+    """Create dest as a reflink of source.
+
+    Return True if the reflink was created. If the filesystem
+    does not support reflinks False is returned.
+
+    """
+    dirname = os.path.dirname(dest)
+    filename = os.path.basename(dest)
+    fdest_obj = NamedTemporaryFile(dir=dirname, prefix=filename, delete=False)
+    tmp_filename = fdest_obj.name
+    try:
+        with open(source, 'rb') as fsource_obj:
+            fcntl.ioctl(fdest_obj.fileno(), FICLONE, fsource_obj.fileno())
+        fdest_obj.close()
+        os.rename(tmp_filename, dest)
+        return True
+    except (IOError, OSError) as e:
+        if e.errno not in _UNSUPPORTED_ERRNOS:
+            raise
+        return False
+    finally:
+        fdest_obj.close()
+        if os.path.isfile(tmp_filename):
+            os.unlink(tmp_filename)
+
+
+def _hardlink_file(source, dest):
+    """Create dest as a hardlink of source.
+
+    An existing dest is atomically replaced.
+    Return True if the hardlink was created. If the filesystem
+    does not support hardlinks (or if source and dest reside on
+    different filesystems) False is returned.
+
+    """
+    # link into a private tmpdir and rename it afterwards (a plain
+    # os.link fails if dest already exists)
+    tmpdir = orig_mkdtemp(dir=os.path.dirname(dest))
+    tmp_filename = os.path.join(tmpdir, os.path.basename(dest))
+    try:
+        os.link(source, tmp_filename)
+        os.rename(tmp_filename, dest)
+        return True
+    except OSError as e:
+        if e.errno not in _UNSUPPORTED_ERRNOS:
+            raise
+        return False
+    finally:
+        if os.path.isfile(tmp_filename):
+            os.unlink(tmp_filename)
+        os.rmdir(tmpdir)
+
+
+def clone_file(source, dest, mode=0644, mtime=None, hardlink=False):
+    """Clone the file source to file dest.
+
+    source and dest are filenames. In contrast to copy_file
+    the data is not necessarily copied: at first, it is tried
+    to create dest as a reflink (copy-on-write clone) of source.
+    If the filesystem does not support reflinks and hardlink
+    is True, dest is created as a hardlink of source. Otherwise
+    (or if this fails as well) source is copied via copy_file.
+    Return the used strategy: 'reflink', 'hardlink' or 'copy'.
+    A ValueError is raised if source does not exist or if dest
+    is not writable (see copy_file).
+
+    Keyword arguments:
+    mode -- the mode of file dest (default: 0644)
+    mtime -- the mtime of file dest
+    hardlink -- allow a hardlink (default: False). Only use this if
+                neither source nor dest is modified in place afterwards
+                (both share the same inode). Note: mode and mtime are
+                not changed if a hardlink is created.
+
+    """
+    if not os.path.isfile(source):
+        raise ValueError("source \"%s\" is no file" % source)
+    dirname = os.path.dirname(os.path.abspath(dest))
+    if (not os.path.isdir(dirname) or not os.access(dirname, os.W_OK)
+            or os.path.exists(dest) and not os.path.isfile(dest)):
+        # let copy_file raise an appropriate ValueError
+        copy_file(source, dest, mode=mode, mtime=mtime)
+        return 'copy'
+    if _reflink_file(source, dest):
+        if mtime is not None:
+            os.utime(dest, (-1, mtime))
+        os.chmod(dest, mode)
+        return 'reflink'
+    elif hardlink and _hardlink_file(source, dest):
+        return 'hardlink'
+    copy_file(source, dest, mode=mode, mtime=mtime, bufsize=1024 * 1024)
+    return 'copy'
+
+
 def iter_read(fsource, bufsize=8096, size=-1, read_method='read'):
     """Iterate over fsource and yield at most bufsize bytes.
 
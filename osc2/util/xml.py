@@ -1,10 +1,12 @@
 """xml utility functions"""
 
+import os
+import threading
 from collections import Sequence
 
 from lxml import etree, objectify
 
-__all__ = ['ElementClassLookup', 'get_parser']
+__all__ = ['ElementClassLookup', 'get_parser', 'get_schema', 'assert_valid']
 
 
 class XPathFindMixin:
@@ -100,3 +102,52 @@ def fromstring(data, parser=None, **kwargs):
     if parser is None:
         parser = get_parser(**kwargs)
     return objectify.fromstring(data, parser=parser)
+
+
+# compiled schemas: filename => (mtime, schema, lock)
+_schema_cache = {}
+_schema_cache_lock = threading.Lock()
+
+
+def _get_schema(filename):
+    """Returns a (schema, lock) tuple for the schema file filename."""
+    mtime = os.stat(filename).st_mtime
+    with _schema_cache_lock:
+        data = _schema_cache.get(filename)
+        if data is not None and data[0] == mtime:
+            return data[1:]
+    if filename.endswith('.rng'):
+        schema = etree.RelaxNG(file=filename)
+    elif filename.endswith('.xsd'):
+        schema = etree.XMLSchema(file=filename)
+    else:
+        raise ValueError('unsupported schema file')
+    data = (mtime, schema, threading.Lock())
+    with _schema_cache_lock:
+        _schema_cache[filename] = data
+    return data[1:]
+
+
+def get_schema(filename):
+    """Returns a compiled RelaxNG or XMLSchema object.
+
+    filename is the path to a schema file (*.rng or *.xsd). The
+    compiled schema is cached (until the file's mtime changes).
+    A ValueError is raised if the schema type is not supported.
+    Note: the returned schema object is shared, use assert_valid
+    in order to validate a tree in a thread-safe way.
+
+    """
+    return _get_schema(filename)[0]
+
+
+def assert_valid(root, filename):
+    """Validates root against the schema filename.
+
+    An etree.DocumentInvalid exception is raised if root is
+    invalid. For the details see get_schema.
+
+    """
+    schema, lock = _get_schema(filename)
+    with lock:
+        schema.assertValid(root)
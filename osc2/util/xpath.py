@@ -8,6 +8,14 @@ This module is mainly inspired by https://github.com/jnicklas/xpath
 
 """
 
+import sys
+
+from lxml import etree
+
+# maximum number of compiled xpaths which are cached
+XPATH_CACHE_SIZE = 256
+_xpath_cache = {}
+
 
 def children(minimum, maximum):
     """Decorator which checks the number of an expression's children.
@@ -48,6 +56,30 @@ def no_dummy(f):
     return checker
 
 
+def compile_xpath(xp):
+    """Returns a compiled xpath (an etree.XPath object).
+
+    xp is an Expression object or a str. The compiled xpaths are
+    cached by their string representation (that is expressions
+    with the same structure share a compiled xpath). Values
+    should be passed via variables (see XPathBuilder.var) so that
+    the compiled xpath can be reused. Example:
+    xpb = XPathBuilder()
+    xp = xpb.descendant('entry')[xpb.attr('name') == xpb.var('name')]
+    compile_xpath(xp)(root, name='foo')
+
+    """
+    if hasattr(xp, 'tostring'):
+        xp = xp.tostring()
+    compiled = _xpath_cache.get(xp)
+    if compiled is None:
+        if len(_xpath_cache) >= XPATH_CACHE_SIZE:
+            _xpath_cache.clear()
+        compiled = etree.XPath(xp)
+        _xpath_cache[xp] = compiled
+    return compiled
+
+
 class XPathSyntaxError(SyntaxError):
     """Raised if the expression tree is (syntactically) invalid."""
     pass
@@ -107,6 +139,43 @@ class XPathBuilder(object):
         kwargs.setdefault('in_pred', True)
         return self._factory.create_AttributeExpression(*args, **kwargs)
 
+    def log_and(self, *exprs):
+        """Connects all exprs via "and".
+
+        In contrast to a chain of Expression.log_and calls, a single
+        NaryExpression is created (which is considerably cheaper for
+        a large number of exprs). DummyExpressions are ignored.
+
+        """
+        return self._nary('and', exprs)
+
+    def log_or(self, *exprs):
+        """Connects all exprs via "or".
+
+        See log_and for the details.
+
+        """
+        return self._nary('or', exprs)
+
+    def _nary(self, op, exprs):
+        """Returns an Expression which connects all exprs via op."""
+        exprs = [expr for expr in exprs
+                 if not isinstance(expr, DummyExpression)]
+        if not exprs:
+            return self.dummy()
+        elif len(exprs) == 1:
+            return exprs[0]
+        return self._factory.create_NaryExpression(op, children=exprs)
+
+    def var(self, *args, **kwargs):
+        """Returns a new VariableExpression object.
+
+        *args and **kwargs are additional arguments for the
+        VariableExpression's __init__ method.
+
+        """
+        return self._factory.create_VariableExpression(*args, **kwargs)
+
     def dummy(self):
         """Returns a new DummyExpression object.
 
@@ -169,6 +238,16 @@ class XPathFactory(object):
         kwargs.setdefault('factory', self)
         return BinaryExpression(*args, **kwargs)
 
+    def create_NaryExpression(self, *args, **kwargs):
+        """Constructs a new NaryExpression Object.
+
+        *args and **kwargs are additional arguments for the
+        NaryExpression's __init__ method.
+
+        """
+        kwargs.setdefault('factory', self)
+        return NaryExpression(*args, **kwargs)
+
     def create_AttributeExpression(self, *args, **kwargs):
         """Constructs a new AttributeExpression Object.
 
@@ -209,6 +288,16 @@ class XPathFactory(object):
         kwargs.setdefault('factory', self)
         return LiteralExpression(*args, **kwargs)
 
+    def create_VariableExpression(self, *args, **kwargs):
+        """Constructs a new VariableExpression object.
+
+        *args and **kwargs are additional arguments for the
+        VariableExpression's __init__ method.
+
+        """
+        kwargs.setdefault('factory', self)
+        return VariableExpression(*args, **kwargs)
+
     def create_GeneratorPathDelegate(self, *args, **kwargs):
         """Constructs a new GeneratorPathDelegate object.
 
@@ -299,6 +388,8 @@ class Tree(object):
 
     """
 
+    __slots__ = ('_children', '_parent', '_tree_mode')
+
     def tree_op():
         """Decorator which is used to decorate all tree methods.
 
@@ -336,7 +427,12 @@ class Tree(object):
         self._parent = None
         self._tree_mode = None
         for c in self._children:
-            c.reparent(self)
+            if c._parent is None:
+                # no old parent, that is no list operations (which
+                # require the tree mode) have to be performed
+                c._parent = self
+            else:
+                c.reparent(self)
 
     @tree_op()
     def reparent(self, parent):
@@ -394,6 +490,8 @@ class Tree(object):
 class Expression(Tree):
     """Abstract base class for all xpath expressions."""
 
+    __slots__ = ('_factory', )
+
     # Expressions are not hashable because __eq__ etc. are implemented
     # in an incompatible way
     __hash__ = None
@@ -485,6 +583,10 @@ class Expression(Tree):
         """String representation of the expression"""
         raise NotImplementedError()
 
+    def compile(self):
+        """Returns the compiled expression (see compile_xpath)."""
+        return compile_xpath(self)
+
     def _expression_or_literal(self, expr):
         """Returns an Expression (or subclass) object.
 
@@ -524,6 +626,8 @@ class Expression(Tree):
 class PathExpression(Expression):
     """Represents a xpath path expression"""
 
+    __slots__ = ('_name', '_axis', '_init', '_context_item', '_is_relative')
+
     def __init__(self, name, axis='', init=False,
                  context_item=False, is_relative=False, **kwargs):
         """Constructs a new PathExpression object.
@@ -655,6 +759,8 @@ class PathExpression(Expression):
 class AttributeExpression(Expression):
     """Represents an attribute expression."""
 
+    __slots__ = ('_name', '_in_pred')
+
     def __init__(self, name, in_pred=False, **kwargs):
         """Constructs a new AttributeExpression object.
 
@@ -696,6 +802,8 @@ class AttributeExpression(Expression):
 class LiteralExpression(Expression):
     """Represents a literal."""
 
+    __slots__ = ('_literal', )
+
     def __init__(self, literal, **kwargs):
         """Constructs a new LiteralExpression object.
 
@@ -719,9 +827,33 @@ class LiteralExpression(Expression):
         return str(self._literal)
 
 
+class VariableExpression(Expression):
+    """Represents a variable reference."""
+
+    __slots__ = ('_name', )
+
+    def __init__(self, name, **kwargs):
+        """Constructs a new VariableExpression object.
+
+        name is the name of the variable (its value is passed
+        to the compiled xpath).
+        **kwargs are the arguments for the superclass'
+        __init__ method.
+
+        """
+        super(VariableExpression, self).__init__(**kwargs)
+        self._name = name
+
+    @children(0, 0)
+    def tostring(self):
+        return '$' + self._name
+
+
 class PredicateExpression(PathExpression):
     """Represents a xpath predicate"""
 
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         """Constructs a new PredicateExpression object.
 
@@ -740,6 +872,8 @@ class PredicateExpression(PathExpression):
 class BinaryExpression(Expression):
     """Represents a binary (operator) expression in infix notation."""
 
+    __slots__ = ('_op', )
+
     def __init__(self, op, **kwargs):
         """Constructs a new BinaryExpression object.
 
@@ -759,9 +893,38 @@ class BinaryExpression(Expression):
                              self._children[1].tostring())
 
 
+class NaryExpression(Expression):
+    """Connects an arbitrary number of expressions via an operator.
+
+    "a or b or c" is represented by a single NaryExpression (instead
+    of two nested BinaryExpressions).
+
+    """
+
+    __slots__ = ('_op', )
+
+    def __init__(self, op, **kwargs):
+        """Constructs a new NaryExpression object.
+
+        op is the operator which is used to connect the children.
+        **kwargs are the arguments for the superclass'
+        __init__ method.
+
+        """
+        super(NaryExpression, self).__init__(**kwargs)
+        self._op = op
+
+    @children(2, sys.maxint)
+    def tostring(self):
+        op = " %s " % self._op
+        return op.join([c.tostring() for c in self._children])
+
+
 class FunctionExpression(Expression):
     """Represents a xpath function in "prefix notation"."""
 
+    __slots__ = ('_name', '_params', '_in_pred')
+
     def __init__(self, name, *params, **kwargs):
         """Constructs a new FunctionExpression object.
 
@@ -798,6 +961,8 @@ class FunctionExpression(Expression):
 class ParenthesizedExpression(Expression):
     """Represents a parenthesized expression."""
 
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         """Constructs a new ParenthesizedExpression object.
 
@@ -822,6 +987,8 @@ class GeneratorPathDelegate(PathExpression):
 
     """
 
+    __slots__ = ('_delegate', )
+
     def __init__(self, delegate, **kwargs):
         """Constructs a new GeneratorPathDelegate object.
 
@@ -8,7 +8,11 @@ from osc2.wc.util import (wc_read_files, wc_pkg_data_filename, _storefile,
                           _write_storefile, _VERSION, wc_read_project,
                           _read_storefile, wc_read_packages,
                           missing_storepaths, wc_read_apiurl,
-                          wc_pkg_data_mkdir, _storedir)
+                          wc_pkg_data_mkdir, _storedir, wc_is_package,
+                          wc_lock, wc_files_tracker, wc_write_version,
+                          BinaryFileTracker, XMLFileTracker,
+                          wc_is_project, wc_packages_tracker,
+                          SqlitePackageTracker)
 
 
 def convert_package(path, ext_storedir=None, **kwargs):
@@ -105,3 +109,68 @@ def convert_project(path, project='', apiurl='', **package_states):
         storedir = wc_pkg_data_mkdir(path, package)
         convert_package(package_path, project=project, package=package,
                         apiurl=apiurl, ext_storedir=storedir)
+
+
+def convert_package_store(path, compact=True):
+    """Convert the store format of a package working copy.
+
+    path is the path to the package working copy.
+    If compact is True, the _files file is converted into the
+    compact binary format (see class BinaryFileTracker). Otherwise
+    it is converted back into the xml format.
+    A ValueError is raised if path is no package working copy.
+
+    """
+    if not wc_is_package(path):
+        raise ValueError("path \"%s\" is no package working copy" % path)
+    with wc_lock(path):
+        old_class = wc_files_tracker(path)
+        if (old_class is BinaryFileTracker) == compact:
+            # nothing to do
+            return
+        # the new file is written before the version is changed and
+        # the old file is removed afterwards
+        if compact:
+            data = BinaryFileTracker.fromxml(wc_read_files(path, raw=True))
+            _write_storefile(path, BinaryFileTracker.filename(), data,
+                             raw=True)
+        else:
+            xml_data = wc_read_files(path).tostring()
+            _write_storefile(path, XMLFileTracker.filename(), xml_data)
+        wc_write_version(path, compact=compact)
+        os.unlink(_storefile(path, old_class.filename()))
+
+
+def convert_project_store(path, compact=True):
+    """Convert the store format of a project working copy.
+
+    path is the path to the project working copy.
+    If compact is True, the _packages file is converted into a
+    sqlite database (see class SqlitePackageTracker) and the
+    store of each package is converted as well (see function
+    convert_package_store). Otherwise the xml format is restored.
+    A ValueError is raised if path is no project working copy.
+
+    """
+    if not wc_is_project(path):
+        raise ValueError("path \"%s\" is no project working copy" % path)
+    with wc_lock(path):
+        old_class = wc_packages_tracker(path)
+        with wc_read_packages(path) as packages:
+            names = [entry.get('name') for entry in packages]
+            if old_class is SqlitePackageTracker:
+                xml_data = packages.tostring()
+            else:
+                xml_data = wc_read_packages(path, raw=True)
+        if (old_class is SqlitePackageTracker) != compact:
+            # same order as in convert_package_store
+            if compact:
+                SqlitePackageTracker.create(path, xml_data)
+            else:
+                _write_storefile(path, '_packages', xml_data)
+            wc_write_version(path, compact=compact)
+            os.unlink(_storefile(path, old_class.filename()))
+    for package in names:
+        package_path = os.path.join(path, package)
+        if wc_is_package(package_path):
+            convert_package_store(package_path, compact=compact)
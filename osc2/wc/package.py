@@ -14,7 +14,7 @@ from osc2.source import File, Directory, Linkinfo
 from osc2.source import Package as SourcePackage
 from osc2.remote import RWLocalFile
 from osc2.util.xml import fromstring
-from osc2.util.io import copy_file
+from osc2.util.io import clone_file
 from osc2.util.listinfo import ListInfo
 from osc2.wc.base import (WorkingCopy, UpdateStateMixin, CommitStateMixin,
                           FileConflictError, PendingTransactionError,
@@ -25,7 +25,10 @@ from osc2.wc.util import (wc_read_package, wc_read_project, wc_read_apiurl,
                           missing_storepaths, WCInconsistentError,
                           wc_pkg_data_filename, XMLTransactionState,
                           wc_diff_mkdir, _storedir, _PKG_DATA,
-                          wc_verify_format, wc_write_version)
+                          wc_verify_format, wc_write_fingerprint,
+                          wc_has_valid_fingerprint,
+                          wc_files_tracker, wc_repair_store_format,
+                          XMLFileTracker, BinaryFileTracker)
 
 
 def file_md5(filename):
@@ -103,7 +106,7 @@ class Merge(object):
         """
         if is_binaryfile(my_filename) or is_binaryfile(your_filename):
             if file_md5(my_filename) == file_md5(old_filename):
-                copy_file(your_filename, out_filename)
+                clone_file(your_filename, out_filename)
                 return Merge.SUCCESS
             return Merge.BINARY
         merge_cmd = "diff3 -m -E %s %s %s > %s" % (my_filename, old_filename,
@@ -477,7 +480,8 @@ class Package(WorkingCopy):
     """Represents a package working copy."""
 
     def __init__(self, path, skip_handlers=None, commit_policies=None,
-                 merge_class=Merge, verify_format=True, **kwargs):
+                 merge_class=Merge, verify_format=True, full_check=False,
+                 **kwargs):
         """Constructs a new package object.
 
         path is the path to the working copy.
@@ -494,12 +498,17 @@ class Package(WorkingCopy):
         merge_class -- class which is used for a file merge
                        (default: Merge)
         verify_format -- verify working copy format (default: True)
+        full_check -- always run the full consistency check, even if
+                      the wc's fingerprint is unchanged (default: False)
         **kwargs -- see class WorkingCopy for the details
 
         """
         if verify_format:
             wc_verify_format(path)
-        (meta, xml_data, pkg_data) = self.wc_check(path)
+        files_filename = wc_files_tracker(path).filename()
+        fast = (not full_check
+                and wc_has_valid_fingerprint(path, files_filename))
+        (meta, xml_data, pkg_data) = self.wc_check(path, fast=fast)
         if meta or xml_data or pkg_data:
             raise WCInconsistentError(path, meta, xml_data, pkg_data)
         self.apiurl = wc_read_apiurl(path)
@@ -508,8 +517,12 @@ class Package(WorkingCopy):
         self.skip_handlers = skip_handlers or []
         self.commit_policies = commit_policies or []
         self.merge_class = merge_class
-        with wc_lock(path):
+        # a shared lock is sufficient if nothing has to be written
+        with wc_lock(path, shared=fast):
             self._files = wc_read_files(path)
+            if not fast:
+                # the full check succeeded
+                wc_write_fingerprint(path, files_filename)
         # call super at the end due to finish_pending_transaction
         super(Package, self).__init__(path, PackageUpdateState,
                                       PackageCommitState, **kwargs)
@@ -676,6 +689,7 @@ class Package(WorkingCopy):
             store_filename = wc_pkg_data_filename(self.path, filename)
             os.rename(new_filename, store_filename)
         self._files.merge(ustate.entrystates, ustate.info.remote_xml)
+        wc_write_fingerprint(self.path, self._files.filename())
         ustate.cleanup()
         self.notifier.finished('update', aborted=False)
 
@@ -694,8 +708,8 @@ class Package(WorkingCopy):
                 # file - for now overwrite it
                 my_filename = wc_filename + '.mine'
                 # a rename would be more efficient but also more error prone
-                # (if a update is interrupted)
-                copy_file(wc_filename, my_filename)
+                # (if a update is interrupted) - a clone is cheap anyway
+                clone_file(wc_filename, my_filename)
             merge = self.merge_class()
             ret = merge.merge(my_filename, old_filename, your_filename,
                               wc_filename)
@@ -706,7 +720,8 @@ class Package(WorkingCopy):
                     ustate.processed(filename, ' ')
                 os.unlink(my_filename)
             elif ret in (Merge.CONFLICT, Merge.BINARY, Merge.FAILURE):
-                copy_file(your_filename, wc_filename + '.rev%s' % uinfo.srcmd5)
+                rev_filename = wc_filename + '.rev%s' % uinfo.srcmd5
+                clone_file(your_filename, rev_filename)
                 ustate.processed(filename, 'C')
             # copy over new storefile
             os.rename(your_filename, old_filename)
@@ -718,7 +733,7 @@ class Package(WorkingCopy):
             wc_filename = os.path.join(self.path, filename)
             store_filename = wc_pkg_data_filename(self.path, filename)
             new_filename = os.path.join(ustate.location, filename)
-            copy_file(new_filename, wc_filename)
+            clone_file(new_filename, wc_filename)
             ustate.processed(filename, ' ')
             os.rename(new_filename, store_filename)
             self.notifier.processed(filename, ' ', None)
@@ -885,7 +900,7 @@ class Package(WorkingCopy):
             if os.path.exists(store_filename):
                 # just to reduce disk space usage
                 os.unlink(store_filename)
-            copy_file(commit_filename, wc_filename)
+            clone_file(commit_filename, wc_filename)
             os.rename(commit_filename, store_filename)
         self._files.merge(cstate.entrystates, cstate.filelist)
         # fixup mtimes
@@ -898,6 +913,7 @@ class Package(WorkingCopy):
             mtime = int(entry.get('mtime'))
             os.utime(wc_filename, (-1, mtime))
             os.utime(store_filename, (-1, mtime))
+        wc_write_fingerprint(self.path, self._files.filename())
         cstate.cleanup()
         self.notifier.finished('commit', aborted=False)
 
@@ -1016,10 +1032,10 @@ class Package(WorkingCopy):
         elif st == 'D':
             self._files.set(filename, ' ')
             if not os.path.exists(wc_filename):
-                copy_file(store_filename, wc_filename)
+                clone_file(store_filename, wc_filename)
         elif st in ('M', '!'):
             self._files.set(filename, ' ')
-            copy_file(store_filename, wc_filename)
+            clone_file(store_filename, wc_filename)
         self._files.write()
 
     def add(self, filename):
@@ -1172,7 +1188,7 @@ class Package(WorkingCopy):
                 diff.append(filename, 'modified')
 
     @classmethod
-    def wc_check(cls, path):
+    def wc_check(cls, path, fast=False):
         """Check path is a consistent package working copy.
 
         A 3-tuple (missing, xml_data) is returned:
@@ -1180,12 +1196,17 @@ class Package(WorkingCopy):
         - xml_data is a str which contains the invalid files xml str
           (if the xml is valid xml_data is the empty str (''))
 
+        Keyword arguments:
+        fast -- only check for missing storefiles; the _files file
+                and the package data are not checked (default: False)
+
         """
+        files_filename = wc_files_tracker(path).filename()
         meta = missing_storepaths(path, '_project', '_package',
-                                  '_apiurl', '_files', '_version')
+                                  '_apiurl', files_filename, '_version')
         dirs = missing_storepaths(path, 'data', dirs=True)
         missing = meta + dirs
-        if '_files' in missing:
+        if files_filename in missing or fast:
             return (missing, '', [])
         # check if _files file is a valid xml
         try:
@@ -1223,16 +1244,21 @@ class Package(WorkingCopy):
                 raise ValueError("%s argument required" % key)
             meth_name = 'wc_write_' + key
             globals()[meth_name](path, kwargs[key])
+        if '_version' in missing:
+            # the _version file determines the store format (and
+            # thus which _files file is checked)
+            wc_repair_store_format(path, XMLFileTracker, BinaryFileTracker)
+            missing, xml_data, pkg_data = Package.wc_check(path)
         project = wc_read_project(path)
         package = wc_read_package(path)
         apiurl = wc_read_apiurl(path)
-        if '_files' in missing or xml_data:
+        if wc_files_tracker(path).filename() in missing or xml_data:
             spkg = SourcePackage(project, package)
             directory = spkg.list(rev=revision, apiurl=apiurl)
             xml_data = etree.tostring(directory, pretty_print=True)
+            # writes the binary format if the store is compact
             wc_write_files(path, xml_data)
-        if '_version' in missing:
-            wc_write_version(path)
+        wc_repair_store_format(path, XMLFileTracker, BinaryFileTracker)
         if _PKG_DATA in missing:
             os.mkdir(wc_pkg_data_filename(path, ''))
         files = wc_read_files(path)
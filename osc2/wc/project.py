@@ -12,7 +12,10 @@ from osc2.wc.util import (wc_read_project, wc_read_apiurl, wc_read_packages,
                           WCInconsistentError, wc_is_project, wc_is_package,
                           wc_pkg_data_mkdir, XMLTransactionState, _storedir,
                           _STORE, wc_pkg_data_filename, wc_verify_format,
-                          _PKG_DATA, wc_write_version)
+                          _PKG_DATA, wc_write_fingerprint,
+                          wc_has_valid_fingerprint, wc_packages_tracker,
+                          wc_repair_store_format, XMLPackageTracker,
+                          SqlitePackageTracker)
 from osc2.source import Project as SourceProject
 from osc2.remote import RemotePackage
 from osc2.util.listinfo import ListInfo
@@ -132,7 +135,7 @@ class Project(WorkingCopy):
 
     PACKAGES_SCHEMA = ''
 
-    def __init__(self, path, verify_format=True, **kwargs):
+    def __init__(self, path, verify_format=True, full_check=False, **kwargs):
         """Constructs a new project object.
 
         path is the path to the working copy.
@@ -143,18 +146,27 @@ class Project(WorkingCopy):
 
         Keyword arguments:
         verify_format -- verify working copy format (default: True)
+        full_check -- always run the full consistency check, even if
+                      the wc's fingerprint is unchanged (default: False)
         kwargs -- see class WorkingCopy for the details
 
         """
         if verify_format:
             wc_verify_format(path)
-        meta, xml_data, pkg_data = self.wc_check(path)
+        packages_filename = wc_packages_tracker(path).filename()
+        fast = (not full_check
+                and wc_has_valid_fingerprint(path, packages_filename))
+        meta, xml_data, pkg_data = self.wc_check(path, fast=fast)
         if meta or xml_data or pkg_data:
             raise WCInconsistentError(path, meta, xml_data, pkg_data)
         self.apiurl = wc_read_apiurl(path)
         self.name = wc_read_project(path)
-        with wc_lock(path):
+        # a shared lock is sufficient if nothing has to be written
+        with wc_lock(path, shared=fast):
             self._packages = wc_read_packages(path)
+            if not fast:
+                # the full check succeeded
+                wc_write_fingerprint(path, packages_filename)
         super(Project, self).__init__(path, ProjectUpdateState,
                                       ProjectCommitState, **kwargs)
 
@@ -292,6 +304,7 @@ class Project(WorkingCopy):
         self._perform_deletes(ustate)
         self._perform_candidates(ustate, **kwargs)
         self._packages.merge(ustate.entrystates)
+        wc_write_fingerprint(self.path, self._packages.filename())
         ustate.cleanup()
 
     def _perform_adds(self, ustate, **kwargs):
@@ -442,6 +455,7 @@ class Project(WorkingCopy):
         self._commit_deletes(cstate)
         self._commit_modified(cstate, package_filenames, comment)
         self._packages.merge(cstate.entrystates)
+        wc_write_fingerprint(self.path, self._packages.filename())
         cstate.cleanup()
 
     def _commit_adds(self, cstate, package_filenames, comment):
@@ -622,7 +636,7 @@ class Project(WorkingCopy):
         return Package(path, *args, **kwargs)
 
     @classmethod
-    def wc_check(cls, path):
+    def wc_check(cls, path, fast=False):
         """Check path is a consistent project working copy.
 
         A 2-tuple (missing, xml_data) is returned:
@@ -630,12 +644,17 @@ class Project(WorkingCopy):
         - xml_data is a str which contains the invalid packages xml str
           (if the xml is valid xml_data is the empty str (''))
 
+        Keyword arguments:
+        fast -- only check for missing storefiles; the _packages file
+                and the package data dirs are not checked (default: False)
+
         """
+        packages_filename = wc_packages_tracker(path).filename()
         meta = missing_storepaths(path, '_project', '_apiurl',
-                                  '_packages', '_version')
+                                  packages_filename, '_version')
         dirs = missing_storepaths(path, 'data', dirs=True)
         missing = meta + dirs
-        if '_packages' in missing:
+        if packages_filename in missing or fast:
             return (missing, '', [])
         # check if _packages file is a valid xml
         try:
@@ -670,34 +689,40 @@ class Project(WorkingCopy):
             if not apiurl:
                 raise ValueError('apiurl argument required')
             wc_write_apiurl(path, apiurl)
-        if '_packages' in missing or xml_data:
+        if '_version' in missing:
+            # the _version file determines the store format (and
+            # thus which _packages file is checked)
+            wc_repair_store_format(path, XMLPackageTracker,
+                                   SqlitePackageTracker)
+            missing, xml_data, pkg_data = Project.wc_check(path)
+        if wc_packages_tracker(path).filename() in missing or xml_data:
             if not package_states:
                 raise ValueError('package states required')
+            # creates a new database if the store is compact
             wc_write_packages(path, '<packages/>')
-            packages = wc_read_packages(path)
-            for package, st in package_states.iteritems():
-                packages.add(package, state=st)
-            packages.write()
-        if '_version' in missing:
-            wc_write_version(path)
+            with wc_read_packages(path) as packages:
+                for package, st in package_states.iteritems():
+                    packages.add(package, state=st)
+                packages.write()
+        wc_repair_store_format(path, XMLPackageTracker, SqlitePackageTracker)
         if _PKG_DATA in missing:
             os.mkdir(wc_pkg_data_filename(path, ''))
         if not no_packages:
             project = wc_read_project(path)
             apiurl = wc_read_apiurl(path)
-            packages = wc_read_packages(path)
             missing, xml_data, pkg_data = Project.wc_check(path)
-            # only pkg data left
-            for package in pkg_data:
-                package_path = os.path.join(path, package)
-                if os.path.isdir(package_path):
-                    storedir = wc_pkg_data_mkdir(path, package)
-                    Package.repair(package_path, project=project,
-                                   package=package, apiurl=apiurl,
-                                   ext_storedir=storedir)
-                else:
-                    packages.remove(package)
-                    packages.write()
+            with wc_read_packages(path) as packages:
+                # only pkg data left
+                for package in pkg_data:
+                    package_path = os.path.join(path, package)
+                    if os.path.isdir(package_path):
+                        storedir = wc_pkg_data_mkdir(path, package)
+                        Package.repair(package_path, project=project,
+                                       package=package, apiurl=apiurl,
+                                       ext_storedir=storedir)
+                    else:
+                        packages.remove(package)
+                        packages.write()
 
     @staticmethod
     def init(path, project, apiurl, *args, **kwargs):
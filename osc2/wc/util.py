@@ -5,9 +5,14 @@ instance.
 """
 
 import os
+import copy
 import errno
 import fcntl
+import marshal
 import shutil
+import sqlite3
+import time
+import logging
 
 from lxml import etree, objectify
 
@@ -15,7 +20,7 @@ from osc2.wc.base import AbstractTransactionState
 from osc2.source import File, Directory, Linkinfo
 from osc2.util.io import mkstemp
 from osc2.util.xml import fromstring
-from osc2.util.xpath import XPathBuilder
+from osc2.util.xpath import XPathBuilder, compile_xpath
 
 __all__ = ['wc_is_project', 'wc_is_package', 'wc_read_project',
            'wc_read_package', 'wc_read_apiurl']
@@ -25,7 +30,12 @@ _STORE = '.osc'
 _PKG_DATA = 'data'
 _DIFF_DATA = 'diff'
 _LOCK = 'wc.lock'
+_FINGERPRINT = '_fingerprint'
 _VERSION = 2.0
+# format version of a working copy with a compact store (a new major
+# version, so that older clients, which cannot read the compact store,
+# reject the working copy)
+_COMPACT_VERSION = 3.0
 
 
 class WCInconsistentError(Exception):
@@ -47,24 +57,51 @@ class WCFormatVersionError(Exception):
         self.version = version
 
 
+class WCLockTimeoutError(Exception):
+    """Raised if a working copy lock cannot be acquired in time"""
+
+    def __init__(self, path, timeout):
+        super(WCLockTimeoutError, self).__init__()
+        self.path = path
+        self.timeout = timeout
+
+
 class WCLock(object):
     """Represents a lock on a working copy.
 
-    "Coordinates" working copy locking.
+    "Coordinates" working copy locking. A lock is either
+    exclusive (for writers) or shared (for readers). An
+    arbitrary number of shared locks can be held at the
+    same time, but an exclusive lock excludes all other
+    locks.
 
     """
 
-    def __init__(self, path):
+    # maximum delay between two lock attempts (if a timeout is used)
+    MAX_DELAY = 0.5
+
+    def __init__(self, path, shared=False, timeout=None):
         """Constructs a new WCLock object.
 
         path is the path to wc working copy.
         No lock is acquired (it must be explicitly locked
         via the lock() method).
 
+        Keyword arguments:
+        shared -- acquire a shared instead of an exclusive lock
+                  (default: False)
+        timeout -- number of seconds to wait for the lock. If None,
+                   wait forever (default: None)
+
         """
         super(WCLock, self).__init__()
         self._path = path
+        self._shared = shared
+        self._timeout = timeout
         self._fobj = None
+        self._logger = logging.getLogger(__name__)
+        # number of seconds we had to wait for the last lock
+        self.wait_time = 0.0
 
     def has_lock(self):
         """Check if this object has lock on the working copy.
@@ -80,7 +117,9 @@ class WCLock(object):
         This call might block if the working copy is already
         locked.
         A RuntimeError is raised if this object already
-        has a lock on the working copy.
+        has a lock on the working copy. A WCLockTimeoutError
+        is raised if the lock could not be acquired within
+        timeout seconds.
 
         """
         global _LOCK
@@ -89,10 +128,48 @@ class WCLock(object):
             # it smells like a programming/logic error (IMHO)
             raise RuntimeError('Double lock occured')
         lock = _storefile(self._path, _LOCK)
-        f = open(lock, 'w')
-        fcntl.lockf(f, fcntl.LOCK_EX)
+        # the lock file is never removed, otherwise a waiting
+        # process might lock an already unlinked file
+        f = open(lock, 'a+')
+        mode = fcntl.LOCK_EX
+        if self._shared:
+            mode = fcntl.LOCK_SH
+        start = time.time()
+        try:
+            if self._timeout is None:
+                fcntl.lockf(f, mode)
+            else:
+                self._lock_nonblocking(f, mode, start)
+        except:
+            f.close()
+            raise
+        self.wait_time = time.time() - start
+        self._logger.debug("%s lock on %s acquired (waited %.3fs)",
+                           'shared' if self._shared else 'exclusive',
+                           self._path, self.wait_time)
         self._fobj = f
 
+    def _lock_nonblocking(self, f, mode, start):
+        """Repeatedly try to lock f until the timeout exceeded.
+
+        A WCLockTimeoutError is raised if the lock could not
+        be acquired.
+
+        """
+        delay = 0.01
+        while True:
+            try:
+                fcntl.lockf(f, mode | fcntl.LOCK_NB)
+                return
+            except IOError as e:
+                if e.errno not in (errno.EACCES, errno.EAGAIN):
+                    raise
+            remaining = self._timeout - (time.time() - start)
+            if remaining <= 0:
+                raise WCLockTimeoutError(self._path, self._timeout)
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, WCLock.MAX_DELAY)
+
     def unlock(self):
         """Release the lock on the working copy.
 
@@ -100,14 +177,11 @@ class WCLock(object):
         RuntimeError is raised.
 
         """
-        global _LOCK
         if not self.has_lock():
             raise RuntimeError('Attempting to release an unaquired lock.')
         fcntl.lockf(self._fobj, fcntl.LOCK_UN)
         self._fobj.close()
         self._fobj = None
-        lock = _storefile(self._path, _LOCK)
-        os.unlink(lock)
 
     def __enter__(self):
         self.lock()
@@ -180,6 +254,20 @@ class AbstractEntryTracker(object):
         """Iterate over entries."""
         raise NotImplementedError()
 
+    def close(self):
+        """Release all resources which are held by the tracker.
+
+        The default implementation does nothing.
+
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     @classmethod
     def check(self, path):
         """Check consistency of the backing file.
@@ -215,6 +303,9 @@ class XMLEntryTracker(AbstractEntryTracker):
         # XXX: validation
         self._xml = self._fromstring(xml_data)
         self._tag = entry_tag
+        xpb = XPathBuilder()
+        xp = xpb.descendant(self._tag)[xpb.attr('name') == xpb.var('name')]
+        self._find_xpath = compile_xpath(xp)
 
     def add(self, name, state):
         if self.find(name) is not None:
@@ -230,9 +321,10 @@ class XMLEntryTracker(AbstractEntryTracker):
         self._xml.remove(elm)
 
     def find(self, name):
-        xpb = XPathBuilder()
-        xp = xpb.descendant(self._tag)[xpb.attr('name') == name]
-        return self._xml.find(xp.tostring())
+        elms = self._find_xpath(self._xml, name=name)
+        if elms:
+            return elms[0]
+        return None
 
     def set(self, name, new_state):
         entry = self.find(name)
@@ -276,18 +368,182 @@ class XMLPackageTracker(XMLEntryTracker):
         return '_packages'
 
     def merge(self, new_states):
+        # avoid a find call for each package (this would be quadratic)
+        elms = dict([(elm.get('name'), elm) for elm in self])
         for package, st in new_states.iteritems():
-            if self.find(package) is None:
-                self.add(package, st)
+            elm = elms.get(package)
+            if elm is None:
+                elm = self._xml.makeelement(self._tag, name=package, state=st)
+                self._xml.append(elm)
             else:
-                self.set(package, st)
-        for package in self._xml.findall(self._tag):
-            name = package.get('name')
-            if name not in new_states.keys():
-                self.remove(name)
+                elm.set('state', st)
+        for name, elm in elms.iteritems():
+            if name not in new_states:
+                self._xml.remove(elm)
         self.write()
 
 
+class SqlitePackageTracker(AbstractEntryTracker):
+    """Represents the _packages file as a sqlite database.
+
+    Each modification (add, remove, set, merge) is done in its own
+    database transaction, which is committed immediately (an
+    interrupted modification leaves the previous state untouched).
+    That is, the database is not locked between two modifications.
+    Lookups are indexed. It provides the same interface as the
+    XMLPackageTracker. The database connection is closed by the
+    close method (it is reopened on demand) or if the tracker is
+    used as a context manager.
+
+    """
+
+    def __init__(self, path):
+        """Constructs a new SqlitePackageTracker object.
+
+        path is the path to the project working copy.
+        A ValueError is raised if the database is corrupt.
+
+        """
+        super(SqlitePackageTracker, self).__init__()
+        filename = self.filename()
+        if not self.check(path):
+            raise ValueError("%s file is corrupt" % filename)
+        self._path = path
+        self._conn = None
+
+    @property
+    def _db(self):
+        """Return the (lazily opened) database connection."""
+        if self._conn is None:
+            self._conn = self._connect(_storefile(self._path,
+                                                  self.filename()))
+        return self._conn
+
+    def add(self, name, state):
+        try:
+            with self._db as db:
+                db.execute('INSERT INTO packages (name, state) '
+                           'VALUES (?, ?)', (name, state))
+        except sqlite3.IntegrityError:
+            raise ValueError("entry \"%s\" already exists" % name)
+
+    def remove(self, name):
+        with self._db as db:
+            cur = db.execute('DELETE FROM packages WHERE name = ?', (name,))
+            if not cur.rowcount:
+                raise ValueError("entry \"%s\" does not exist" % name)
+
+    def find(self, name):
+        cur = self._db.execute('SELECT name, state FROM packages '
+                               'WHERE name = ?', (name,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return self._entry(row)
+
+    def set(self, name, new_state):
+        with self._db as db:
+            cur = db.execute('UPDATE packages SET state = ? '
+                             'WHERE name = ?', (new_state, name))
+            if not cur.rowcount:
+                raise ValueError("entry \"%s\" does not exist" % name)
+
+    def merge(self, new_states):
+        with self._db as db:
+            cur = db.execute('SELECT name FROM packages')
+            names = set([row[0] for row in cur])
+            removed = [(name, ) for name in names if name not in new_states]
+            updated = []
+            added = []
+            for package, st in new_states.iteritems():
+                if package in names:
+                    updated.append((st, package))
+                else:
+                    added.append((package, st))
+            db.executemany('DELETE FROM packages WHERE name = ?', removed)
+            db.executemany('UPDATE packages SET state = ? WHERE name = ?',
+                           updated)
+            db.executemany('INSERT INTO packages (name, state) '
+                           'VALUES (?, ?)', added)
+
+    def write(self):
+        # all modifications are already committed
+        pass
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __iter__(self):
+        cur = self._db.execute('SELECT name, state FROM packages '
+                               'ORDER BY rowid')
+        return iter([self._entry(row) for row in cur])
+
+    def tostring(self):
+        """Return the xml representation of the tracked packages."""
+        xml = fromstring('<packages/>')
+        for entry in self:
+            xml.append(xml.makeelement('package', entry.attrib))
+        return etree.tostring(xml, pretty_print=True)
+
+    @staticmethod
+    def _entry(row):
+        return CompactEntry({'name': row[0], 'state': row[1]}, {})
+
+    @staticmethod
+    def _connect(filename):
+        db = sqlite3.connect(filename)
+        # return str instead of unicode objects (like lxml)
+        db.text_factory = str
+        return db
+
+    @classmethod
+    def create(cls, path, xml_data):
+        """Create a new database from the xml str xml_data.
+
+        path is the path to the project working copy.
+        An existing database is atomically replaced.
+
+        """
+        xml = fromstring(xml_data)
+        rows = [(elm.get('name'), elm.get('state'))
+                for elm in xml.iterfind('package')]
+        tmpfile = mkstemp(dir=_storedir(path), delete=False)
+        tmpfile.close()
+        try:
+            db = cls._connect(str(tmpfile))
+            db.execute('CREATE TABLE packages (name TEXT PRIMARY KEY, '
+                       'state TEXT NOT NULL)')
+            db.executemany('INSERT INTO packages (name, state) '
+                           'VALUES (?, ?)', rows)
+            db.commit()
+            db.close()
+            os.rename(tmpfile, _storefile(path, cls.filename()))
+        finally:
+            if os.path.isfile(tmpfile):
+                os.unlink(tmpfile)
+
+    @classmethod
+    def filename(cls):
+        return '_packages.db'
+
+    @classmethod
+    def check(cls, path):
+        if missing_storepaths(path, cls.filename()):
+            msg = "'%s' is no valid storefile" % cls.filename()
+            raise ValueError(msg)
+        try:
+            db = cls._connect(_storefile(path, cls.filename()))
+            try:
+                db.execute('SELECT count(*) FROM packages').fetchone()
+            finally:
+                db.close()
+        except sqlite3.DatabaseError:
+            return False
+        return True
+
+
 class XMLFileTracker(XMLEntryTracker):
     """Represents the _files file."""
 
@@ -295,12 +551,7 @@ class XMLFileTracker(XMLEntryTracker):
         super(XMLFileTracker, self).__init__(path, 'entry')
 
     def merge(self, new_states, new_entries):
-        filenames = [entry.get('name') for entry in new_entries]
-        # ignore locally added files
-        st_filenames = [f for f, st in new_states.iteritems() if st != 'A']
-        if (len(filenames) != len(st_filenames)
-                or set(filenames) != set(st_filenames)):
-            raise ValueError("data of new_states and new_entries mismatch")
+        _verify_merge_data(new_states, new_entries)
         self._xml = new_entries
         for filename, st in new_states.iteritems():
             if st == 'A':
@@ -331,6 +582,263 @@ class XMLFileTracker(XMLEntryTracker):
         return '_files'
 
 
+def _verify_merge_data(new_states, new_entries):
+    """Check that new_states and new_entries are consistent.
+
+    A ValueError is raised if the filenames in new_entries
+    and new_states (locally added files are ignored) mismatch.
+
+    """
+    filenames = [entry.get('name') for entry in new_entries]
+    # ignore locally added files
+    st_filenames = [f for f, st in new_states.iteritems() if st != 'A']
+    if (len(filenames) != len(st_filenames)
+            or set(filenames) != set(st_filenames)):
+        raise ValueError("data of new_states and new_entries mismatch")
+
+
+class CompactEntry(object):
+    """Represents an entry of a BinaryFileTracker (or SqlitePackageTracker).
+
+    It provides the same interface as a File element (get,
+    set, file etc.) but it is much cheaper to construct.
+
+    """
+    __slots__ = ('attrib', '_root')
+
+    def __init__(self, attrib, root):
+        """Constructs a new CompactEntry object.
+
+        attrib is a dict which contains the entry's attributes
+        and root is a dict which contains the attributes of the
+        directory.
+
+        """
+        super(CompactEntry, self).__init__()
+        self.attrib = attrib
+        self._root = root
+
+    def get(self, key, default=None):
+        return self.attrib.get(key, default)
+
+    def set(self, key, value):
+        self.attrib[key] = value
+
+    def keys(self):
+        return self.attrib.keys()
+
+    def items(self):
+        return self.attrib.items()
+
+    def element(self):
+        """Return the entry as a File element (with a parent)."""
+        directory = fromstring('<directory/>', directory=Directory,
+                               entry=File)
+        for key, value in self._root.iteritems():
+            directory.set(key, value)
+        directory.append(directory.makeelement('entry', self.attrib))
+        return directory.find('entry')
+
+    def file(self, **kwargs):
+        """Returns a RORemoteFile object (see File.file)."""
+        return self.element().file(**kwargs)
+
+
+class BinaryFileTracker(AbstractEntryTracker):
+    """Represents the _files file in a compact binary format.
+
+    The file consists of a magic header and a marshalled
+    (xml_data, entries) tuple: xml_data is the directory xml
+    without its entries (for instance the linkinfo) and entries
+    is a list of attribute dicts. Loading it requires no xml
+    parsing of the (possibly huge) entry list. It provides the
+    same interface as the XMLFileTracker.
+
+    """
+
+    MAGIC = 'osc2 _files\0'
+    # marshal format version (version 2 is supported since python 2.5)
+    MARSHAL_VERSION = 2
+
+    def __init__(self, path):
+        """Constructs a new BinaryFileTracker object.
+
+        path is the path to the package working copy.
+        A ValueError is raised if the file is corrupt.
+
+        """
+        super(BinaryFileTracker, self).__init__()
+        filename = self.filename()
+        try:
+            xml_data, entries = self.loads(
+                _read_storefile(path, filename, raw=True))
+        except ValueError:
+            raise ValueError("%s file is corrupt" % filename)
+        self._path = path
+        self._set_data(fromstring(xml_data, entry=File, directory=Directory,
+                                  linkinfo=Linkinfo), entries)
+
+    def _set_data(self, xml, entries):
+        """Set the directory xml (without entries) and the entries."""
+        self._xml = xml
+        self._root = dict(xml.attrib)
+        self._names = []
+        self._entries = {}
+        for attrib in entries:
+            name = attrib['name']
+            self._names.append(name)
+            self._entries[name] = CompactEntry(attrib, self._root)
+
+    def add(self, name, state):
+        if name in self._entries:
+            raise ValueError("entry \"%s\" already exists" % name)
+        self._names.append(name)
+        self._entries[name] = CompactEntry({'name': name, 'state': state},
+                                           self._root)
+
+    def remove(self, name):
+        if name not in self._entries:
+            raise ValueError("entry \"%s\" does not exist" % name)
+        self._names.remove(name)
+        del self._entries[name]
+
+    def find(self, name):
+        return self._entries.get(name)
+
+    def set(self, name, new_state):
+        entry = self.find(name)
+        if entry is None:
+            raise ValueError("entry \"%s\" does not exist" % name)
+        entry.set('state', new_state)
+
+    def merge(self, new_states, new_entries):
+        _verify_merge_data(new_states, new_entries)
+        xml = copy.deepcopy(new_entries)
+        for entry in xml.findall('entry'):
+            xml.remove(entry)
+        self._set_data(xml, [dict(entry.attrib) for entry in new_entries])
+        for filename, st in new_states.iteritems():
+            if st == 'A':
+                # add files with state 'A' again
+                self.add(filename, st)
+            else:
+                self.set(filename, st)
+        self.write()
+
+    def write(self):
+        entries = [self._entries[name].attrib for name in self._names]
+        data = self.dumps(etree.tostring(self._xml), entries)
+        _write_storefile(self._path, self.filename(), data, raw=True)
+
+    def __iter__(self):
+        for name in self._names:
+            yield self._entries[name]
+
+    def revision_data(self):
+        """Return a dict which contains the revision data."""
+        return {'rev': self._xml.get('rev'), 'srcmd5': self._xml.get('srcmd5')}
+
+    def is_link(self):
+        """Return True if package is a link."""
+        return self._xml.find('linkinfo') is not None
+
+    def _element(self):
+        """Return a directory element which contains all entries.
+
+        Note: the returned element is a copy, that is modifications
+        are not tracked.
+
+        """
+        xml = copy.deepcopy(self._xml)
+        for entry in self:
+            xml.append(xml.makeelement('entry', entry.attrib))
+        return xml
+
+    def tostring(self):
+        """Return the xml representation of the tracked files."""
+        return etree.tostring(self._element(), pretty_print=True)
+
+    @property
+    def linkinfo(self):
+        """Return the linkinfo element.
+
+        An AttributeError is raised if the package is no link.
+
+        """
+        return self._xml.linkinfo
+
+    def get(self, key, default=None):
+        """Return the value of the directory attribute key."""
+        return self._xml.get(key, default)
+
+    def findall(self, path):
+        """Return a list of all elements which match path.
+
+        In contrast to the XMLFileTracker the returned elements
+        are copies (see _element).
+
+        """
+        return self._element().findall(path)
+
+    def iterfind(self, path):
+        """Iterate over all elements which match path (see findall)."""
+        return self._element().iterfind(path)
+
+    def xpath(self, path, **kwargs):
+        """Evaluate the xpath expression path (see findall)."""
+        return self._element().xpath(path, **kwargs)
+
+    @classmethod
+    def dumps(cls, xml_data, entries):
+        """Return the binary representation.
+
+        xml_data is the directory xml str without entries and
+        entries is a list of attribute dicts.
+
+        """
+        entries = [dict(attrib) for attrib in entries]
+        return cls.MAGIC + marshal.dumps((xml_data, entries),
+                                         cls.MARSHAL_VERSION)
+
+    @classmethod
+    def loads(cls, data):
+        """Return a (xml_data, entries) tuple.
+
+        data is the binary representation. A ValueError is raised
+        if data is corrupt.
+
+        """
+        if not data.startswith(cls.MAGIC):
+            raise ValueError('invalid magic')
+        try:
+            xml_data, entries = marshal.loads(data[len(cls.MAGIC):])
+        except (EOFError, TypeError, ValueError):
+            raise ValueError('corrupt data')
+        return xml_data, entries
+
+    @classmethod
+    def fromxml(cls, xml_data):
+        """Return the binary representation of the xml str xml_data."""
+        xml = fromstring(xml_data)
+        entries = []
+        for entry in xml.findall('entry'):
+            entries.append(dict(entry.attrib))
+            xml.remove(entry)
+        return cls.dumps(etree.tostring(xml), entries)
+
+    @classmethod
+    def filename(cls):
+        return '_files.bin'
+
+    @classmethod
+    def check(cls, path):
+        try:
+            cls.loads(_read_storefile(path, cls.filename(), raw=True))
+        except ValueError:
+            return False
+        return True
+
+
 class XMLTransactionState(AbstractTransactionState):
     """Represents the state of a transaction"""
 
@@ -540,38 +1048,45 @@ def missing_storepaths(path, *paths, **kwargs):
     return missing
 
 
-def _read_storefile(path, filename):
+def _read_storefile(path, filename, raw=False):
     """Read the content of the path/storedir/filename.
 
     If path/storedir/filename does not exist or is no file
     a ValueError is raised.
     Leading and trailing whitespaces, tabs etc. are stripped.
 
+    Keyword arguments:
+    raw -- return the (binary) data as is (default: False)
+
     """
     if missing_storepaths(path, filename):
         # file does not exist or is no file
         msg = "'%s' is no valid storefile" % filename
         raise ValueError(msg)
     storefile = _storefile(path, filename)
-    return _read_file(storefile)
+    return _read_file(storefile, raw=raw)
 
 
-def _read_file(filename):
+def _read_file(filename, raw=False):
     """Reads the file specified via filename.
 
-    The returned data is stripped.
+    The returned data is stripped (unless raw is True).
 
     """
+    if raw:
+        with open(filename, 'rb') as f:
+            return f.read()
     with open(filename, 'r') as f:
         return f.read().strip()
 
 
-def _write_storefile(path, filename, data):
+def _write_storefile(path, filename, data, raw=False):
     """Write a wc file.
 
     path is the path to the working copy, filename is the name
     of the storefile and data is the data which should be written.
-    If data is not empty a trailing \\n character will be added.
+    If data is not empty a trailing \\n character will be added
+    (unless raw is True).
 
     Raises a ValueError if path has no storedir.
 
@@ -583,7 +1098,7 @@ def _write_storefile(path, filename, data):
     try:
         tmpfile = mkstemp(dir=_storedir(path), delete=False)
         tmpfile.write(data)
-        if data:
+        if data and not raw:
             tmpfile.write('\n')
     finally:
         if tmpfile is not None:
@@ -591,7 +1106,7 @@ def _write_storefile(path, filename, data):
             os.rename(tmpfile, fname)
 
 
-def wc_lock(path):
+def wc_lock(path, shared=False, timeout=None):
     """Return a WCLock object.
 
     path is the path to the working copy.
@@ -601,8 +1116,79 @@ def wc_lock(path):
     with wc_lock(path) as lock:
         ...
 
+    Keyword arguments:
+    shared -- return a shared (read) lock (default: False)
+    timeout -- see class WCLock (default: None)
+
     """
-    return WCLock(path)
+    return WCLock(path, shared=shared, timeout=timeout)
+
+
+def wc_fingerprint(path, tracker_filename):
+    """Return the consistency fingerprint of the working copy.
+
+    path is the path to the working copy and tracker_filename
+    is the name of the storefile which tracks the entries (for
+    instance '_files' or '_packages').
+    The fingerprint is a str which consists of the format
+    version, the mtime and the number of entries of the
+    _PKG_DATA dir and the inode, size and mtime of the
+    tracker file. It can be computed without reading the
+    tracker file or stat'ing each storefile.
+    None is returned if the _PKG_DATA dir or the tracker
+    file does not exist.
+
+    """
+    global _PKG_DATA, _VERSION
+    data_dir = _storefile(path, _PKG_DATA)
+    try:
+        data_st = os.stat(data_dir)
+        entries = len(os.listdir(data_dir))
+        tracker_st = os.stat(_storefile(path, tracker_filename))
+    except OSError as e:
+        if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+            raise
+        return None
+    fields = (_VERSION, repr(data_st.st_mtime), entries, tracker_st.st_ino,
+              tracker_st.st_size, repr(tracker_st.st_mtime))
+    return ':'.join([str(field) for field in fields])
+
+
+def wc_write_fingerprint(path, tracker_filename):
+    """Write the consistency fingerprint of the working copy.
+
+    path is the path to the working copy and tracker_filename
+    is the name of the tracker storefile.
+    The fingerprint should only be written if the working
+    copy is consistent (for instance at the end of a transaction).
+    If the storedir is not writable, nothing is written.
+
+    """
+    global _FINGERPRINT
+    if not os.access(_storedir(path), os.W_OK):
+        return
+    fingerprint = wc_fingerprint(path, tracker_filename)
+    if fingerprint is not None:
+        _write_storefile(path, _FINGERPRINT, fingerprint)
+
+
+def wc_has_valid_fingerprint(path, tracker_filename):
+    """Check if the stored fingerprint matches the working copy.
+
+    path is the path to the working copy and tracker_filename
+    is the name of the tracker storefile.
+    Return True if the stored fingerprint is equal to the current
+    fingerprint (that is nothing changed since the last consistent
+    state). Otherwise False is returned.
+
+    """
+    global _FINGERPRINT
+    if missing_storepaths(path, _FINGERPRINT):
+        return False
+    fingerprint = wc_fingerprint(path, tracker_filename)
+    if fingerprint is None:
+        return False
+    return _read_storefile(path, _FINGERPRINT) == fingerprint
 
 
 def wc_is_project(path):
@@ -633,8 +1219,22 @@ def wc_read_project(path):
     return _read_storefile(path, '_project')
 
 
+def wc_packages_tracker(path):
+    """Return the tracker class which is used for the _packages file.
+
+    path is the path to the project working copy.
+    If the working copy has a compact store, the SqlitePackageTracker
+    class is returned, otherwise the XMLPackageTracker class.
+
+    """
+    global _COMPACT_VERSION
+    if wc_read_version(path) == _COMPACT_VERSION:
+        return SqlitePackageTracker
+    return XMLPackageTracker
+
+
 def wc_read_packages(path, raw=False):
-    """Return a XMLPackageTracker object.
+    """Return a XMLPackageTracker or SqlitePackageTracker object.
 
     path is the path to the project working copy.
     If the storefile does not exist or is no file
@@ -645,9 +1245,11 @@ def wc_read_packages(path, raw=False):
            instead of an object (default: False)
 
     """
+    tracker_class = wc_packages_tracker(path)
     if raw:
-        return _read_storefile(path, XMLPackageTracker.filename())
-    return XMLPackageTracker(path)
+        binary = tracker_class is SqlitePackageTracker
+        return _read_storefile(path, tracker_class.filename(), raw=binary)
+    return tracker_class(path)
 
 
 def wc_read_package(path):
@@ -673,8 +1275,36 @@ def wc_read_apiurl(path):
     return _read_storefile(path, '_apiurl')
 
 
+def wc_read_version(path):
+    """Return the working copy's format version.
+
+    path is the path to the working copy.
+    None is returned if the version file does not exist or
+    is invalid.
+
+    """
+    try:
+        return float(_read_storefile(path, '_version'))
+    except ValueError:
+        return None
+
+
+def wc_files_tracker(path):
+    """Return the tracker class which is used for the _files file.
+
+    path is the path to the package working copy.
+    If the working copy has a compact store, the BinaryFileTracker
+    class is returned, otherwise the XMLFileTracker class.
+
+    """
+    global _COMPACT_VERSION
+    if wc_read_version(path) == _COMPACT_VERSION:
+        return BinaryFileTracker
+    return XMLFileTracker
+
+
 def wc_read_files(path, raw=False):
-    """Return a XMLFileTracker object.
+    """Return a XMLFileTracker or BinaryFileTracker object.
 
     path is the path to the package working copy.
     If the storefile does not exist or is no file
@@ -685,9 +1315,11 @@ def wc_read_files(path, raw=False):
            instead of an object (default: False)
 
     """
+    tracker_class = wc_files_tracker(path)
     if raw:
-        return _read_storefile(path, '_files')
-    return XMLFileTracker(path)
+        binary = tracker_class is BinaryFileTracker
+        return _read_storefile(path, tracker_class.filename(), raw=binary)
+    return tracker_class(path)
 
 
 def wc_write_apiurl(path, apiurl):
@@ -723,30 +1355,72 @@ def wc_write_package(path, package):
 def wc_write_packages(path, xml_data):
     """Write the _packages file.
 
-    path is the path to the project working copy.
+    path is the path to the project working copy and
+    xml_data is the xml str. If the working copy has a
+    compact store, a new database is created from xml_data.
 
     """
-    _write_storefile(path, '_packages', xml_data)
+    tracker_class = wc_packages_tracker(path)
+    if tracker_class is SqlitePackageTracker:
+        tracker_class.create(path, xml_data)
+    else:
+        _write_storefile(path, tracker_class.filename(), xml_data)
 
 
 def wc_write_files(path, xml_data):
-    """Write the _packages file.
+    """Write the _files file.
 
     path is the path to the package working copy and
-    xml_data is the xml str.
+    xml_data is the xml str. If the working copy has a
+    compact store, xml_data is stored in the binary format.
 
     """
-    _write_storefile(path, '_files', xml_data)
+    tracker_class = wc_files_tracker(path)
+    if tracker_class is BinaryFileTracker:
+        data = BinaryFileTracker.fromxml(xml_data)
+        _write_storefile(path, tracker_class.filename(), data, raw=True)
+    else:
+        _write_storefile(path, tracker_class.filename(), xml_data)
 
 
-def wc_write_version(path):
+def wc_write_version(path, compact=False):
     """Write the working copy's format version.
 
     path is the path to the package working copy.
 
+    Keyword arguments:
+    compact -- write the format version of a working copy with
+               a compact store (default: False)
+
     """
-    global _VERSION
-    _write_storefile(path, '_version', str(_VERSION))
+    global _VERSION, _COMPACT_VERSION
+    version = _VERSION
+    if compact:
+        version = _COMPACT_VERSION
+    _write_storefile(path, '_version', str(version))
+
+
+def wc_repair_store_format(path, xml_tracker, compact_tracker):
+    """Repair the _version file and remove a stale tracker file.
+
+    path is the path to the working copy, xml_tracker is the
+    tracker class of the xml store and compact_tracker the
+    tracker class of the compact store.
+    If the _version file is missing, the compact format version
+    is written if the compact tracker file exists. Afterwards, the
+    tracker file of the format which is not used (according to the
+    _version file) is removed (for instance, a leftover of an
+    interrupted store conversion).
+
+    """
+    if missing_storepaths(path, '_version'):
+        compact = not missing_storepaths(path, compact_tracker.filename())
+        wc_write_version(path, compact=compact)
+    stale = compact_tracker
+    if wc_read_version(path) == _COMPACT_VERSION:
+        stale = xml_tracker
+    if not missing_storepaths(path, stale.filename()):
+        os.unlink(_storefile(path, stale.filename()))
 
 
 def wc_init(path, ext_storedir=None):
@@ -877,7 +1551,7 @@ def _wc_verify_format(storedir):
     invalid/unsupported wc version format.
 
     """
-    global _VERSION
+    global _VERSION, _COMPACT_VERSION
     filename = os.path.join(storedir, '_version')
     try:
         version_fmt = _read_file(filename)
@@ -888,8 +1562,10 @@ def _wc_verify_format(storedir):
         raise WCFormatVersionError(None)
     except ValueError as e:
         raise WCFormatVersionError(version_fmt)
-    if version_fmt - _VERSION >= 1 or version_fmt - _VERSION <= -1:
-        raise WCFormatVersionError(version_fmt)
+    for version in (_VERSION, _COMPACT_VERSION):
+        if abs(version_fmt - version) < 1:
+            return
+    raise WCFormatVersionError(version_fmt)
 
 
 def wc_parent(path):
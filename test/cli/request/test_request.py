@@ -0,0 +1,178 @@
+import threading
+import unittest
+from cStringIO import StringIO
+
+from osc2.remote import Request
+from osc2.cli.request.request import DiffPrefetcher, RequestController
+from test.osctest import OscTest
+
+
+def suite():
+    return unittest.TestSuite([unittest.makeSuite(TestDiffPrefetcher),
+                               unittest.makeSuite(TestRequestController)])
+
+
+class MockRequest(object):
+    """Mocks a Request object."""
+
+    def __init__(self, reqid, data, block=None):
+        self.reqid = reqid
+        self.data = data
+        self.block = block
+        self.started = threading.Event()
+        self.fetched = 0
+
+    def get(self, attr):
+        return self.reqid
+
+    def diff(self):
+        self.fetched += 1
+        self.started.set()
+        if self.block is not None:
+            self.block.wait()
+        return StringIO(self.data)
+
+
+class TestDiffPrefetcher(OscTest):
+    def test_prefetch1(self):
+        """test prefetch and diff"""
+        prefetcher = DiffPrefetcher()
+        requests = [MockRequest('1', 'diff1'), MockRequest('2', 'diff2')]
+        prefetcher.prefetch(requests)
+        # a second prefetch of the same requests is ignored
+        prefetcher.prefetch(requests)
+        self.assertEqual(prefetcher.diff(requests[1]), 'diff2')
+        self.assertEqual(prefetcher.diff(requests[0]), 'diff1')
+        self.assertEqual(prefetcher.diff(requests[0]), 'diff1')
+        self.assertEqual(requests[0].fetched, 1)
+        self.assertEqual(requests[1].fetched, 1)
+        # not prefetched
+        request = MockRequest('3', 'diff3')
+        self.assertEqual(prefetcher.diff(request), 'diff3')
+        self.assertEqual(request.fetched, 1)
+        prefetcher.close()
+
+    def test_prefetch2(self):
+        """test memory bound and discard"""
+        prefetcher = DiffPrefetcher(max_size=10, workers=1)
+        requests = [MockRequest('1', 'x' * 6), MockRequest('2', 'y' * 6),
+                    MockRequest('3', 'z' * 11)]
+        prefetcher.prefetch(requests)
+        self.assertEqual(prefetcher.diff(requests[2]), 'z' * 11)
+        # only the second diff is still cached
+        self.assertEqual(prefetcher.diff(requests[1]), 'y' * 6)
+        self.assertEqual(requests[1].fetched, 1)
+        self.assertEqual(prefetcher.diff(requests[0]), 'x' * 6)
+        self.assertEqual(requests[0].fetched, 2)
+        prefetcher.discard(requests[0])
+        self.assertEqual(prefetcher.diff(requests[0]), 'x' * 6)
+        self.assertEqual(requests[0].fetched, 3)
+        prefetcher.close()
+
+    def test_prefetch3(self):
+        """test cancellation"""
+        block = threading.Event()
+        prefetcher = DiffPrefetcher(workers=1)
+        requests = [MockRequest('1', 'diff1', block),
+                    MockRequest('2', 'diff2')]
+        prefetcher.prefetch(requests)
+        requests[0].started.wait()
+        threads = list(prefetcher._threads)
+        prefetcher.discard(requests[1])
+        prefetcher.close()
+        block.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(requests[0].fetched, 1)
+        self.assertEqual(requests[1].fetched, 0)
+        # the result of the running fetch was dropped
+        self.assertEqual(len(prefetcher._cache), 0)
+
+
+class MockRenderer(object):
+    """Collects the rendered requests and texts."""
+
+    def __init__(self):
+        self.rendered = []
+
+    def render(self, template, request):
+        self.rendered.append(request)
+
+    def render_text(self, text):
+        self.rendered.append(text)
+
+
+class MockInfo(object):
+    force = False
+
+
+class TestRequestController(OscTest):
+    def setUp(self):
+        super(TestRequestController, self).setUp()
+        self._patched = []
+        self.calls = []
+
+    def tearDown(self):
+        for cls, name, orig in self._patched:
+            if orig is None:
+                # inherited
+                delattr(cls, name)
+            else:
+                setattr(cls, name, orig)
+        super(TestRequestController, self).tearDown()
+
+    def _set(self, cls, name, func):
+        # store the raw descriptor (for instance a classmethod)
+        self._patched.append((cls, name, cls.__dict__.get(name)))
+        setattr(cls, name, staticmethod(func))
+
+    def _patch(self, errors=None):
+        calls = self.calls
+
+        def find(reqid):
+            calls.append(('find', reqid))
+            return reqid
+
+        def change_states(reqids, method, **kwargs):
+            calls.append(('change_states', list(reqids), method))
+            if errors is None:
+                return [(reqid, None) for reqid in reqids]
+            return [(reqid, errors.get(reqid)) for reqid in reqids]
+
+        def change_request_state(renderer, request, method, message, info,
+                                 supersede_id=None, review=None):
+            calls.append(('change_request_state', request, method))
+
+        self._set(Request, 'find', find)
+        self._set(Request, 'change_states', change_states)
+        self._set(RequestController, '_change_request_state',
+                  change_request_state)
+
+    def test_change_request_state1(self):
+        """a single request id does not use the batch path"""
+        self._patch()
+        RequestController.change_request_state(MockRenderer(), ['1'],
+                                               'accept', 'ok', MockInfo())
+        self.assertEqual(self.calls, [('find', '1'),
+                                      ('change_request_state', '1',
+                                       'accept')])
+
+    def test_change_request_state2(self):
+        """a failed batch state change raises after all results"""
+        self._patch(errors={'2': ValueError('failed')})
+        renderer = MockRenderer()
+        self.assertRaises(ValueError, RequestController.change_request_state,
+                          renderer, ['1', '2', '3'], 'decline', 'no',
+                          MockInfo())
+        self.assertEqual(self.calls,
+                         [('change_states', ['1', '2', '3'], 'decline')])
+        self.assertEqual(renderer.rendered, ['1', '2: failed', '3'])
+        # no error
+        renderer = MockRenderer()
+        RequestController.change_request_state(renderer, ['1', '3'],
+                                               'decline', 'no', MockInfo())
+        self.assertEqual(renderer.rendered, ['1', '3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,6 +19,7 @@ from test.util import test_xml
 from test.util import test_io
 from test.util import test_delegation
 from test.cli.util import test_shell
+from test.cli.request import test_request
 
 
 def additional_tests():
@@ -41,6 +42,7 @@ def additional_tests():
     suite.addTests(test_io.suite())
     suite.addTests(test_delegation.suite())
     suite.addTests(test_shell.suite())
+    suite.addTests(test_request.suite())
     return suite
 
 if __name__ == '__main__':
@@ -1,9 +1,15 @@
+import os
+import time
 import unittest
+import threading
 from cStringIO import StringIO
 
 from lxml import etree
 
-from osc2.build import BuildResult, BinaryList, BuildInfo, BuildDependency
+from osc2.build import (BuildResult, BinaryList, BuildInfo, BuildDependency,
+                        BuildInfoCache, BuildResultMonitor, BuildLog,
+                        DependencyGraph, Status)
+from osc2.util.xml import fromstring
 from test.osctest import OscTest
 from test.httptest import GET, POST
 
@@ -20,6 +26,9 @@ class TestBuild(OscTest):
     def tearDown(self):
         super(TestBuild, self).tearDown()
         BuildResult.RESULT_SCHEMA = ''
+        BuildResult.BUILDDEPINFO_SCHEMA = ''
+        BuildInfo.CACHE = None
+        BuildResult.DEPENDENCY_GRAPHS.clear()
 
     @GET('http://localhost/build/test/_result', file='prj_result.xml')
     def test_buildresult1(self):
@@ -129,6 +138,143 @@ class TestBuild(OscTest):
         br = BuildResult('test')
         self.assertRaises(etree.DocumentInvalid, br.result)
 
+    @GET('http://localhost/build/test/_result?arch=i586&arch=x86_64&'
+         'repository=openSUSE_Factory', file='prj_result.xml')
+    @GET('http://localhost/build/test/_result?arch=i586&arch=x86_64&'
+         'oldstate=11111111111111111111111111111111&'
+         'repository=openSUSE_Factory', file='prj_result2.xml')
+    def test_buildresultmonitor1(self):
+        """coalesce watches and long poll"""
+        monitor = BuildResultMonitor(long_poll=True)
+        monitor.watch('test', repository='openSUSE_Factory', arch='i586')
+        monitor.watch('test', repository='openSUSE_Factory', arch='x86_64')
+        # duplicate watch is ignored
+        monitor.watch('test', repository='openSUSE_Factory', arch='i586')
+        changed = monitor.poll()
+        self.assertEqual(len(changed), 6)
+        # only the osc i586 status changed
+        changed = monitor.poll()
+        self.assertEqual(len(changed), 1)
+        self.assertEqual(changed[0].get('package'), 'osc')
+        self.assertEqual(changed[0].get('code'), 'succeeded')
+        self.assertEqual(changed[0].details, 'built on host foo')
+        self.assertEqual(changed[0].getparent().get('arch'), 'i586')
+
+    @GET('http://localhost/build/test/_result?arch=i586&arch=x86_64&'
+         'package=osc&repository=openSUSE_Factory', file='prj_result.xml')
+    @GET('http://localhost/build/test/_result?arch=i586&arch=x86_64&'
+         'package=osc&repository=openSUSE_Factory', file='prj_result.xml')
+    def test_buildresultmonitor2(self):
+        """filter results and stream events"""
+        monitor = BuildResultMonitor()
+        monitor.watch('test', package='osc', repository='openSUSE_Factory',
+                      arch='x86_64')
+        monitor.watch('test', package='osc', repository='openSUSE_Factory',
+                      arch='i586')
+        events = monitor.events(interval=0)
+        status = events.next()
+        self.assertEqual(status.getparent().get('arch'), 'i586')
+        self.assertEqual(status.get('code'), 'building')
+        status = events.next()
+        self.assertEqual(status.getparent().get('arch'), 'x86_64')
+        self.assertEqual(status.get('code'), 'succeeded')
+        # nothing changed in the second poll
+        self.assertRaises(IndexError, events.next)
+
+    def test_buildresultmonitor3(self):
+        """concurrent requests for multiple projects"""
+        xml_data = open(self.fixture_file('prj_result.xml'), 'r').read()
+
+        class Monitor(BuildResultMonitor):
+            def _fetch(self, project, query):
+                self.queries.append((project, query))
+                return fromstring(xml_data, status=Status)
+
+        monitor = Monitor(workers=3)
+        monitor.queries = []
+        for project in ('foo', 'bar', 'baz'):
+            monitor.watch(project)
+        monitor.watch('foo', package='osc')
+        changed = monitor.poll()
+        self.assertEqual(len(changed), 18)
+        self.assertEqual(sorted(monitor.queries),
+                         [('bar', {}), ('baz', {}), ('foo', {})])
+
+    def test_buildresultmonitor4(self):
+        """long poll: a quiet project does not block the other events"""
+        xml_data = [open(self.fixture_file(fname), 'r').read()
+                    for fname in ('prj_result.xml', 'prj_result2.xml')]
+        release = threading.Event()
+
+        class Monitor(BuildResultMonitor):
+            def _fetch(self, project, query):
+                if project == 'quiet':
+                    # the server does not answer until something changes
+                    release.wait()
+                    return fromstring(xml_data[0], status=Status)
+                self.queries.append((time.time(), query))
+                data = xml_data[len(self.queries) % 2 == 0]
+                return fromstring(data, status=Status)
+
+        monitor = Monitor(workers=2, long_poll=True)
+        monitor.queries = []
+        monitor.watch('quiet')
+        monitor.watch('busy')
+        events = monitor.events(min_interval=0.2)
+        try:
+            # the initial statuses and two changes of the busy project
+            for i in xrange(8):
+                events.next()
+            self.assertFalse(release.is_set())
+            self.assertEqual(len(monitor.queries), 3)
+            self.assertFalse('oldstate' in monitor.queries[0][1])
+            self.assertTrue('oldstate' in monitor.queries[1][1])
+            # minimum delay between two requests
+            times = [t for t, query in monitor.queries]
+            self.assertTrue(times[1] - times[0] >= 0.19)
+            self.assertTrue(times[2] - times[1] >= 0.19)
+        finally:
+            release.set()
+            events.close()
+
+    def test_buildresultmonitor5(self):
+        """long poll: more projects than workers (fair rotation)"""
+        xml_data = [open(self.fixture_file(fname), 'r').read()
+                    for fname in ('prj_result.xml', 'prj_result2.xml')]
+        release = threading.Event()
+
+        class Monitor(BuildResultMonitor):
+            def _fetch(self, project, query):
+                if 'oldstate' in query:
+                    # the server does not answer until something changes
+                    release.wait()
+                queries = self.queries.setdefault(project, [])
+                queries.append(time.time())
+                data = xml_data[0]
+                if project == 'busy':
+                    data = xml_data[len(queries) % 2 == 0]
+                return fromstring(data, status=Status)
+
+        monitor = Monitor(workers=2, long_poll=True)
+        monitor.queries = {}
+        for project in ('quiet1', 'quiet2', 'busy'):
+            monitor.watch(project)
+        events = monitor.events(interval=0.1)
+        try:
+            while len(monitor.queries.get('busy', [])) < 4:
+                events.next()
+            self.assertFalse(release.is_set())
+            # the quiet projects are polled as well
+            self.assertTrue(len(monitor.queries['quiet1']) >= 2)
+            self.assertTrue(len(monitor.queries['quiet2']) >= 2)
+            # delay between two requests for the same project
+            times = monitor.queries['busy']
+            for i in xrange(1, len(times)):
+                self.assertTrue(times[i] - times[i - 1] >= 0.09)
+        finally:
+            release.set()
+            events.close()
+
     @GET('http://localhost/build/test/openSUSE_Factory/i586/_repository',
          file='binarylist1.xml')
     def test_binarylist1(self):
@@ -241,6 +387,53 @@ class TestBuild(OscTest):
         br = BuildResult('test', repository='repo', arch='x86_64')
         self.assertRaises(ValueError, br.log)
 
+    @GET('http://localhost/build/test/repo/i586/osc/_log?nostream=1&start=0',
+         text='logfile')
+    @GET('http://localhost/build/test/repo/i586/osc/_log?nostream=1&start=7',
+         text='')
+    def test_logfile3(self):
+        """read the logfile incrementally"""
+        br = BuildResult('test', package='osc', repository='repo', arch='i586')
+        log = br.log_reader(bufsize=3)
+        self.assertTrue(isinstance(log, BuildLog))
+        self.assertEqual(list(log.chunks()), ['log', 'fil', 'e'])
+        self.assertEqual(log.offset, 7)
+        # no new data
+        self.assertEqual(list(log.chunks()), [])
+        self.assertEqual(log.offset, 7)
+
+    @GET('http://localhost/build/test/repo/i586/osc/_log?nostream=1&start=0',
+         text='foo')
+    @GET('http://localhost/build/test/repo/i586/osc/_log?nostream=1&start=3',
+         text='')
+    @GET('http://localhost/build/test/_result?arch=i586&package=osc&'
+         'repository=repo',
+         text='<resultlist><result project="test" repository="repo" '
+              'arch="i586"><status package="osc" code="building" />'
+              '</result></resultlist>')
+    @GET('http://localhost/build/test/repo/i586/osc/_log?nostream=1&start=3',
+         text='bar')
+    @GET('http://localhost/build/test/repo/i586/osc/_log?nostream=1&start=6',
+         text='')
+    @GET('http://localhost/build/test/_result?arch=i586&package=osc&'
+         'repository=repo',
+         text='<resultlist><result project="test" repository="repo" '
+              'arch="i586"><status package="osc" code="succeeded" />'
+              '</result></resultlist>')
+    @GET('http://localhost/build/test/repo/i586/osc/_log?nostream=1&start=6',
+         text='\n')
+    def test_logfile4(self):
+        """follow the logfile"""
+        log = BuildLog('test', 'repo', 'i586', 'osc')
+        data = ''.join(log.follow(interval=0))
+        self.assertEqual(data, 'foobar\n')
+        self.assertEqual(log.offset, 7)
+
+    def test_logfile5(self):
+        """try to get log reader with insufficient arguments"""
+        br = BuildResult('test', repository='repo', arch='x86_64')
+        self.assertRaises(ValueError, br.log_reader)
+
     @GET('http://localhost/build/test/repo/x86_64/_repository/_builddepinfo?'
          'view=pkgnames',
          file='builddepinfo.xml')
@@ -288,6 +481,134 @@ class TestBuild(OscTest):
         br = BuildResult('test', repository='repo', arch='x86_64')
         self.assertRaises(etree.DocumentInvalid, br.builddepinfo)
 
+    @GET('http://localhost/build/test/repo/x86_64/_repository/_builddepinfo?'
+         'view=pkgnames',
+         file='builddepinfo.xml')
+    def test_dependencygraph1(self):
+        """test dependency graph of a builddepinfo"""
+        br = BuildResult('test', repository='repo', arch='x86_64')
+        graph = br.dependency_graph()
+        self.assertEqual(len(graph), 5)
+        self.assertTrue('osc' in graph)
+        self.assertTrue('python-devel' in graph)
+        self.assertFalse('osc-doc' in graph)
+        self.assertEqual(graph.dependencies('osc'), ['python', 'python-devel'])
+        self.assertEqual(graph.impact('bar'), ['foo'])
+        self.assertEqual(graph.impact('osc'), [])
+        self.assertEqual(graph.cycles(), [])
+        self.assertRaises(ValueError, graph.impact, 'osc-doc')
+
+    def test_dependencygraph2(self):
+        """test transitive queries, cycles and build order"""
+        graph = DependencyGraph()
+        graph.add('gcc', ['glibc'])
+        graph.add('glibc', ['gcc'])
+        graph.add('python', ['gcc', 'glibc'])
+        graph.add('osc', ['python'])
+        graph.add('osc-plugin', ['osc', 'osc'])
+        graph.add('foo', ['foo'])
+        self.assertEqual(graph.dependencies('osc-plugin', transitive=False),
+                         ['osc'])
+        self.assertEqual(graph.dependencies('osc'),
+                         ['gcc', 'glibc', 'python'])
+        self.assertEqual(graph.impact('python', transitive=False), ['osc'])
+        self.assertEqual(graph.impact('gcc'),
+                         ['gcc', 'glibc', 'osc', 'osc-plugin', 'python'])
+        self.assertEqual(graph.impact('osc', 'foo'), ['foo', 'osc-plugin'])
+        self.assertEqual(graph.cycles(), [['gcc', 'glibc'], ['foo']])
+        self.assertEqual(graph.build_order(),
+                         [['gcc', 'glibc'], ['python'], ['osc'],
+                          ['osc-plugin'], ['foo']])
+        # modifying the graph invalidates the cached query results
+        graph.add('foo', ['osc'])
+        self.assertEqual(graph.impact('osc'), ['foo', 'osc-plugin'])
+
+    @GET('http://localhost/build/test/repo/x86_64/_repository/_builddepinfo?'
+         'view=pkgnames',
+         file='builddepinfo.xml')
+    @GET('http://localhost/build/test/repo/x86_64/_repository/_builddepinfo?'
+         'view=pkgnames',
+         file='builddepinfo_revpkgnames.xml')
+    def test_dependencygraph3(self):
+        """test cached dependency graph"""
+        br = BuildResult('test', repository='repo', arch='x86_64')
+        graph = br.dependency_graph(state='1')
+        self.assertTrue(br.dependency_graph(state='1') is graph)
+        # the state changed
+        graph2 = br.dependency_graph(state='2')
+        self.assertFalse(graph2 is graph)
+        self.assertFalse('osc' in graph2)
+
+    @GET('http://localhost/build/test/repo/x86_64/_repository/_builddepinfo?'
+         'view=pkgnames',
+         file='builddepinfo.xml')
+    @GET('http://localhost/build/test/repo/x86_64/_repository/_builddepinfo?'
+         'package=osc&view=pkgnames',
+         file='builddepinfo_revpkgnames.xml')
+    @GET('http://other/build/test/repo/x86_64/_repository/_builddepinfo?'
+         'view=pkgnames',
+         file='builddepinfo_revpkgnames.xml')
+    def test_dependencygraph4(self):
+        """test cached dependency graph (request parameters and apiurl)"""
+        br = BuildResult('test', repository='repo', arch='x86_64')
+        graph = br.dependency_graph(state='1')
+        # a filtered graph is cached separately
+        graph2 = br.dependency_graph(state='1', package='osc')
+        self.assertFalse(graph2 is graph)
+        self.assertTrue(br.dependency_graph(state='1', package='osc')
+                        is graph2)
+        # a graph of a different server is cached separately
+        graph3 = br.dependency_graph(state='1', apiurl='http://other')
+        self.assertFalse(graph3 is graph)
+        self.assertTrue(br.dependency_graph(state='1') is graph)
+        # the default apiurl is part of the key
+        self.assertTrue(br.dependency_graph(state='1',
+                                            apiurl='http://localhost')
+                        is graph)
+
+    @GET('http://localhost/build/test/repo/x86_64/_repository/_builddepinfo?'
+         'package=a&view=pkgnames',
+         file='builddepinfo.xml')
+    @GET('http://localhost/build/test/repo/x86_64/_repository/_builddepinfo?'
+         'package=b&view=pkgnames',
+         file='builddepinfo.xml')
+    @GET('http://localhost/build/test/repo/x86_64/_repository/_builddepinfo?'
+         'package=c&view=pkgnames',
+         file='builddepinfo.xml')
+    @GET('http://localhost/build/test/repo/x86_64/_repository/_builddepinfo?'
+         'package=b&view=pkgnames',
+         file='builddepinfo.xml')
+    def test_dependencygraph5(self):
+        """test cached dependency graph (lru eviction)"""
+        BuildResult.MAX_DEPENDENCY_GRAPHS = 2
+        try:
+            br = BuildResult('test', repository='repo', arch='x86_64')
+            graph_a = br.dependency_graph(state='1', package='a')
+            graph_b = br.dependency_graph(state='1', package='b')
+            self.assertTrue(br.dependency_graph(state='1', package='a')
+                            is graph_a)
+            # b is the least recently used graph
+            br.dependency_graph(state='1', package='c')
+            self.assertEqual(len(BuildResult.DEPENDENCY_GRAPHS), 2)
+            self.assertTrue(br.dependency_graph(state='1', package='a')
+                            is graph_a)
+            self.assertFalse(br.dependency_graph(state='1', package='b')
+                             is graph_b)
+            self.assertEqual(len(BuildResult.DEPENDENCY_GRAPHS), 2)
+        finally:
+            BuildResult.MAX_DEPENDENCY_GRAPHS = 8
+
+    def test_dependencygraph6(self):
+        """test duplicate edges"""
+        graph = DependencyGraph()
+        graph.add('osc', ['python', 'python'])
+        graph.add('osc', ['python', 'osc-plugin'])
+        self.assertEqual(graph.dependencies('osc', transitive=False),
+                         ['osc-plugin', 'python'])
+        self.assertEqual(graph.impact('python'), ['osc'])
+        self.assertEqual(list(graph._rdeps[graph._id('python')]),
+                         [graph._id('osc')])
+
     @GET(('http://localhost/build/project/openSUSE_Factory/x86_64/package/'
           '_buildinfo'),
          file='buildinfo1.xml')
@@ -474,6 +795,170 @@ class TestBuild(OscTest):
         self.assertRaises(ValueError, BuildInfo,
                           xml_data=open(fname, 'r').read())
 
+    @GET(('http://localhost/build/project/openSUSE_Factory/x86_64/package/'
+          '_buildinfo'),
+         file='buildinfo1.xml')
+    def test_buildinfo_cache1(self):
+        """test BuildInfo (cached)"""
+        cache = BuildInfoCache(self.fixture_file('cache'))
+        binfo = BuildInfo('project', 'package', 'openSUSE_Factory', 'x86_64',
+                          cache=cache, state='abc')
+        self.assertEqual(len(binfo.bdep[:]), 4)
+        # no http request is made
+        binfo = BuildInfo('project', 'package', 'openSUSE_Factory', 'x86_64',
+                          cache=cache, state='abc')
+        self.assertEqual(len(binfo.bdep[:]), 4)
+        self.assertEqual(binfo.get('binarytype'), 'rpm')
+        # the default cache is used
+        BuildInfo.CACHE = cache
+        binfo = BuildInfo('project', 'package', 'openSUSE_Factory', 'x86_64',
+                          state='abc')
+        self.assertEqual(binfo.file, 'package.spec')
+
+    @GET(('http://localhost/build/project/openSUSE_Factory/x86_64/package/'
+          '_buildinfo'),
+         file='buildinfo1.xml')
+    @GET(('http://localhost/build/project/openSUSE_Factory/x86_64/package/'
+          '_buildinfo'),
+         file='buildinfo1.xml')
+    @GET(('http://other/build/project/openSUSE_Factory/x86_64/package/'
+          '_buildinfo'),
+         file='buildinfo1.xml')
+    @GET(('http://localhost/build/project/openSUSE_Factory/x86_64/package/'
+          '_buildinfo'),
+         file='buildinfo1.xml')
+    def test_buildinfo_cache4(self):
+        """test BuildInfo (cache key: state and apiurl)"""
+        cache = BuildInfoCache(self.fixture_file('cache'), max_age=None)
+        # without a state the cache is not used
+        for i in range(2):
+            BuildInfo('project', 'package', 'openSUSE_Factory', 'x86_64',
+                      cache=cache)
+        self.assertFalse(os.path.exists(self.fixture_file('cache')))
+        BuildInfo('project', 'package', 'openSUSE_Factory', 'x86_64',
+                  cache=cache, state='abc', apiurl='http://other')
+        # the explicit apiurl and the default apiurl are different
+        BuildInfo('project', 'package', 'openSUSE_Factory', 'x86_64',
+                  cache=cache, state='abc')
+        # the default apiurl is part of the key
+        BuildInfo('project', 'package', 'openSUSE_Factory', 'x86_64',
+                  cache=cache, state='abc', apiurl='http://localhost')
+        key = cache.key('project', 'package', 'openSUSE_Factory', 'x86_64',
+                        state='abc', apiurl='http://localhost')
+        self.assertIsNotNone(cache.get(key))
+
+    @GET(('http://localhost/build/project/openSUSE_Factory/x86_64/package/'
+          '_buildinfo'),
+         file='buildinfo1.xml')
+    @GET(('http://localhost/build/project/openSUSE_Factory/x86_64/package/'
+          '_buildinfo'),
+         file='buildinfo1.xml')
+    @GET(('http://localhost/build/project/openSUSE_Factory/x86_64/package/'
+          '_buildinfo?debug=1'),
+         file='buildinfo1.xml')
+    def test_buildinfo_cache2(self):
+        """test BuildInfo (cache misses and stale entries)"""
+        cache = BuildInfoCache(self.fixture_file('cache'), max_age=60)
+        BuildInfo('project', 'package', 'openSUSE_Factory', 'x86_64',
+                  cache=cache, state='abc')
+        # different state
+        BuildInfo('project', 'package', 'openSUSE_Factory', 'x86_64',
+                  cache=cache, state='def')
+        # different request parameters
+        BuildInfo('project', 'package', 'openSUSE_Factory', 'x86_64',
+                  cache=cache, state='def', debug='1')
+        key = cache.key('project', 'package', 'openSUSE_Factory', 'x86_64',
+                        state='def', apiurl='http://localhost')
+        self.assertIsNotNone(cache.get(key))
+        # make the entry stale
+        fname = self.fixture_file('cache', key[:2], key)
+        os.utime(fname, (0, 0))
+        self.assertIsNone(cache.get(key))
+        self.assertFalse(os.path.exists(fname))
+
+    @POST('http://localhost/build/foo/repo/x86_64/bar/_buildinfo',
+          file='buildinfo_uploaded_descr.xml', exp='12345')
+    @POST('http://localhost/build/foo/repo/x86_64/bar/_buildinfo',
+          file='buildinfo_uploaded_descr.xml', exp='123456')
+    def test_buildinfo_cache3(self):
+        """test BuildInfo (cached; POSTed data)"""
+        cache = BuildInfoCache(self.fixture_file('cache'), max_age=None)
+        for i in range(2):
+            binfo = BuildInfo('foo', 'bar', 'repo', 'x86_64',
+                              binarytype='rpm', data='12345', cache=cache,
+                              state='abc')
+            self.assertEqual(binfo.path[1].get('project'),
+                             'openSUSE:Factory')
+        BuildInfo('foo', 'bar', 'repo', 'x86_64', binarytype='rpm',
+                  data='123456', cache=cache, state='abc')
+        self.assertRaises(ValueError, BuildInfoCache,
+                          self.fixture_file('buildinfo1.xml'))
+
+    def test_buildinfo_index1(self):
+        """test BuildInfo (indexed bdep lookups)"""
+        fname = self.fixture_file('buildinfo2.xml')
+        binfo = BuildInfo(xml_data=open(fname, 'r').read())
+        bdep = binfo.find_bdep('attr')
+        self.assertEqual(bdep.get('version'), '2.4.46')
+        self.assertIsNone(binfo.find_bdep('unknown'))
+        bdeps = binfo.prpap_bdeps('openSUSE:Factory/standard/i586/'
+                                  'installation-images')
+        self.assertEqual([b.get('name') for b in bdeps],
+                         ['install-initrd', 'install-initrd-branding-openSUSE',
+                          'install-initrd-branding-SLED'])
+        # no repoarch => binfo.arch
+        bdeps = binfo.prpap_bdeps('openSUSE:Factory/snapshot/x86_64/'
+                                  '_repository')
+        self.assertEqual(len(bdeps), 4)
+        self.assertEqual(binfo.prpap_bdeps('foo/bar/x86_64/baz'), [])
+        # the indexed lists are not modified by a consumer
+        self.assertEqual(len(list(binfo.vminstall())), 3)
+        self.assertEqual(len(list(binfo.vminstall())), 3)
+
+    def test_builddependency_cache1(self):
+        """test BuildDependency (cached filename and binarytype)"""
+        fname = self.fixture_file('buildinfo2.xml')
+        binfo = BuildInfo(xml_data=open(fname, 'r').read())
+        bdep = binfo.find_bdep('aaa_base')
+        self.assertEqual(bdep.get('filename'),
+                         'aaa_base-12.2-7.1.x86_64.rpm')
+        self.assertEqual(bdep.get('binarytype'), 'rpm')
+        # no child elements were created
+        self.assertEqual(len(bdep.getchildren()), 0)
+        # a set invalidates the cached values
+        bdep.set('binary', 'aaa_base.rpm')
+        self.assertEqual(bdep.get('filename'), 'aaa_base.rpm')
+        bdep.set('binarytype', 'deb')
+        self.assertEqual(bdep.get('binarytype'), 'deb')
+
+    def test_builddependency_cache2(self):
+        """test BuildDependency (cache invalidation)"""
+        fname = self.fixture_file('buildinfo2.xml')
+        binfo = BuildInfo(xml_data=open(fname, 'r').read())
+        bdep = binfo.find_bdep('aaa_base')
+        self.assertEqual(bdep.get('filename'),
+                         'aaa_base-12.2-7.1.x86_64.rpm')
+        # the value is cached in the index of the buildinfo
+        index = binfo._build_index()
+        self.assertEqual(index['derived'][id(bdep)]['filename'],
+                         'aaa_base-12.2-7.1.x86_64.rpm')
+        # an attrib write invalidates the cached values and indexes
+        preinstall = len(list(binfo.preinstall()))
+        bdep.attrib['binary'] = 'aaa_base.rpm'
+        self.assertEqual(bdep.get('filename'), 'aaa_base.rpm')
+        del bdep.attrib['binary']
+        self.assertEqual(bdep.get('filename'),
+                         'aaa_base-12.2-7.1.x86_64.rpm')
+        bdep.attrib['preinstall'] = '0'
+        self.assertEqual(len(list(binfo.preinstall())), preinstall - 1)
+        self.assertEqual(dict(bdep.attrib)['preinstall'], '0')
+        # a binarytype change of the buildinfo invalidates them as well
+        self.assertEqual(bdep.get('binarytype'), 'rpm')
+        binfo.set('binarytype', 'deb')
+        self.assertEqual(bdep.get('binarytype'), 'deb')
+        self.assertEqual(binfo.find_bdep('aaa_base').get('binarytype'),
+                         'deb')
+
     def test_builddependency1(self):
         """teste BuildDependency (rpm filename)"""
         fname = self.fixture_file('buildinfo2.xml')
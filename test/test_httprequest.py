@@ -1,15 +1,51 @@
+import os
+import ssl
+import json
+import time
+import errno
+import socket
+import httplib
+import zlib
 import unittest
 import urllib2
+import threading
+import BaseHTTPServer
+import SocketServer
+from cStringIO import StringIO
 
 from lxml import etree
 
 from test.osctest import OscTest
-from osc2.httprequest import Urllib2HTTPRequest, HTTPError
+from osc2.httprequest import (Urllib2HTTPRequest, HTTPError,
+                              AsyncHTTPRequest, HTTPFuture, HTTPStats,
+                              request_tag, RetryPolicy, AbstractHTTPRequest,
+                              request_xml)
+from osc2.util.xml import get_parser, OscElement
 from test.httptest import GET, PUT, POST, DELETE
 
 
 def suite():
-    return unittest.makeSuite(TestHTTPRequest)
+    suite = unittest.makeSuite(TestHTTPRequest)
+    suite.addTest(unittest.makeSuite(TestLocalServer))
+    return suite
+
+
+class DirectoryElement(OscElement):
+    pass
+
+
+class LegacyHTTPRequest(AbstractHTTPRequest):
+    """A request object which does not support the parser keyword."""
+
+    def __init__(self, *args, **kwargs):
+        super(LegacyHTTPRequest, self).__init__(*args, **kwargs)
+        self.requests = []
+
+    def get(self, path, apiurl='', schema='', **query):
+        self.requests.append((path, query))
+        # a file-like object without a parse method
+        return StringIO('<directory><entry name="foo" />'
+                        '<entry name="bar" /></directory>')
 
 
 class TestHTTPRequest(OscTest):
@@ -224,5 +260,521 @@ class TestHTTPRequest(OscTest):
                      z=[''], a=['', None])
         self.assertEqual(resp.read(), 'foo')
 
+    @GET('http://localhost/source', file='prj_list.xml')
+    @GET('http://localhost/source', file='prj_list.xml')
+    def test24(self):
+        """reuse the validated tree (single parse)"""
+        r = Urllib2HTTPRequest('http://localhost', True, '', '', '', False)
+        parser = get_parser()
+        resp = r.get('/source', schema=self.fixture_file('directory.xsd'),
+                     parser=parser)
+        root = resp.parse(parser)
+        self.assertEqual(root.tag, 'directory')
+        self.assertTrue(resp.parse(parser) is root)
+        # the data can still be read
+        self.assertEqual(resp.read(), self.read_file('prj_list.xml'))
+        # no validation: the response is parsed by parse
+        resp = r.get('/source', parser=parser)
+        self.assertIsNone(resp._sio)
+        self.assertEqual(resp.parse(parser).tag, 'directory')
+
+    @GET('http://localhost/source?foo=bar', file='prj_list.xml')
+    def test25(self):
+        """test request_xml"""
+        r = Urllib2HTTPRequest('http://localhost', True, '', '', '', False)
+        parser = get_parser(directory=DirectoryElement)
+        root = request_xml(r, 'GET', '/source', parser, foo='bar',
+                           schema=self.fixture_file('directory.xsd'))
+        self.assertTrue(isinstance(root, DirectoryElement))
+        # a request object which does not know the parser keyword
+        r = LegacyHTTPRequest('http://localhost')
+        root = request_xml(r, 'GET', '/source', parser, foo='bar')
+        self.assertTrue(isinstance(root, DirectoryElement))
+        self.assertEqual(len(root.findall('entry')), 2)
+        self.assertEqual(r.requests, [('/source', {'foo': 'bar'})])
+
+    @GET('http://localhost/source', text='foobar')
+    @PUT('http://localhost/source/foo/bar/file', exp='this is a test',
+         text='ok')
+    def test_async1(self):
+        """simple asynchronous get and put"""
+        r = Urllib2HTTPRequest('http://localhost', True, '', '', '', False)
+        ar = AsyncHTTPRequest(r, workers=2)
+        f = ar.aget('/source')
+        self.assertEqual(f.result(5).read(), 'foobar')
+        self.assertTrue(f.done())
+        self.assertIsNone(f.exception())
+        f = ar.aput('/source/foo/bar/file', data='this is a test')
+        self.assertEqual(f.result(5).read(), 'ok')
+        ar.close()
+
+    @GET('http://localhost/source', text='not found', code=404)
+    def test_async2(self):
+        """asynchronous get (404)"""
+        r = Urllib2HTTPRequest('http://localhost', True, '', '', '', False)
+        ar = AsyncHTTPRequest(r)
+        f = ar.aget('/source')
+        self.assertRaises(HTTPError, f.result, 5)
+        self.assertEqual(f.exception().code, 404)
+        ar.close()
+
+    def test_async3(self):
+        """test HTTPFuture callbacks and timeout"""
+        f = HTTPFuture()
+        self.assertRaises(ValueError, f.result, 0.01)
+        done = []
+        f.add_done_callback(done.append)
+        self.assertEqual(done, [])
+        f._finish('foo')
+        self.assertEqual(done, [f])
+        f.add_done_callback(done.append)
+        self.assertEqual(done, [f, f])
+        self.assertEqual(f.result(), 'foo')
+        # python 2.6's Event.wait always returns None
+        f._event.wait = lambda timeout=None: None
+        self.assertEqual(f.result(0.01), 'foo')
+        self.assertIsNone(f.exception(0.01))
+        f = HTTPFuture()
+        f._event.wait = lambda timeout=None: None
+        self.assertRaises(ValueError, f.result, 0.01)
+
+    def test_async4(self):
+        """test a raising done callback (the worker survives)"""
+        r = Urllib2HTTPRequest('http://localhost', True, '', '', '', False)
+        ar = AsyncHTTPRequest(r, workers=1)
+        started = threading.Event()
+
+        def callback(future):
+            raise RuntimeError('callback failed')
+
+        f = ar.submit(started.wait, 5)
+        # the callback is called by the worker thread
+        f.add_done_callback(callback)
+        started.set()
+        self.assertTrue(f.result(5))
+        f = ar.submit(lambda: 'foo')
+        self.assertEqual(f.result(5), 'foo')
+        self.assertEqual([t.is_alive() for t in ar._threads], [True])
+        # a callback which is called immediately does not raise either
+        f.add_done_callback(callback)
+        ar.close()
+
+    @GET('http://localhost/source?foo=bar', text='foobar')
+    @GET('http://localhost/source/prj', text='not found', code=404)
+    def test_stats1(self):
+        """test request events"""
+        stats = HTTPStats()
+        r = Urllib2HTTPRequest('http://localhost', listener=[stats])
+        resp = r.get('/source', foo='bar')
+        # the event is emitted after the response was read
+        self.assertEqual(stats.events, [])
+        self.assertEqual(resp.read(3), 'foo')
+        self.assertEqual(resp.read(), 'bar')
+        self.assertEqual(len(stats.events), 1)
+        event = stats.events[0]
+        self.assertEqual(event.method, 'GET')
+        self.assertEqual(event.url, 'http://localhost/source?foo=bar')
+        self.assertEqual(event.path, '/source')
+        self.assertEqual(event.status, 200)
+        self.assertEqual(event.bytes_in, 6)
+        self.assertEqual(event.bytes_out, 0)
+        self.assertIsNone(event.error)
+        self.assertTrue(event.ttfb <= event.total)
+        # the caller is used as the default tag
+        self.assertEqual(event.tag, 'test.test_httprequest:test_stats1')
+        self.assertRaises(HTTPError, r.get, '/source/prj')
+        self.assertEqual(len(stats.events), 2)
+        event = stats.events[1]
+        self.assertEqual(event.status, 404)
+        self.assertIsNotNone(event.error)
+        self.assertIsNone(event.ttfb)
+
+    @PUT('http://localhost/source/foo/bar/file', exp='this is a test',
+         text='ok')
+    @POST('http://localhost/source/foo?cmd=commit', exp='foo', text='ok')
+    @GET('http://localhost/source', file='prj_list.xml')
+    def test_stats2(self):
+        """test request tags, summary and trace"""
+        stats = HTTPStats()
+        r = Urllib2HTTPRequest('http://localhost', True, listener=[stats])
+        with request_tag('commit'):
+            r.put('/source/foo/bar/file', data='this is a test').read()
+            with request_tag('commit:post'):
+                r.post('/source/foo', data='foo', cmd='commit').close()
+        # the response is read completely during the validation
+        r.get('/source', schema=self.fixture_file('directory.xsd'))
+        self.assertEqual([e.tag for e in stats.events],
+                         ['commit', 'commit:post',
+                          'test.test_httprequest:test_stats2'])
+        self.assertEqual(stats.events[0].bytes_out, 14)
+        self.assertEqual(stats.events[0].bytes_in, 2)
+        self.assertEqual(stats.events[1].bytes_out, 3)
+        self.assertEqual(stats.events[2].bytes_in,
+                         len(self.read_file('prj_list.xml')))
+        summary = stats.summary(key='method')
+        self.assertEqual(sorted([d['key'] for d in summary]),
+                         ['GET', 'POST', 'PUT'])
+        self.assertEqual(sum([d['requests'] for d in summary]), 3)
+        self.assertTrue('PUT' in stats.format_summary(key='method'))
+        sio = StringIO()
+        stats.write_trace(sio)
+        trace = json.loads(sio.getvalue())
+        self.assertEqual(len(trace['events']), 3)
+        self.assertEqual(trace['events'][0]['path'], '/source/foo/bar/file')
+        self.assertEqual(trace['events'][0]['tag'], 'commit')
+
+    @GET('http://localhost/source', text='foobar')
+    def test_stats3(self):
+        """test request tags of asynchronous requests"""
+        stats = HTTPStats()
+        r = Urllib2HTTPRequest('http://localhost', listener=[stats])
+        ar = AsyncHTTPRequest(r)
+        with request_tag('async'):
+            f = ar.aget('/source')
+        self.assertEqual(f.result(5).read(), 'foobar')
+        self.assertEqual(stats.events[0].tag, 'async')
+        ar.close()
+
+
+class LocalHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def _fault(self):
+        """Injects a fault (if specified for the path).
+
+        Returns True if the request was handled.
+
+        """
+        path = self.path.split('?')[0]
+        self.server.requests.append((self.command, path))
+        faults = self.server.faults.get(path)
+        if not faults:
+            return False
+        fault = faults.pop(0)
+        if fault[0] == 'status':
+            data = 'error'
+            self.send_response(fault[1])
+            for k, v in fault[2].iteritems():
+                self.send_header(k, v)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return True
+        elif fault[0] == 'reset':
+            self.close_connection = 1
+            return True
+        # sleep
+        time.sleep(fault[1])
+        return False
+
+    def _send(self, data, truncate=0):
+        accept = self.headers.get('Accept-Encoding', '')
+        self.send_response(200)
+        if 'gzip' in accept:
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            data = compressor.compress(data) + compressor.flush()
+            data = data[:len(data) - truncate]
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.server.clients.add(self.client_address)
+        if self._fault():
+            return
+        if self.path.startswith('/large'):
+            data = LARGE_DATA
+        else:
+            data = 'path: %s' % self.path
+        truncate = 0
+        if self.path.startswith('/large/truncated'):
+            # cut off the gzip trailer (crc32 and size)
+            truncate = 4
+        self._send(data, truncate)
+
+    def do_PUT(self):
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        if self._fault():
+            return
+        encoding = self.headers.get('Content-Encoding', 'identity')
+        if encoding == 'gzip':
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        self.server.bodies.append((encoding, data))
+        self._send('ok')
+
+    do_POST = do_PUT
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+LARGE_DATA = ''.join(['<entry name="file%d" md5="%032d" />\n' % (i, i)
+                      for i in range(2000)])
+
+
+class TestLocalServer(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer(('127.0.0.1', 0), LocalHandler)
+        self.server.clients = set()
+        self.server.bodies = []
+        self.server.requests = []
+        self.server.faults = {}
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={'poll_interval': 0.01})
+        self.thread.daemon = True
+        self.thread.start()
+        self.apiurl = 'http://127.0.0.1:%d' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        urllib2.install_opener(None)
+
+    def test_keepalive1(self):
+        """reuse the connection"""
+        r = Urllib2HTTPRequest(self.apiurl, keepalive=True)
+        for i in range(5):
+            resp = r.get('/source/%d' % i)
+            self.assertEqual(resp.read(), 'path: /source/%d' % i)
+        self.assertEqual(len(self.server.clients), 1)
+        r._pool.close()
+
+    def test_keepalive2(self):
+        """no keepalive (a new connection per request)"""
+        r = Urllib2HTTPRequest(self.apiurl)
+        for i in range(3):
+            resp = r.get('/source')
+            self.assertEqual(resp.read(), 'path: /source')
+            resp.close()
+        self.assertEqual(len(self.server.clients), 3)
+
+    def test_keepalive3(self):
+        """resend only idempotent requests on a reused connection"""
+        r = Urllib2HTTPRequest(self.apiurl, keepalive=True)
+        r.get('/source').read()
+        # the server silently closes the idle connection
+        self.server.faults['/source'] = [('reset', )]
+        self.assertEqual(r.get('/source').read(), 'path: /source')
+        self.assertEqual(len(self.server.requests), 3)
+        self.server.faults['/source/prj/pkg'] = [('reset', )]
+        self.assertRaises(urllib2.URLError, r.post, '/source/prj/pkg',
+                          data='foo', cmd='commit')
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(self.server.bodies, [])
+        r._pool.close()
+
+    def test_keepalive4(self):
+        """a request via a proxy is not pooled"""
+        old = os.environ.get('http_proxy')
+        os.environ['http_proxy'] = self.apiurl
+        try:
+            r = Urllib2HTTPRequest('http://localhost.invalid',
+                                   keepalive=True)
+        finally:
+            if old is None:
+                del os.environ['http_proxy']
+            else:
+                os.environ['http_proxy'] = old
+        resp = r.get('/source')
+        self.assertEqual(resp.read(),
+                         'path: http://localhost.invalid/source')
+        self.assertEqual(self.server.requests,
+                         [('GET', 'http://localhost.invalid/source')])
+        self.assertEqual(r._pool._idle, {})
+
+    def test_decode1(self):
+        """decode a gzip encoded response"""
+        stats = HTTPStats()
+        r = Urllib2HTTPRequest(self.apiurl, listener=[stats])
+        resp = r.get('/large')
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertFalse('Content-Length' in resp.headers)
+        self.assertEqual(resp.read(), LARGE_DATA)
+        # only the compressed bytes were transferred
+        self.assertTrue(stats.events[0].bytes_in < len(LARGE_DATA) / 10)
+
+    def test_decode2(self):
+        """read a gzip encoded response in chunks (keepalive)"""
+        r = Urllib2HTTPRequest(self.apiurl, keepalive=True)
+        for i in range(2):
+            resp = r.get('/large')
+            data = []
+            chunk = resp.read(1000)
+            while chunk:
+                self.assertTrue(len(chunk) <= 1000)
+                data.append(chunk)
+                chunk = resp.read(1000)
+            self.assertEqual(''.join(data), LARGE_DATA)
+        self.assertEqual(len(self.server.clients), 1)
+        r._pool.close()
+
+    def test_decode3(self):
+        """do not request an encoded response"""
+        stats = HTTPStats()
+        r = Urllib2HTTPRequest(self.apiurl, listener=[stats], decode=False)
+        resp = r.get('/large')
+        self.assertFalse('Content-Encoding' in resp.headers)
+        self.assertEqual(resp.headers['Content-Length'],
+                         str(len(LARGE_DATA)))
+        self.assertEqual(resp.read(), LARGE_DATA)
+        self.assertEqual(stats.events[0].bytes_in, len(LARGE_DATA))
+
+    def test_decode4(self):
+        """a truncated gzip encoded response is an error"""
+        r = Urllib2HTTPRequest(self.apiurl)
+        resp = r.get('/large/truncated')
+        self.assertRaises(IOError, resp.read)
+        self.assertRaises(IOError, resp.read)
+        resp = r.get('/large/truncated')
+        self.assertTrue(len(resp.read(1000)) == 1000)
+        self.assertRaises(IOError, resp.read)
+
+    def test_compress1(self):
+        """compress uploads"""
+        stats = HTTPStats()
+        r = Urllib2HTTPRequest(self.apiurl, listener=[stats],
+                               compress_uploads=True)
+        r.put('/source/prj/pkg/file', data=LARGE_DATA).read()
+        # small or already compressed data is sent as is
+        r.put('/source/prj/pkg/small', data='small').read()
+        gz = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        gz = gz.compress(LARGE_DATA) + gz.flush()
+        r.put('/source/prj/pkg/file.gz', data=gz).read()
+        self.assertEqual(self.server.bodies,
+                         [('gzip', LARGE_DATA), ('identity', 'small'),
+                          ('identity', gz)])
+        self.assertTrue(stats.events[0].bytes_out < len(LARGE_DATA) / 10)
+        self.assertEqual(stats.events[2].bytes_out, len(gz))
+
+    def test_compress2(self):
+        """do not compress uploads (default)"""
+        r = Urllib2HTTPRequest(self.apiurl)
+        r.put('/source/prj/pkg/file', data=LARGE_DATA).read()
+        self.assertEqual(self.server.bodies, [('identity', LARGE_DATA)])
+
+    def _retry_request(self, **kwargs):
+        policy = RetryPolicy(backoff=0.01, **kwargs)
+        policy.delays = []
+        policy.sleep = policy.delays.append
+        stats = HTTPStats()
+        r = Urllib2HTTPRequest(self.apiurl, listener=[stats],
+                               retry_policy=policy)
+        return r, policy, stats
+
+    def test_retry1(self):
+        """retry a GET request (5xx and connection reset)"""
+        r, policy, stats = self._retry_request()
+        self.server.faults['/source'] = [('status', 500, {}), ('reset', ),
+                                         ('status', 503, {})]
+        self.assertEqual(r.get('/source').read(), 'path: /source')
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(len(policy.delays), 3)
+        # exponential backoff
+        self.assertTrue(0.005 <= policy.delays[0] <= 0.01)
+        self.assertTrue(0.02 <= policy.delays[2] <= 0.04)
+        self.assertEqual([e.attempt for e in stats.events], [1, 2, 3, 4])
+        self.assertEqual([e.status for e in stats.events],
+                         [500, None, 503, 200])
+        self.assertTrue(stats.events[-1].error is None)
+
+    def test_retry2(self):
+        """give up after the specified number of retries"""
+        r, policy, stats = self._retry_request(retries=2)
+        self.server.faults['/source'] = [('status', 502, {})] * 3
+        try:
+            r.get('/source')
+            self.fail('HTTPError expected')
+        except HTTPError as e:
+            self.assertEqual(e.code, 502)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(stats.events), 3)
+        # no retry for a 404
+        self.server.faults['/prj'] = [('status', 404, {})]
+        self.assertRaises(HTTPError, r.get, '/prj')
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_retry3(self):
+        """only idempotent requests are retried"""
+        r, policy, stats = self._retry_request()
+        self.server.faults['/source/prj/pkg'] = [('status', 503, {})]
+        self.assertRaises(HTTPError, r.post, '/source/prj/pkg',
+                          data='foo', cmd='commit')
+        self.server.faults['/source/prj/pkg/file'] = [('status', 503, {})]
+        self.assertRaises(HTTPError, r.put, '/source/prj/pkg/file',
+                          data='foo')
+        # but a PUT into the source repository can be retried
+        self.server.faults['/source/prj/pkg/file'] = [('status', 503, {})]
+        r.put('/source/prj/pkg/file', data='foo', rev='repository').read()
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(self.server.bodies, [('identity', 'foo')])
+
+    def test_retry4(self):
+        """respect the Retry-After header"""
+        r, policy, stats = self._retry_request()
+        self.server.faults['/source'] = [('status', 503,
+                                          {'Retry-After': '3'})]
+        self.assertEqual(r.get('/source').read(), 'path: /source')
+        self.assertEqual(policy.delays, [3.0])
+        # do not retry if the server asks for a too long delay
+        self.server.faults['/source'] = [('status', 429,
+                                          {'Retry-After': '600'})]
+        self.assertRaises(HTTPError, r.get, '/source')
+        self.assertEqual(policy.delays, [3.0])
+
+    def test_hedge1(self):
+        """hedge a slow GET request"""
+        r, policy, stats = self._retry_request(hedge_after=0.05)
+        self.server.faults['/source'] = [('sleep', 2.0)]
+        start = time.time()
+        self.assertEqual(r.get('/source').read(), 'path: /source')
+        self.assertTrue(time.time() - start < 1.0)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertTrue(stats.events[0].hedged)
+        # a fast request is not hedged
+        self.assertEqual(r.get('/fast').read(), 'path: /fast')
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertFalse(stats.events[1].hedged)
+
+    def test_retry_policy1(self):
+        """test the RetryPolicy"""
+        policy = RetryPolicy(backoff=1.0, max_backoff=5.0, jitter=0.0)
+        exc = urllib2.HTTPError('http://localhost', 503, 'error', {}, None)
+        self.assertEqual([policy.delay(i, exc) for i in range(1, 5)],
+                         [1.0, 2.0, 4.0, None])
+        policy.retries = 10
+        self.assertEqual(policy.delay(5, exc), 5.0)
+        exc = urllib2.HTTPError('http://localhost', 400, 'error', {}, None)
+        self.assertTrue(policy.delay(1, exc) is None)
+        exc = urllib2.HTTPError('http://localhost', 503, 'error',
+                                {'Retry-After': 'Thu, 01 Jan 1970 00:00:00 '
+                                                'GMT'}, None)
+        self.assertEqual(policy.delay(1, exc), 1.0)
+        self.assertTrue(policy.idempotent('GET', 'http://localhost/source'))
+        self.assertFalse(policy.idempotent('GET', 'http://localhost/source',
+                                           data=StringIO('foo')))
+        self.assertTrue(policy.idempotent('PUT', 'http://localhost/source/'
+                                          'prj/pkg/file?rev=repository'))
+        self.assertFalse(policy.idempotent('PUT', 'http://localhost/source/'
+                                           'prj/pkg/file?rev=1'))
+        self.assertFalse(policy.idempotent('POST', 'http://localhost/source'))
+        # only resets and timeouts are transient errors
+        reset = socket.error(errno.ECONNRESET, 'Connection reset by peer')
+        self.assertTrue(policy.retryable(urllib2.URLError(reset)))
+        self.assertTrue(policy.retryable(socket.timeout('timed out')))
+        self.assertTrue(policy.retryable(httplib.BadStatusLine('')))
+        exc = socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        self.assertFalse(policy.retryable(urllib2.URLError(exc)))
+        exc = ssl.SSLError(1, 'certificate verify failed')
+        self.assertFalse(policy.retryable(urllib2.URLError(exc)))
+        exc = socket.error(errno.ECONNREFUSED, 'Connection refused')
+        self.assertFalse(policy.retryable(urllib2.URLError(exc)))
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,9 @@
 import os
-import unittest
+import time
 import stat
+import zlib
+import unittest
+import threading
 from cStringIO import StringIO, OutputType
 
 from lxml import etree
@@ -16,6 +19,15 @@ def suite():
     return unittest.makeSuite(TestRemoteModel)
 
 
+def gzip_encode(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+# a large file which is small if it is gzip encoded
+LARGE = 'large file\n' * 100000
+LARGE_GZIP = gzip_encode(LARGE)
+
+
 class TestRemoteModel(OscTest):
     def __init__(self, *args, **kwargs):
         kwargs['fixtures_dir'] = 'test_remote_fixtures'
@@ -151,6 +163,14 @@ class TestRemoteModel(OscTest):
         """test delete method"""
         self.assertFalse(RemoteProject.delete('foo'))
 
+    @GET('http://localhost/source/foo/_meta', file='project.xml')
+    def test_project13(self):
+        """test afind method"""
+        future = RemoteProject.afind('foo')
+        prj = future.result(5)
+        self.assertTrue(isinstance(prj, RemoteProject))
+        self.assertEqual(prj.get('name'), 'foo')
+
     @GET('http://localhost/source/openSUSE%3ATools/osc/_meta',
          file='package.xml')
     def test_package1(self):
@@ -449,6 +469,93 @@ class TestRemoteModel(OscTest):
         self.assertEqual(req.state.get('superseded_by'), '59130')
         self.assertEqual(req.state.comment, 'already accepted')
 
+    @GET('http://localhost/request/73270', file='request2.xml')
+    @POST(('http://localhost/request/73270?cmd=changestate'
+           '&comment=thanks&newstate=accepted'),
+          file='request2_accepted.xml')
+    def test_request_change_state1(self):
+        """test state change (response contains the new request)"""
+        req = Request.find('73270')
+        req.accept(comment='thanks')
+        # no additional GET request
+        self.assertEqual(req.state.get('name'), 'accepted')
+        self.assertEqual(req.state.comment, 'thanks')
+
+    @GET('http://localhost/request/73270', file='request2.xml')
+    @POST(('http://localhost/request/73270?cmd=changestate'
+           '&comment=thanks&newstate=accepted'),
+          text='<OK/>')
+    @GET('http://localhost/request/73270', file='request2_accepted.xml')
+    @GET('http://localhost/request/1', code=404, text='not found')
+    @POST(('http://localhost/request/73270?cmd=changestate'
+           '&comment=thanks&newstate=accepted'),
+          code=400, text='<status code="invalid_state" />')
+    def test_request_change_states1(self):
+        """test concurrent state changes"""
+        req = Request(xml_data=open(self.fixture_file('request2.xml')).read())
+        results = Request.change_states(['73270', '1', req], 'accept',
+                                        workers=1, comment='thanks')
+        self.assertEqual(len(results), 3)
+        request, error = results[0]
+        self.assertTrue(error is None)
+        self.assertEqual(request.state.get('name'), 'accepted')
+        request, error = results[1]
+        self.assertEqual(request, '1')
+        self.assertEqual(error.code, 404)
+        request, error = results[2]
+        self.assertTrue(request is req)
+        self.assertEqual(error.code, 400)
+        self.assertEqual(req.state.get('name'), 'new')
+        # unsupported method
+        self.assertRaises(ValueError, Request.change_states, ['1'],
+                          'delete')
+
+    def test_request_change_states2(self):
+        """test concurrent state changes (multiple workers)"""
+        xml_data = open(self.fixture_file('request2.xml')).read()
+        requests = [Request(xml_data=xml_data) for i in xrange(6)]
+        ids = [id(req) for req in requests]
+        accepted = {}
+        cond = threading.Condition()
+        state = {'running': 0, 'max_running': 0}
+        threads = set()
+
+        def accept(req, comment):
+            with cond:
+                threads.add(threading.current_thread().ident)
+                state['running'] += 1
+                state['max_running'] = max(state['running'],
+                                           state['max_running'])
+                cond.notify_all()
+                # wait (at most 5s) until a second worker runs
+                end = time.time() + 5
+                while state['max_running'] < 2 and time.time() < end:
+                    cond.wait(end - time.time())
+                state['running'] -= 1
+            if ids.index(id(req)) == 2:
+                raise ValueError('state change failed')
+            accepted[id(req)] = comment
+
+        orig_accept = Request.accept
+        Request.accept = accept
+        try:
+            results = Request.change_states(requests, 'accept', workers=3,
+                                            comment='thanks')
+        finally:
+            Request.accept = orig_accept
+        self.assertTrue(state['max_running'] >= 2)
+        self.assertTrue(len(threads) > 1)
+        self.assertEqual(len(results), 6)
+        for i, (request, error) in enumerate(results):
+            # the results are in the order of the requests
+            self.assertTrue(request is requests[i])
+            if i == 2:
+                self.assertTrue(isinstance(error, ValueError))
+                self.assertFalse(id(request) in accepted)
+            else:
+                self.assertTrue(error is None)
+                self.assertEqual(accepted[id(request)], 'thanks')
+
     @GET('http://localhost/request/120704', file='request3.xml')
     @POST(('http://localhost/request/120704?by_group=autobuild-team'
            '&cmd=changereviewstate&comment=Thanks&newstate=accepted'),
@@ -712,6 +819,14 @@ class TestRemoteModel(OscTest):
         f = RORemoteFile('/path/to/file', lazy_open=False)
         f.close()
 
+    @GET('http://localhost/source/project/package/fname2', file='remotefile2')
+    def test_remotefile8(self):
+        """store file asynchronously"""
+        f = RORemoteFile('/source/project/package/fname2')
+        sio = StringIO()
+        f.awrite_to(sio).result(5)
+        self.assertEqual(sio.getvalue(), 'yet another\nsimple\nfile\n')
+
     @GET('http://localhost/source/project/package/fname?rev=123',
          file='remotefile1', Content_Length='52')
     def test_rwremotefile1(self):
@@ -871,6 +986,27 @@ class TestRemoteModel(OscTest):
         # no write back is issued
         f.close(foo='bar')
 
+    @GET('http://localhost/source/project/package/large', text=LARGE_GZIP,
+         Content_Encoding='gzip', Content_Length=str(len(LARGE_GZIP)))
+    @GET('http://localhost/source/project/package/large', text=LARGE_GZIP,
+         Content_Encoding='gzip', Content_Length=str(len(LARGE_GZIP)))
+    def test_rwremotefile12(self):
+        """read a large gzip encoded file (tmpfile)"""
+        # the encoded file is smaller than the default tmp_size
+        self.assertTrue(len(LARGE_GZIP) < 8096)
+        f = RORemoteFile('/source/project/package/large')
+        self.assertEqual(f.read(), LARGE)
+        self.assertEqual(f._fobj.encoded_length, len(LARGE_GZIP))
+        self.assertEqual(f._remote_size, -1)
+        f = RWRemoteFile('/source/project/package/large')
+        self.assertEqual(f.read(11), 'large file\n')
+        # the decoded size is unknown, so a tmpfile is used
+        self.assertTrue(os.path.exists(f._fobj.name))
+        f.seek(0, os.SEEK_END)
+        self.assertEqual(f.tell(), len(LARGE))
+        f.close()
+        self.assertFalse(os.path.exists(f._fobj.name))
+
     @PUT('http://localhost/foo/bar?foo=bar', text='ok',
          exp='some data')
     def test_rwlocalfile1(self):
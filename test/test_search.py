@@ -2,7 +2,7 @@ import unittest
 
 from lxml import etree
 
-from osc2.search import find_request, RequestCollection
+from osc2.search import find_request, RequestCollection, RequestQuery
 from osc2.util.xpath import XPathBuilder
 from test.osctest import OscTest
 from test.httptest import GET
@@ -85,5 +85,49 @@ class TestSearch(OscTest):
         xp = xpb.state[xpb.attr('name') == 'declined']
         self.assertRaises(etree.DocumentInvalid, find_request, xp)
 
+    def test_request_query1(self):
+        """test the xpath of a RequestQuery"""
+        query = RequestQuery(states=['new', 'review', 'new'], who='foo',
+                             project='prj', package='pkg', types=['submit'])
+        query.review(['new'], by_group='grp', by_user=None)
+        query.review(['new'], by_group='grp')
+        exp = ('(state/@name = "new" or state/@name = "review") and '
+               'action/@type = "submit" and '
+               '(state/@who = "foo" or history/@who = "foo") and '
+               '(action/target/@project = "prj" or '
+               'action/source/@project = "prj") and '
+               '(action/target/@package = "pkg" or '
+               'action/source/@package = "pkg") and '
+               'review[@by_group = "grp" and @state = "new"]')
+        self.assertEqual(query.xpath().tostring(), exp)
+        self.assertEqual(query.params(), {})
+
+    def test_request_query2(self):
+        """test a RequestQuery with multiple review filters"""
+        query = RequestQuery(states=['review'], project='prj', source=False,
+                             full_history=True)
+        query.review(['new', 'declined'], by_user='foo')
+        query.review(['new', 'declined'], by_project='x', by_package='y')
+        query.review()
+        exp = ('state/@name = "review" and action/target/@project = "prj" '
+               'and (review[@by_user = "foo" and (@state = "new" or '
+               '@state = "declined")] or review[@by_package = "y" and '
+               '@by_project = "x" and (@state = "new" or '
+               '@state = "declined")] or review)')
+        self.assertEqual(query.xpath().tostring(), exp)
+        self.assertEqual(query.params(), {'withfullhistory': '1'})
+
+    @GET(('http://localhost/search/request?match='
+          'state%2F%40name+%3D+%22new%22&withhistory=1'),
+         file='collection_request2.xml')
+    def test_request_query3(self):
+        """test RequestQuery.find"""
+        query = RequestQuery(states=['new'], history=True)
+        requests = query.find()
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(requests[0].action.get('type'), 'submit')
+        # no filters
+        self.assertRaises(ValueError, RequestQuery().find)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,11 +1,14 @@
 import os
 import mmap
+import hashlib
 import unittest
 # use StringIO instead of cStringIO because seek will be overridden
 from StringIO import StringIO
 
 from osc2.util.cpio import (FileWrapper, NewAsciiReader, CpioError,
-                            NewAsciiWriter, CpioArchive, cpio_open)
+                            NewAsciiWriter, CpioArchive, cpio_open,
+                            ExtractListener, PipelinedNewAsciiWriter,
+                            NewAsciiFormat, NewCrcReader)
 from test.osctest import OscTest
 
 
@@ -16,6 +19,22 @@ def suite():
 # it is not a good idea to hardcode uid and gid in a fixture
 # file if the testcases are executed in a different env...
 # the methods below are needed for copyin testcases
+class EL(ExtractListener):
+    def __init__(self):
+        self.extracted_files = []
+
+    def extracted(self, hdr, filename):
+        self.extracted_files.append((hdr.name, filename))
+
+
+def append_entry(archive_writer, name, mode, data=''):
+    """Appends an entry with an arbitrary mode to the archive."""
+    st = archive_writer._create_dummy_stat(0, mode, 0, 0, 1, os.geteuid(),
+                                           os.getegid(), len(data), 42)
+    hdr = archive_writer._create_header(st, name)
+    archive_writer._write_header(hdr, StringIO(data))
+
+
 def uid(exp_uid):
     """Returns the used uid.
 
@@ -801,5 +820,355 @@ class TestCpio(OscTest):
         f.seek(158, os.SEEK_SET)
         self.assertRaises(CpioError, archive_reader.next_header)
 
+    def test30(self):
+        """test CpioArchive's index (seekable archive)"""
+        fname = self.fixture_file('cpio_archive.cpio')
+        archive = CpioArchive(filename=fname)
+        self.assertTrue('file1' in archive)
+        self.assertFalse('unknown' in archive)
+        # the index is built by reading the headers only
+        self.assertEqual(sorted(archive._index.keys()),
+                         ['bar', 'file1', 'foo'])
+        self.assertEqual(archive['foo'].read(), 'file foo\n')
+        self.assertEqual(archive['bar'].read(), 'File bar\nhas some\n'
+                         'content...\n')
+        self.assertRaises(KeyError, archive.__getitem__, 'unknown')
+        self.assertEqual(archive.filenames(), ['bar', 'file1', 'foo'])
+
+    def test31(self):
+        """test CpioArchive's index (build index while iterating)"""
+        fname = self.fixture_file('cpio_archive.cpio')
+        archive = CpioArchive(filename=fname)
+        filenames = []
+        for archive_file in archive:
+            filenames.append(archive_file.hdr.name)
+            self.assertTrue('foo' in archive)
+        self.assertEqual(filenames, ['bar', 'file1', 'foo'])
+
+    def test32(self):
+        """test CpioArchive's index (sidecar index file)"""
+        fname = self.fixture_file('cpio_archive.cpio')
+        index_file = self.fixture_file('cpio_archive.idx')
+        self.assertFalse(os.path.exists(index_file))
+        with cpio_open(fname, index_file=index_file) as archive:
+            self.assertEqual(archive['file1'].read(4), 'This')
+        self.assertTrue(os.path.exists(index_file))
+        with cpio_open(fname, index_file=index_file) as archive:
+            # no header has to be read (only the magic)
+            self.assertEqual(archive._fobj.tell(), 6)
+            self.assertEqual(len(archive._files), 3)
+            archive_file = archive.find('file1')
+            self.assertEqual(archive_file.hdr.mode, 33188)
+            self.assertEqual(archive_file.hdr.filesize, 26)
+            self.assertEqual(archive_file.read(), 'This is yet\nanother\n'
+                             'file.\n')
+            self.assertEqual(archive.filenames(), ['bar', 'file1', 'foo'])
+        # a corrupt index file is ignored (and rewritten)
+        with open(index_file, 'w') as f:
+            f.write('corrupt')
+        with cpio_open(fname, index_file=index_file) as archive:
+            self.assertEqual(archive._files, [])
+            self.assertEqual(archive['foo'].read(), 'file foo\n')
+        with cpio_open(fname, index_file=index_file) as archive:
+            self.assertEqual(len(archive._files), 3)
+        # an index file requires a filename
+        self.assertRaises(ValueError, CpioArchive, fobj=open(fname, 'r'),
+                          index_file=index_file)
+
+    def test33(self):
+        """test FileWrapper's read_buffer method (mmap=True)"""
+        fname = self.fixture_file('filewrapper1.txt')
+        f = FileWrapper(filename=fname, use_mmap=True)
+        self.assertTrue(f.is_mmapped())
+        data = f.read_buffer(5)
+        # no copy of the mmap'ed data
+        self.assertTrue(isinstance(data, buffer))
+        self.assertEqual(str(data), 'This ')
+        self.assertEqual(f.tell(), 5)
+        self.assertEqual(str(f.read_buffer()), 'is a simple\ntext file.\n')
+        self.assertEqual(len(f.read_buffer()), 0)
+        self.assertEqual(f.tell(), 28)
+        # the peek'ed data is returned as a str
+        f.seek(0, os.SEEK_SET)
+        self.assertEqual(f.peek(2), 'Th')
+        self.assertEqual(f.read_buffer(4), 'This')
+        f.close()
+        # no mmap
+        f = FileWrapper(filename=fname)
+        self.assertFalse(f.is_mmapped())
+        self.assertEqual(f.read_buffer(4), 'This')
+        f.close()
+
+    def test34(self):
+        """test CpioFile's copyin method (mmap'ed archive)"""
+        dest = self.fixture_file('copyin')
+        os.mkdir(dest)
+        fname = self.fixture_file('cpio_archive.cpio')
+        with cpio_open(fname, use_mmap=True) as archive:
+            archive_file = archive.find('file1')
+            self.assertTrue(isinstance(archive_file.read_buffer(4), buffer))
+            archive_file.copyin(dest)
+            archive_file = archive.find('bar')
+            archive_file.copyin(dest)
+            sio = StringIO()
+            archive.find('foo').copyin(sio)
+            self.assertEqual(sio.getvalue(), 'file foo\n')
+        # only the remaining data is copied
+        fname = self.fixture_file('copyin', 'file1')
+        self.assertEqualFile(' is yet\nanother\nfile.\n', fname)
+        fname = self.fixture_file('copyin', 'bar')
+        self.assertEqualFile('File bar\nhas some\ncontent...\n', fname)
+        self.assertEqual(os.stat(fname).st_mode, 33188)
+
+    def _check_extracted(self, dest, el):
+        """Checks the files that were extracted to dest"""
+        contents = {'bar': 'File bar\nhas some\ncontent...\n',
+                    'file1': 'This is yet\nanother\nfile.\n',
+                    'foo': 'file foo\n'}
+        self.assertEqual(sorted(el.extracted_files),
+                         [(name, os.path.join(dest, name))
+                          for name in sorted(contents.keys())])
+        for name, data in contents.iteritems():
+            fname = os.path.join(dest, name)
+            self.assertEqualFile(data, fname)
+            st = os.stat(fname)
+            self.assertEqual(st.st_mode, 33188)
+        self.assertEqual(os.stat(os.path.join(dest, 'foo')).st_mtime,
+                         1340493596)
+
+    def test35(self):
+        """test CpioArchive's extractall method"""
+        fname = self.fixture_file('cpio_archive.cpio')
+        for kwargs in ({}, {'workers': 4}, {'workers': 2, 'use_mmap': True}):
+            dest = self.fixture_file('extract%d' % len(kwargs))
+            os.mkdir(dest)
+            el = EL()
+            workers = kwargs.pop('workers', 1)
+            with cpio_open(fname, **kwargs) as archive:
+                archive.extractall(dest, workers=workers, listener=[el])
+            self._check_extracted(dest, el)
+        # unseekable archive (workers are not used)
+        dest = self.fixture_file('extract_unseekable')
+        os.mkdir(dest)
+        sio = StringIO(open(fname, 'r').read())
+        sio.seek = None
+        el = EL()
+        CpioArchive(fobj=sio).extractall(dest, workers=4, listener=[el])
+        self._check_extracted(dest, el)
+
+    def test36(self):
+        """test CpioArchive's extractall method (errors)"""
+        fname = self.fixture_file('cpio_archive.cpio')
+        with cpio_open(fname) as archive:
+            self.assertRaises(ValueError, archive.extractall, fname)
+            dest = self.fixture_file('extract')
+            os.mkdir(dest)
+            # a directory cannot be overwritten
+            os.mkdir(os.path.join(dest, 'file1'))
+            self.assertRaises(ValueError, archive.extractall, dest,
+                              workers=2)
+
+    def test37(self):
+        """test PipelinedNewAsciiWriter (identical to test22)"""
+        f = StringIO()
+        # a small bufsize in order to test the buffering
+        archive_writer = PipelinedNewAsciiWriter(f, bufsize=512,
+                                                 readahead=1, digest='md5')
+        sio = StringIO('This is a small\ntest file.\n')
+        archive_writer.append('test1', fobj=sio)
+        sio = StringIO('Yet another\ntest file.\n')
+        archive_writer.append('test2', fobj=sio)
+        sio = StringIO('The last test file.\n')
+        archive_writer.append('last_file', fobj=sio)
+        archive_writer.copyout()
+        self.assertEqual(archive_writer._bytes_written, 1024)
+        fname = self.replace_uid_gid('new_ascii_writer_sio.cpio')
+        self.assertEqualFile(f.getvalue(), fname)
+        self.assertEqual(archive_writer.digests['test2'],
+                         hashlib.md5('Yet another\ntest file.\n').hexdigest())
+        self.assertEqual(len(archive_writer.digests), 3)
+
+    def test38(self):
+        """test PipelinedNewAsciiWriter (files)"""
+        fname = self.fixture_file('large')
+        data = os.urandom(3000)
+        with open(fname, 'w') as f:
+            f.write(data)
+        archive = self.fixture_file('archive.cpio')
+        with open(archive, 'w') as f:
+            archive_writer = PipelinedNewAsciiWriter(f, bufsize=1024,
+                                                     digest='sha256')
+            archive_writer.append(self.fixture_file('foo'))
+            archive_writer.append(fname)
+            archive_writer.copyout()
+        self.assertEqual(os.path.getsize(archive) % 512, 0)
+        self.assertEqual(archive_writer.digests['large'],
+                         hashlib.sha256(data).hexdigest())
+        with cpio_open(archive) as archive:
+            self.assertEqual(archive.filenames(), ['foo', 'large'])
+            self.assertEqual(archive['foo'].read(), 'file foo\n')
+            self.assertEqual(archive['large'].read(), data)
+
+    def test39(self):
+        """test PipelinedNewAsciiWriter (errors)"""
+        sio = StringIO()
+        self.assertRaises(ValueError, PipelinedNewAsciiWriter, sio,
+                          bufsize=1000)
+        self.assertRaises(ValueError, PipelinedNewAsciiWriter, sio,
+                          digest='unknown')
+        archive_writer = PipelinedNewAsciiWriter(sio)
+        archive_writer.append(self.fixture_file('foo'))
+        archive_writer.append(self.fixture_file('nonexistent'))
+        self.assertRaises(IOError, archive_writer.copyout)
+        # the writer failed and refuses further work
+        self.assertRaises(IOError, archive_writer.append,
+                          self.fixture_file('foo'))
+        self.assertRaises(IOError, archive_writer.copyout)
+        # the error is also raised by the next append
+        sio = StringIO()
+        archive_writer = PipelinedNewAsciiWriter(sio)
+        archive_writer.append(self.fixture_file('nonexistent'))
+        # wait until the reader thread terminated (due to the error)
+        archive_writer._reader.join()
+        self.assertRaises(IOError, archive_writer.append,
+                          self.fixture_file('foo'))
+        self.assertRaises(IOError, archive_writer.copyout)
+        self.assertEqual(sio.getvalue(), '')
+
+    def test40(self):
+        """test NewCrcReader (070702 format)"""
+        fname = self.fixture_file('new_crc_reader.cpio')
+        with cpio_open(fname) as archive:
+            self.assertEqual(archive.magic, '070702')
+            self.assertTrue(isinstance(archive._reader, NewCrcReader))
+            self.assertEqual(archive.filenames(), ['bar', 'file1', 'foo'])
+            archive_file = archive.find('file1')
+            self.assertEqual(archive_file.hdr.chksum, 2275)
+            self.assertEqual(archive_file.read(4), 'This')
+            self.assertEqual(archive_file.read(), ' is yet\nanother\nfile.\n')
+            sio = StringIO()
+            archive.find('bar').copyin(sio)
+            self.assertEqual(sio.getvalue(), 'File bar\nhas some\ncontent...\n')
+
+    def test41(self):
+        """test NewCrcReader (checksum mismatch)"""
+        fname = self.fixture_file('new_crc_reader_corrupt.cpio')
+        dest = self.fixture_file('copyin')
+        os.mkdir(dest)
+        with cpio_open(fname, use_mmap=True) as archive:
+            archive.find('bar').copyin(dest)
+            self.assertTrue(os.path.isfile(os.path.join(dest, 'bar')))
+            self.assertRaises(CpioError, archive.find('file1').copyin, dest)
+            self.assertFalse(os.path.exists(os.path.join(dest, 'file1')))
+        with cpio_open(fname) as archive:
+            archive_file = archive.find('file1')
+            # the checksum is verified when the end of the file is reached
+            self.assertEqual(archive_file.read(4), 'This')
+            self.assertRaises(CpioError, archive_file.read)
+
+    def test42(self):
+        """test NewAsciiFormat's decode_header method"""
+        fname = self.fixture_file('new_ascii_reader1.cpio')
+        data = open(fname, 'r').read(NewAsciiFormat.LEN)
+        magic, fields = NewAsciiFormat.decode_header(data)
+        self.assertEqual(magic, '070701')
+        self.assertEqual(len(fields), 13)
+        self.assertEqual(fields[0], 1788112)
+        self.assertEqual(fields[1], 33188)
+        self.assertEqual(fields[5], 1340459653)
+        self.assertEqual(fields[11], 17)
+        data = data[:14] + 'XYZ' + data[17:]
+        self.assertRaises(CpioError, NewAsciiFormat.decode_header, data)
+        # a header with a different magic
+        f = FileWrapper(fobj=StringIO(data.replace('070701', '070702')))
+        self.assertRaises(CpioError, NewAsciiReader(f).next_header)
+
+    def test43(self):
+        """test CpioArchive's extractall method (malicious filenames)"""
+        dest = self.fixture_file('extract')
+        os.mkdir(dest)
+        for name in ('../evil', '/tmp/evil', 'foo/../../evil', '.'):
+            fname = self.fixture_file('malicious.cpio')
+            with open(fname, 'w') as f:
+                archive_writer = NewAsciiWriter(f)
+                archive_writer.append('good', fobj=StringIO('good'))
+                archive_writer.append(name, fobj=StringIO('evil'))
+                archive_writer.copyout()
+            for workers in (1, 2):
+                with cpio_open(fname) as archive:
+                    self.assertRaises(CpioError, archive.extractall, dest,
+                                      workers=workers)
+            self.assertFalse(os.path.exists(self.fixture_file('evil')))
+        self.assertFalse(os.path.exists('/tmp/evil'))
+        # all filenames are checked before anything is extracted
+        self.assertEqual(os.listdir(dest), [])
+
+    def test44(self):
+        """test CpioArchive's index (sidecar index after a full iteration)"""
+        fname = self.fixture_file('cpio_archive.cpio')
+        index_file = self.fixture_file('cpio_archive.idx')
+        with cpio_open(fname, index_file=index_file) as archive:
+            self.assertEqual(archive.filenames(), ['bar', 'file1', 'foo'])
+            self.assertFalse(os.path.exists(index_file))
+            self.assertEqual(archive['foo'].read(), 'file foo\n')
+        self.assertTrue(os.path.exists(index_file))
+        with cpio_open(fname, index_file=index_file) as archive:
+            self.assertEqual(len(archive._files), 3)
+            self.assertEqual(archive['file1'].read(4), 'This')
+
+    def test45(self):
+        """test CpioArchive's extractall method (dirs and nested files)"""
+        fname = self.fixture_file('nested.cpio')
+        with open(fname, 'w') as f:
+            archive_writer = NewAsciiWriter(f)
+            archive_writer.append('usr/bin/foo', fobj=StringIO('foo'))
+            append_entry(archive_writer, 'etc', 040555)
+            archive_writer.append('etc/bar', fobj=StringIO('bar'))
+            archive_writer.append('foo/../foobar', fobj=StringIO('foobar'))
+            archive_writer.copyout()
+        for workers in (1, 4):
+            dest = self.fixture_file('extract%d' % workers)
+            os.mkdir(dest)
+            el = EL()
+            with cpio_open(fname) as archive:
+                archive.extractall(dest, workers=workers, listener=[el])
+            self.assertEqual(len(el.extracted_files), 4)
+            for name, data in (('usr/bin/foo', 'foo'), ('etc/bar', 'bar'),
+                               ('foobar', 'foobar')):
+                with open(os.path.join(dest, name), 'r') as f:
+                    self.assertEqual(f.read(), data)
+            etc = os.path.join(dest, 'etc')
+            st = os.stat(etc)
+            self.assertEqual(st.st_mode & 07777, 0555)
+            self.assertEqual(st.st_mtime, 42)
+            self.assertEqual(sorted(os.listdir(dest)),
+                             ['etc', 'foobar', 'usr'])
+            # make it removable again
+            os.chmod(etc, 0755)
+
+    def test46(self):
+        """test CpioArchive's extractall method (unsupported file type)"""
+        fname = self.fixture_file('symlink.cpio')
+        with open(fname, 'w') as f:
+            archive_writer = NewAsciiWriter(f)
+            archive_writer.append('foo', fobj=StringIO('foo'))
+            append_entry(archive_writer, 'link', 0120777, '/etc/passwd')
+            archive_writer.copyout()
+        dest = self.fixture_file('extract')
+        os.mkdir(dest)
+        for workers in (1, 2):
+            with cpio_open(fname) as archive:
+                self.assertRaises(CpioError, archive.extractall, dest,
+                                  workers=workers)
+            self.assertEqual(os.listdir(dest), [])
+        # an unseekable archive is checked while it is extracted
+        with open(fname, 'r') as f:
+            data = f.read()
+        fobj = StringIO(data)
+        fobj.seek = None
+        with CpioArchive(fobj=fobj) as archive:
+            self.assertRaises(CpioError, archive.extractall, dest)
+        self.assertEqual(os.listdir(dest), ['foo'])
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,10 +1,11 @@
 import unittest
 import os
+import stat
 import sys
 import tempfile
 from cStringIO import StringIO
 
-from osc2.util.io import TemporaryDirectory, mkdtemp, mkstemp
+from osc2.util.io import TemporaryDirectory, mkdtemp, mkstemp, clone_file
 
 
 def suite():
@@ -289,5 +290,73 @@ class TestIO(unittest.TestCase):
                 self.assertEqual(f.read(), 'foobar')
         self.assertFalse(os.path.isfile(tmpfile))
 
+    def test_clone_file1(self):
+        """clone a file (no hardlink)"""
+        with mkdtemp(dir=self._tmpdir) as tmpdir:
+            source = os.path.join(tmpdir, 'source')
+            dest = os.path.join(tmpdir, 'dest')
+            with open(source, 'w') as f:
+                f.write('foobar')
+            strategy = clone_file(source, dest, mode=0600, mtime=42)
+            self.assertTrue(strategy in ('reflink', 'copy'))
+            with open(dest, 'r') as f:
+                self.assertEqual(f.read(), 'foobar')
+            st = os.stat(dest)
+            self.assertNotEqual(st.st_ino, os.stat(source).st_ino)
+            self.assertEqual(stat.S_IMODE(st.st_mode), 0600)
+            self.assertEqual(st.st_mtime, 42)
+            # an existing dest is overwritten
+            with open(source, 'w') as f:
+                f.write('new')
+            clone_file(source, dest)
+            with open(dest, 'r') as f:
+                self.assertEqual(f.read(), 'new')
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['dest', 'source'])
+
+    def test_clone_file2(self):
+        """clone a file (hardlink allowed)"""
+        with mkdtemp(dir=self._tmpdir) as tmpdir:
+            source = os.path.join(tmpdir, 'source')
+            dest = os.path.join(tmpdir, 'dest')
+            with open(source, 'w') as f:
+                f.write('foobar')
+            with open(dest, 'w') as f:
+                f.write('old')
+            strategy = clone_file(source, dest, hardlink=True)
+            self.assertTrue(strategy in ('reflink', 'hardlink'))
+            with open(dest, 'r') as f:
+                self.assertEqual(f.read(), 'foobar')
+            if strategy == 'hardlink':
+                self.assertEqual(os.stat(dest).st_ino,
+                                 os.stat(source).st_ino)
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['dest', 'source'])
+
+    def test_clone_file3(self):
+        """clone a file (invalid source or dest)"""
+        with mkdtemp(dir=self._tmpdir) as tmpdir:
+            source = os.path.join(tmpdir, 'source')
+            dest = os.path.join(tmpdir, 'dest')
+            self.assertRaises(ValueError, clone_file, source, dest)
+            with open(source, 'w') as f:
+                f.write('foobar')
+            dest = os.path.join(tmpdir, 'nonexistent', 'dest')
+            self.assertRaises(ValueError, clone_file, source, dest)
+            self.assertRaises(ValueError, clone_file, source, tmpdir)
+
+    def test_clone_file4(self):
+        """clone a file (dest without a dirname)"""
+        cwd = os.getcwd()
+        with mkdtemp(dir=self._tmpdir) as tmpdir:
+            os.chdir(tmpdir)
+            try:
+                with open('source', 'w') as f:
+                    f.write('foobar')
+                strategy = clone_file('source', 'dest', hardlink=True)
+                self.assertTrue(strategy in ('reflink', 'hardlink'))
+                with open('dest', 'r') as f:
+                    self.assertEqual(f.read(), 'foobar')
+            finally:
+                os.chdir(cwd)
+
 if __name__ == '__main__':
     unittest.main()
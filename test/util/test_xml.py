@@ -1,7 +1,11 @@
+import os
 import unittest
 from collections import Sequence
 
-from osc2.util.xml import fromstring
+from lxml import etree
+
+from osc2.util.xml import fromstring, get_schema, assert_valid
+from osc2.util.io import mkdtemp
 
 
 def suite():
@@ -86,5 +90,33 @@ class TestXML(unittest.TestCase):
         """iterfind is not overriden (the default does not support an xpath)"""
         self.assertRaises(SyntaxError, self.xml.iterfind, '//foo')
 
+    def test_schema_cache(self):
+        """compiled schemas are cached (until the file changes)"""
+        rng = ('<element name="root" '
+               'xmlns="http://relaxng.org/ns/structure/1.0">'
+               '<zeroOrMore><element name="foo"><empty/></element>'
+               '</zeroOrMore></element>')
+        with mkdtemp() as tmpdir:
+            filename = os.path.join(tmpdir, 'root.rng')
+            with open(filename, 'w') as f:
+                f.write(rng)
+            schema = get_schema(filename)
+            self.assertTrue(isinstance(schema, etree.RelaxNG))
+            self.assertTrue(get_schema(filename) is schema)
+            assert_valid(etree.fromstring('<root><foo/></root>'), filename)
+            self.assertRaises(etree.DocumentInvalid, assert_valid,
+                              etree.fromstring('<root><bar/></root>'),
+                              filename)
+            # a modified schema file is compiled again
+            with open(filename, 'w') as f:
+                f.write(rng.replace('foo', 'bar'))
+            st = os.stat(filename)
+            os.utime(filename, (st.st_atime, st.st_mtime + 10))
+            self.assertFalse(get_schema(filename) is schema)
+            assert_valid(etree.fromstring('<root><bar/></root>'), filename)
+            filename = os.path.join(tmpdir, 'root.dtd')
+            open(filename, 'w').close()
+            self.assertRaises(ValueError, get_schema, filename)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,10 @@
 import os
 import unittest
 
-from osc2.util.xpath import XPathBuilder, XPathSyntaxError, Tree
+from lxml import etree
+
+from osc2.util.xpath import (XPathBuilder, XPathSyntaxError, Tree,
+                             compile_xpath)
 from test.osctest import OscTest
 
 
@@ -621,5 +624,73 @@ class TestXPath(OscTest):
         exp = '/foo/bar[x/y or z]'
         self.assertEqual(xp.tostring(), exp)
 
+    def test_variable1(self):
+        """test a variable reference"""
+        xpb = XPathBuilder()
+        xp = xpb.foo.bar[xpb.attr('name') == xpb.var('name')]
+        exp = '/foo/bar[@name = $name]'
+        self.assertEqual(xp.tostring(), exp)
+
+    def test_compile1(self):
+        """test compiled and cached xpaths"""
+        root = etree.fromstring('<foo><bar name="x\'y"/><bar name="z"/>'
+                                '</foo>')
+        xpb = XPathBuilder()
+        xp = xpb.descendant('bar')[xpb.attr('name') == xpb.var('name')]
+        compiled = xp.compile()
+        self.assertTrue(isinstance(compiled, etree.XPath))
+        elms = compiled(root, name='x\'y')
+        self.assertEqual(len(elms), 1)
+        self.assertEqual(elms[0].get('name'), 'x\'y')
+        self.assertEqual(compiled(root, name='a'), [])
+        # an expression with the same structure reuses the compiled xpath
+        xpb = XPathBuilder()
+        xp = xpb.descendant('bar')[xpb.attr('name') == xpb.var('name')]
+        self.assertTrue(compile_xpath(xp) is compiled)
+        self.assertTrue(compile_xpath(xp.tostring()) is compiled)
+        self.assertEqual(len(compiled(root, name='z')), 1)
+
+    def test_nary1(self):
+        """test a wide or/and chain"""
+        xpb = XPathBuilder()
+        terms = [xpb.attr('name') == name for name in ('foo', 'bar', 'baz')]
+        xp = xpb.log_or(*terms)
+        exp = '@name = "foo" or @name = "bar" or @name = "baz"'
+        self.assertEqual(xp.tostring(), exp)
+        # same result as a chain of binary expressions
+        chain = xpb.dummy()
+        for name in ('foo', 'bar', 'baz'):
+            chain = chain | (xpb.attr('name') == name)
+        self.assertEqual(chain.tostring(), exp)
+        xp = xpb.foo[xpb.log_and(xpb.attr('a') == 'x', xpb.dummy(),
+                                 xp.parenthesize())]
+        exp = ('/foo[@a = "x" and (@name = "foo" or @name = "bar" or '
+               '@name = "baz")]')
+        self.assertEqual(xp.tostring(), exp)
+
+    def test_nary2(self):
+        """test log_or/log_and with dummies and a single expression"""
+        xpb = XPathBuilder()
+        self.assertFalse(xpb.log_or())
+        self.assertFalse(xpb.log_and(xpb.dummy(), xpb.dummy()))
+        xp = xpb.log_or(xpb.dummy(), xpb.foo)
+        self.assertEqual(xp.tostring(), '/foo')
+
+    def test_nary3(self):
+        """test a chain with many terms"""
+        xpb = XPathBuilder()
+        terms = [xpb.attr('by_user') == "user%d" % i for i in xrange(5000)]
+        xp = xpb.review[xpb.log_or(*terms)]
+        res = xp.tostring()
+        self.assertTrue(res.startswith('/review[@by_user = "user0" or '))
+        self.assertTrue(res.endswith(' or @by_user = "user4999"]'))
+
+    def test_slots1(self):
+        """test that expressions have no instance dict"""
+        xpb = XPathBuilder()
+        xp = xpb.foo[xpb.attr('name') == 'bar'] | xpb.bar.text()
+        self.assertFalse(hasattr(xp, '__dict__'))
+        self.assertFalse(hasattr(xpb.attr('name'), '__dict__'))
+
 if __name__ == '__main__':
     unittest.main()
@@ -10,7 +10,9 @@ from osc2.wc.base import (TransactionListener, FileConflictError,
 from osc2.wc.package import (Package, FileSkipHandler, PackageUpdateState,
                              FileUpdateInfo, file_md5, is_binaryfile,
                              FileCommitPolicy, UnifiedDiff, Diff)
-from osc2.wc.util import WCInconsistentError, WCFormatVersionError
+from osc2.wc.util import (WCInconsistentError, WCFormatVersionError,
+                          wc_has_valid_fingerprint, BinaryFileTracker)
+from osc2.wc.convert import convert_package_store
 from osc2.source import Package as SourcePackage
 from osc2.util.io import mkdtemp
 from test.osctest import OscTest
@@ -156,6 +158,35 @@ class TestPackage(OscTest):
         self.assertEqual(pkg.name, 'foo')
         self.assertEqual(pkg.apiurl, 'http://localhost')
 
+    def test_fingerprint1(self):
+        """fingerprint is written after a full check"""
+        path = self.fixture_file('foo')
+        self._not_exists(path, '_fingerprint', store=True)
+        self.assertFalse(wc_has_valid_fingerprint(path, '_files'))
+        Package(path)
+        self._exists(path, '_fingerprint', store=True)
+        self.assertTrue(wc_has_valid_fingerprint(path, '_files'))
+        # the fingerprint mismatches if a storefile is removed
+        os.unlink(os.path.join(path, '.osc', 'data', 'file'))
+        self.assertFalse(wc_has_valid_fingerprint(path, '_files'))
+        self.assertRaises(WCInconsistentError, Package, path)
+
+    def test_fingerprint2(self):
+        """fingerprint mismatches if _files was modified"""
+        path = self.fixture_file('foo')
+        pkg = Package(path)
+        self.assertTrue(wc_has_valid_fingerprint(path, '_files'))
+        with open(os.path.join(path, 'newfile'), 'w') as f:
+            f.write('new\n')
+        pkg.add('newfile')
+        self.assertFalse(wc_has_valid_fingerprint(path, '_files'))
+        # a full check is done and the fingerprint is refreshed
+        pkg = Package(path)
+        self.assertEqual(pkg.status('newfile'), 'A')
+        self.assertTrue(wc_has_valid_fingerprint(path, '_files'))
+        # full_check forces a full check
+        self.assertEqual(Package(path, full_check=True).status('file'), ' ')
+
     def test9(self):
         """test status"""
         path = self.fixture_file('status1')
@@ -1753,5 +1784,152 @@ class TestPackage(OscTest):
         self.assertEqual(Package.wc_check(path), ([], '', []))
         self._exists(path, '.osc')
 
+    def test_compact_store1(self):
+        """test compact store (convert and convert back)"""
+        path = self.fixture_file('status1')
+        files = Package(path).files()
+        convert_package_store(path)
+        self._exists(path, '_files.bin', store=True)
+        self._not_exists(path, '_files', store=True)
+        with open(os.path.join(path, '.osc', '_version'), 'r') as f:
+            self.assertEqual(f.read(), '3.0\n')
+        pkg = Package(path)
+        self.assertTrue(isinstance(pkg._files, BinaryFileTracker))
+        self.assertEqual(pkg.files(), files)
+        self.assertEqual(pkg.status('file1'), ' ')
+        self.assertEqual(pkg.status('added'), 'A')
+        self.assertEqual(pkg.status('delete'), 'D')
+        self.assertEqual(pkg.status('missing'), '!')
+        self.assertEqual(pkg.status('modified'), 'M')
+        self.assertEqual(pkg.status('skipped'), 'S')
+        self.assertEqual(pkg.status('conflict'), 'C')
+        self.assertEqual(pkg.status('unknown'), '?')
+        self.assertFalse(pkg.is_link())
+        self.assertEqual(pkg._files.revision_data(),
+                         {'rev': '72',
+                          'srcmd5': 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'})
+        pkg.resolved('conflict')
+        pkg.add('unknown')
+        pkg.revert('modified')
+        pkg = Package(path)
+        self.assertEqual(pkg.status('unknown'), 'A')
+        self.assertEqual(pkg.status('modified'), ' ')
+        # convert back to xml
+        convert_package_store(path, compact=False)
+        self._exists(path, '_files', store=True)
+        self._not_exists(path, '_files.bin', store=True)
+        pkg = Package(path)
+        self.assertFalse(isinstance(pkg._files, BinaryFileTracker))
+        self.assertEqual(pkg.files(), files + ['unknown'])
+        self.assertEqual(pkg.status('unknown'), 'A')
+        self.assertEqual(pkg.status('modified'), ' ')
+        self.assertEqual(pkg.status('delete'), 'D')
+        entry = pkg._files.find('file1')
+        self.assertEqual(entry.get('md5'), '5ceaa7ed396ccb8e959c02753cb4bd18')
+        self.assertEqual(entry.get('mtime'), '1310908346')
+
+    def test_compact_store2(self):
+        """test compact store (corrupt _files.bin)"""
+        path = self.fixture_file('foo')
+        convert_package_store(path)
+        with open(os.path.join(path, '.osc', '_files.bin'), 'w') as f:
+            f.write('<directory/>')
+        self.assertRaises(WCInconsistentError, Package, path)
+
+    @GET('http://localhost/source/prj/inv_foo3?rev=latest',
+         file='inv_foo3_files.xml')
+    def test_compact_store3(self):
+        """test compact store (repair corrupt _files.bin)"""
+        path = self.fixture_file('inv_foo3')
+        storedir = os.path.join(path, '.osc')
+        # the (corrupt) xml _files file is a stale leftover
+        with open(os.path.join(storedir, '_version'), 'w') as f:
+            f.write('3.0\n')
+        with open(os.path.join(storedir, '_files.bin'), 'w') as f:
+            f.write('corrupt')
+        self.assertRaises(WCInconsistentError, Package, path)
+        Package.repair(path)
+        self.assertEqual(Package.wc_check(path), ([], '', []))
+        self._not_exists(path, '_files', store=True)
+        with open(os.path.join(storedir, '_version'), 'r') as f:
+            self.assertEqual(f.read(), '3.0\n')
+        pkg = Package(path)
+        self.assertTrue(isinstance(pkg._files, BinaryFileTracker))
+        self.assertEqual(pkg.files(), ['file'])
+
+    def test_compact_store4(self):
+        """test compact store (repair missing _version)"""
+        path = self.fixture_file('foo')
+        convert_package_store(path)
+        os.unlink(os.path.join(path, '.osc', '_version'))
+        self.assertRaises(WCInconsistentError, Package, path,
+                          verify_format=False)
+        Package.repair(path)
+        self.assertEqual(Package.wc_check(path), ([], '', []))
+        self._not_exists(path, '_files', store=True)
+        pkg = Package(path)
+        self.assertTrue(isinstance(pkg._files, BinaryFileTracker))
+
+    @GET('http://localhost/source/prj/update_1?rev=latest',
+         file='update_1_files.xml')
+    @GET(('http://localhost/source/prj/update_1/foo'
+          '?rev=aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'), file='update_1_foo')
+    def test_compact_store5(self):
+        """test compact store (update)"""
+        path = self.fixture_file('update_1')
+        convert_package_store(path)
+        pkg = Package(path)
+        pkg.update()
+        self._check_md5(path, 'foo', '50747782d12074c2c04ba7f90bf264c9')
+        self._check_md5(path, 'foo', '50747782d12074c2c04ba7f90bf264c9',
+                        data=True)
+        self._not_exists(path, 'foobar')
+        self._not_exists(path, 'foobar', data=True)
+        self._not_exists(path, '_transaction', store=True)
+        pkg = Package(path)
+        self.assertTrue(isinstance(pkg._files, BinaryFileTracker))
+        self.assertEqual(pkg.status('foo'), ' ')
+        self.assertEqual(pkg.status('bar'), ' ')
+        self.assertEqual(pkg.status('foobar'), '?')
+
+    @GET('http://apiurl/source/prj/update_2?rev=latest',
+         file='commit_1_latest.xml')
+    @POST('http://apiurl/source/prj/update_2?cmd=commitfilelist',
+          exp_content_type='application/xml', expfile='commit_1_lfiles.xml',
+          file='commit_1_mfiles.xml')
+    @PUT('http://apiurl/source/prj/update_2/foo?rev=repository',
+         expfile='commit_1_foo', text=UPLOAD_REV)
+    @POST('http://apiurl/source/prj/update_2?cmd=commitfilelist',
+          exp_content_type='application/xml', expfile='commit_1_lfiles.xml',
+          file='commit_1_files.xml')
+    def test_compact_store6(self):
+        """test compact store (commit)"""
+        path = self.fixture_file('update_2')
+        convert_package_store(path)
+        pkg = Package(path)
+        self.assertEqual(pkg.status('foo'), 'M')
+        pkg.commit()
+        self._check_md5(path, 'foo', '90aa8a29ecd8d33e7b099c0f108c026b',
+                        data=True)
+        pkg = Package(path)
+        self.assertEqual(pkg.status('foo'), ' ')
+        self.assertEqual(pkg.status('bar'), ' ')
+        self.assertEqual(pkg.status('foobar'), ' ')
+
+    def test_compact_store7(self):
+        """test compact store (tracker interface)"""
+        path = self.fixture_file('commit_12')
+        convert_package_store(path)
+        pkg = Package(path)
+        self.assertTrue(isinstance(pkg._files, BinaryFileTracker))
+        self.assertTrue(pkg.is_link())
+        self.assertTrue(pkg.is_expanded())
+        names = [entry.get('name') for entry in pkg._files.findall('entry')]
+        self.assertEqual(names, pkg.files())
+        self.assertEqual(list(pkg._files.xpath('entry/@name')), names)
+        self.assertEqual(len(list(pkg._files.iterfind('linkinfo'))), 1)
+        self.assertEqual(pkg._files.get('name'), 'update_11')
+        self.assertRaises(AttributeError, getattr, pkg._files, 'append')
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,11 +1,14 @@
 import os
 import unittest
 import shutil
+import sqlite3
 
 from osc2.wc.base import (FileConflictError, TransactionListener,
                           UpdateStateMixin)
 from osc2.wc.project import Project, ProjectUpdateState
-from osc2.wc.util import WCInconsistentError
+from osc2.wc.util import (WCInconsistentError, SqlitePackageTracker,
+                          BinaryFileTracker)
+from osc2.wc.convert import convert_project_store
 from osc2.util.io import mkdtemp
 from test.osctest import OscTest
 from test.httptest import GET, PUT, POST, DELETE
@@ -980,5 +983,119 @@ class TestProject(OscTest):
         self.assertEqual(prj._status('deleted'), ' ')
         self.assertEqual(prj._status('xxx'), ' ')
 
+    def test_compact_store1(self):
+        """test compact store (convert and convert back)"""
+        path = self.fixture_file('prj2')
+        packages = Project(path).packages()
+        convert_project_store(path)
+        self._exists(path, '_packages.db', store=True)
+        self._not_exists(path, '_packages', store=True)
+        prj = Project(path)
+        self.assertTrue(isinstance(prj._packages, SqlitePackageTracker))
+        self.assertEqual(prj.packages(), packages)
+        self.assertEqual(prj._status('foo'), ' ')
+        self.assertEqual(prj._status('bar'), 'A')
+        self.assertEqual(prj._status('abc'), 'D')
+        self.assertEqual(prj._status('xxx'), '!')
+        self.assertEqual(prj._status('unknown'), '?')
+        # the package stores are converted as well
+        pkg = prj.package('foo')
+        self.assertTrue(isinstance(pkg._files, BinaryFileTracker))
+        prj.revert('abc')
+        prj = Project(path)
+        self.assertEqual(prj._status('abc'), ' ')
+        # convert back to xml
+        convert_project_store(path, compact=False)
+        self._exists(path, '_packages', store=True)
+        self._not_exists(path, '_packages.db', store=True)
+        prj = Project(path)
+        self.assertFalse(isinstance(prj._packages, SqlitePackageTracker))
+        self.assertEqual(prj.packages(), packages)
+        self.assertEqual(prj._status('abc'), ' ')
+        self.assertEqual(prj._status('bar'), 'A')
+        pkg = prj.package('foo')
+        self.assertFalse(isinstance(pkg._files, BinaryFileTracker))
+
+    def test_compact_store2(self):
+        """test compact store (corrupt database)"""
+        path = self.fixture_file('prj2')
+        convert_project_store(path)
+        with open(os.path.join(path, '.osc', '_packages.db'), 'w') as f:
+            f.write('corrupt')
+        self.assertRaises(WCInconsistentError, Project, path,
+                          full_check=True)
+
+    def test_compact_store3(self):
+        """test compact store (repair corrupt database)"""
+        path = self.fixture_file('prj2')
+        convert_project_store(path)
+        storedir = os.path.join(path, '.osc')
+        with open(os.path.join(storedir, '_version'), 'r') as f:
+            self.assertEqual(f.read(), '3.0\n')
+        with open(os.path.join(storedir, '_packages.db'), 'w') as f:
+            f.write('corrupt')
+        # a stale xml _packages file (for instance written by an
+        # older client)
+        with open(os.path.join(storedir, '_packages'), 'w') as f:
+            f.write('<packages/>')
+        Project.repair(path, no_packages=True, foo=' ', bar='A')
+        self._exists(path, '_packages.db', store=True)
+        self._not_exists(path, '_packages', store=True)
+        prj = Project(path)
+        self.assertTrue(isinstance(prj._packages, SqlitePackageTracker))
+        self.assertEqual(prj._status('foo'), ' ')
+        self.assertEqual(prj._status('bar'), 'A')
+
+    def test_compact_store4(self):
+        """test compact store (repair missing _version)"""
+        path = self.fixture_file('prj2')
+        convert_project_store(path)
+        os.unlink(os.path.join(path, '.osc', '_version'))
+        Project.repair(path, no_packages=True)
+        self._not_exists(path, '_packages', store=True)
+        prj = Project(path)
+        self.assertTrue(isinstance(prj._packages, SqlitePackageTracker))
+        self.assertEqual(prj._status('abc'), 'D')
+
+    @GET('http://localhost/source/prj2', file='prj2_list3.xml')
+    def test_compact_store5(self):
+        """test compact store (update: delete package)"""
+        path = self.fixture_file('prj2')
+        convert_project_store(path)
+        prj = Project(path)
+        self.assertEqual(prj._status('abc'), 'D')
+        prj.update('abc')
+        self.assertEqual(prj._status('abc'), '?')
+        self._not_exists(path, '.osc', 'data', 'abc')
+        prj = Project(path, full_check=True)
+        self.assertEqual(prj._status('abc'), '?')
+        self.assertEqual(prj._status('foo'), ' ')
+
+    def test_compact_store6(self):
+        """test compact store (modifications are committed immediately)"""
+        path = self.fixture_file('prj2')
+        convert_project_store(path)
+        db_filename = os.path.join(path, '.osc', '_packages.db')
+        with SqlitePackageTracker(path) as packages:
+            packages.add('new', 'A')
+            # the database is not locked (no pending transaction)
+            db = sqlite3.connect(db_filename, timeout=0)
+            try:
+                db.execute('UPDATE packages SET state = ? WHERE name = ?',
+                           ('D', 'foo'))
+                db.commit()
+            finally:
+                db.close()
+            self.assertEqual(packages.find('foo').get('state'), 'D')
+            self.assertRaises(ValueError, packages.remove, 'nonexistent')
+            self.assertRaises(ValueError, packages.add, 'new', ' ')
+        self.assertTrue(packages._conn is None)
+        # the closed tracker reopens the connection on demand
+        self.assertEqual(packages.find('new').get('state'), 'A')
+        packages.close()
+        with SqlitePackageTracker(path) as packages:
+            self.assertEqual(packages.find('new').get('state'), 'A')
+            self.assertEqual(packages.find('foo').get('state'), 'D')
+
 if __name__ == '__main__':
     unittest.main()
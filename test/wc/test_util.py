@@ -1,11 +1,13 @@
 import os
 import unittest
+import time
+import threading
 
 from test.osctest import OscTest
 from osc2.util.io import mkdtemp
 from osc2.wc.util import (WCFormatVersionError, wc_is_project, wc_is_package,
                           wc_read_project, wc_read_package, wc_read_apiurl,
-                          WCLock, wc_parent, wc_init)
+                          WCLock, wc_parent, wc_init, WCLockTimeoutError)
 
 
 def suite():
@@ -113,7 +115,8 @@ class TestWCUtil(OscTest):
         self.assertTrue(os.path.isfile(lock))
         wc.unlock()
         self.assertFalse(wc.has_lock())
-        self.assertFalse(os.path.exists(lock))
+        # the lock file is not removed
+        self.assertTrue(os.path.isfile(lock))
 
     def test20(self):
         """test WCLock class (unlock without lock)"""
@@ -132,7 +135,122 @@ class TestWCUtil(OscTest):
         # wc is still locked
         self.assertTrue(wc.has_lock())
         wc.unlock()
-        self.assertFalse(os.path.exists(lock))
+        self.assertFalse(wc.has_lock())
+
+    def _lock_in_child(self, path, shared):
+        """Lock path in a child process.
+
+        Return a (pid, fd) tuple. The child releases the lock
+        and exits if fd is closed.
+
+        """
+        ready_r, ready_w = os.pipe()
+        done_r, done_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # never return from the child (otherwise it would continue
+            # to run the testsuite)
+            status = 1
+            try:
+                os.close(ready_r)
+                os.close(done_w)
+                with WCLock(path, shared=shared):
+                    os.write(ready_w, 'x')
+                    os.read(done_r, 1)
+                status = 0
+            finally:
+                os._exit(status)
+        os.close(ready_w)
+        os.close(done_r)
+        os.read(ready_r, 1)
+        os.close(ready_r)
+        return pid, done_w
+
+    def _unlock_child(self, pid, fd):
+        os.close(fd)
+        os.waitpid(pid, 0)
+
+    def test_lock1(self):
+        """test WCLock class (exclusive lock excludes other locks)"""
+        path = self.fixture_file('lock')
+        pid, fd = self._lock_in_child(path, shared=False)
+        try:
+            wc = WCLock(path, timeout=0.1)
+            self.assertRaises(WCLockTimeoutError, wc.lock)
+            self.assertFalse(wc.has_lock())
+            wc = WCLock(path, shared=True, timeout=0.1)
+            self.assertRaises(WCLockTimeoutError, wc.lock)
+            self.assertFalse(wc.has_lock())
+        finally:
+            self._unlock_child(pid, fd)
+        wc = WCLock(path, timeout=0.1)
+        wc.lock()
+        self.assertTrue(wc.has_lock())
+        wc.unlock()
+
+    def test_lock2(self):
+        """test WCLock class (concurrent shared locks)"""
+        path = self.fixture_file('lock')
+        pid, fd = self._lock_in_child(path, shared=True)
+        try:
+            with WCLock(path, shared=True, timeout=0.1) as wc:
+                self.assertTrue(wc.has_lock())
+                self.assertTrue(wc.wait_time < 0.1)
+            wc = WCLock(path, timeout=0.1)
+            self.assertRaises(WCLockTimeoutError, wc.lock)
+        finally:
+            self._unlock_child(pid, fd)
+
+    def test_lock3(self):
+        """test WCLock class (wait for an exclusive lock)"""
+        path = self.fixture_file('lock')
+        pid, fd = self._lock_in_child(path, shared=False)
+        start = time.time()
+        os.close(fd)
+        with WCLock(path, timeout=5) as wc:
+            self.assertTrue(wc.has_lock())
+            self.assertTrue(wc.wait_time <= time.time() - start)
+        os.waitpid(pid, 0)
+
+    def _unlock_child_later(self, pid, fd, delay):
+        """Release the lock of the child after delay seconds."""
+        thread = threading.Timer(delay, self._unlock_child, (pid, fd))
+        thread.start()
+        return thread
+
+    def test_lock4(self):
+        """test WCLock class (shared lock waits for an exclusive lock)"""
+        path = self.fixture_file('lock')
+        pid, fd = self._lock_in_child(path, shared=False)
+        try:
+            start = time.time()
+            wc = WCLock(path, shared=True, timeout=0.3)
+            self.assertRaises(WCLockTimeoutError, wc.lock)
+            self.assertTrue(time.time() - start >= 0.3)
+            self.assertFalse(wc.has_lock())
+        except:
+            self._unlock_child(pid, fd)
+            raise
+        thread = self._unlock_child_later(pid, fd, 0.3)
+        try:
+            with WCLock(path, shared=True, timeout=5) as wc:
+                self.assertTrue(wc.has_lock())
+                self.assertTrue(wc.wait_time >= 0.2)
+        finally:
+            thread.join()
+
+    def test_lock5(self):
+        """test WCLock class (exclusive lock blocks on a shared lock)"""
+        path = self.fixture_file('lock')
+        pid, fd = self._lock_in_child(path, shared=True)
+        thread = self._unlock_child_later(pid, fd, 0.3)
+        try:
+            # no timeout: lock blocks until the child releases its lock
+            with WCLock(path) as wc:
+                self.assertTrue(wc.has_lock())
+                self.assertTrue(wc.wait_time >= 0.2)
+        finally:
+            thread.join()
 
     def test22(self):
         """test wc_parent (package)"""